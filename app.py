@@ -1,15 +1,36 @@
+import os
 import sys
-from flask import Flask, jsonify, request
+import json
+import hashlib
+import signal
+import threading
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from python import DataHandler, StrategyHandler, ExperimentHandler
-import mlflow
+from python import DataHandler, StrategyHandler, ExperimentHandler, JobHandler, EVENT_BROKER
+from python.profiling import PROFILE_SAMPLE_SIZE
+from python.store import USE_STORE
+from python.strategies.base import PREDICTION_CHUNK_SIZE
+from python.strategy import WARM_STRATEGIES
+from python.catalogue import DatasetCatalogue, PERSIST_DATASETS
 
 app = Flask(__name__)
 app_config = {"host": "0.0.0.0", "port": sys.argv[1]}
 
-data_handler = DataHandler()
+# Production server config, overridable through environment variables
+server_config = {
+  "server": os.environ.get("NEUROGEMS_SERVER", "waitress"),
+  "threads": int(os.environ.get("NEUROGEMS_SERVER_THREADS", 8)),
+  "job_workers": int(os.environ.get("NEUROGEMS_JOB_WORKERS", 1)),
+}
+
+data_handler = DataHandler(catalogue=DatasetCatalogue() if PERSIST_DATASETS else None)
 strategy_handler = StrategyHandler()
 experiment_handler = ExperimentHandler(strategy_handler)
+job_handler = JobHandler(max_workers=server_config["job_workers"])
+
+# Serialised catalogues of the supported strategies, models, validations and metrics
+catalogues = {}
+catalogues_lock = threading.Lock()
 
 """
 ---------------------- DEVELOPER MODE CONFIG -----------------------
@@ -18,6 +39,7 @@ experiment_handler = ExperimentHandler(strategy_handler)
 if "app.py" in sys.argv[0]:
   # Update app config
   app_config["debug"] = True
+  server_config["server"] = os.environ.get("NEUROGEMS_SERVER", "werkzeug")
 
   # CORS settings
   cors = CORS(
@@ -29,6 +51,23 @@ if "app.py" in sys.argv[0]:
   app.config["CORS_HEADERS"] = "Content-Type"
 
 
+"""
+---------------------------- HELPERS -------------------------------
+"""
+def catalogue_response(name, build):
+  """Returns a static catalogue, serialised into JSON bytes on first use, that clients can revalidate with ETags"""
+  with catalogues_lock:
+    if name not in catalogues:
+      body = json.dumps(build(), separators=(",", ":")).encode("utf-8")
+      catalogues[name] = (body, hashlib.sha1(body).hexdigest())
+  body, etag = catalogues[name]
+
+  response = app.response_class(body, mimetype="application/json")
+  response.set_etag(etag)
+  response.cache_control.no_cache = True
+  return response.make_conditional(request)
+
+
 """
 --------------------------- REST CALLS -----------------------------
 """
@@ -53,13 +92,24 @@ def add_dataset():
   time_column = request.args.get("time_column", None)
   return_information = request.args.get("return_information", False)
   return_profile = request.args.get("return_profile", False)
+  wait_profile = request.args.get("wait_profile", "false") == "true"
+  profile_sample_size = request.args.get("profile_sample_size", PROFILE_SAMPLE_SIZE, type=int)
+  profile_sampling = request.args.get("profile_sampling", "stratified")
+  columns = request.args.get("columns", None)
+  filters = request.args.get("filters", None)
+  use_store = request.args.get("use_store", str(USE_STORE)).lower() == "true"
+  streaming = request.args.get("streaming", None)
+  id_column = request.args.get("id_column", None)
 
   # Logging
   print(f"Adding Dataset... \nName: {name} \nPath: {path} \nTarget Column: {target_column} \nTime Column: {time_column}")
 
   # Add dataset
   try:
-    data_handler.add_dataset(name, path, target_column, time_column)
+    columns = columns.split(",") if columns else None
+    filters = json.loads(filters) if filters else None
+    streaming = streaming.lower() == "true" if streaming else None
+    data_handler.add_dataset(name, path, target_column, time_column, profile_sample_size, profile_sampling, columns, filters, use_store, streaming, id_column)
   except Exception as e:
     return jsonify(str(e))
 
@@ -68,7 +118,7 @@ def add_dataset():
   # Return dataset information
   if return_information:
     try:
-      return jsonify(data_handler.get_dataset_information(name, return_profile))
+      return jsonify(data_handler.get_dataset_information(name, return_profile, wait_profile))
     except Exception as e:
       return jsonify(str(e))
 
@@ -78,10 +128,20 @@ def get_datasets_information():
   """Returns a list containing information of all the datasets in the collection"""
   # Get arguments
   return_profile = request.args.get("return_profile", False)
+  wait_profile = request.args.get("wait_profile", "false") == "true"
 
   # Return datasets information
   try:
-    return jsonify(data_handler.get_datasets_information(return_profile))
+    return jsonify(data_handler.get_datasets_information(return_profile, wait_profile))
+  except Exception as e:
+    return jsonify(str(e))
+
+# Get datasets memory
+@app.route("/get-datasets-memory")
+def get_datasets_memory():
+  """Returns the memory budget and the resident and spilled size of each dataset"""
+  try:
+    return jsonify(data_handler.get_datasets_memory_information())
   except Exception as e:
     return jsonify(str(e))
 
@@ -107,13 +167,13 @@ def rm_dataset():
 @app.route("/get-supported-strategies")
 def get_supported_strategies():
   """Returns a list containing information of all the supported strategies"""
-  return jsonify(strategy_handler.get_supported_strategies_information())
+  return catalogue_response("strategies", strategy_handler.get_supported_strategies_information)
 
 # Get supported validation methods
 @app.route("/get-supported-validations")
 def get_supported_validations():
   """Returns a list containing information of all the supported validation methods"""
-  return jsonify(strategy_handler.get_supported_validations_information())
+  return catalogue_response("validations", strategy_handler.get_supported_validations_information)
 
 # Get saved strategies
 @app.route("/get-saved-strategies")
@@ -125,17 +185,14 @@ def get_saved_strategies():
 @app.route("/get-supported-metrics")
 def get_supported_metrics():
   """Returns a list containing information of all the supported metrics"""
-  return jsonify(experiment_handler.get_supported_metrics_information())
+  return catalogue_response("metrics", experiment_handler.get_supported_metrics_information)
 
 # Get supported models
 @app.route("/get-supported-models")
 def get_supported_models():
   """Returns a list containing information of all the supported models"""
-  # Get arguments
-  strategy_name = request.args.get("strategy_name")
-
-  # Return supported models
-  return jsonify(strategy_handler.get_supported_models_information(strategy_name))
+  # All the strategies support the same models, so the strategy_name argument is not needed
+  return catalogue_response("models", strategy_handler.get_supported_models_information)
 
 # Create strategy
 @app.route("/create-strategy")
@@ -162,7 +219,10 @@ def rm_strategy():
   strategy_name = request.args.get("strategy_name")
 
   # Remove strategy
-  strategy_handler.remove_strategy(strategy_name)
+  try:
+    strategy_handler.remove_strategy(strategy_name)
+  except Exception as e:
+    return jsonify(str(e))
 
   # Return success message
   return jsonify("Model deleted successfully!")
@@ -214,12 +274,95 @@ def train_strategy():
   validation_parameters = request_data["validation_parameters"]
   validation_parameters = {k: None if v == "None" else v for k, v in validation_parameters.items()}
 
-  # try:
-  training_results = strategy_handler.train_strategy(run_name, strategy_name, validation, validation_parameters)
-  # except Exception as e:
-  #   return jsonify(str(e)), 500
+  # Submit training job
+  try:
+    job_id = job_handler.submit_job("train_strategy", run_name, strategy_handler.train_strategy, run_name, strategy_name, validation, validation_parameters)
+  except Exception as e:
+    return jsonify(str(e)), 503
 
-  return jsonify(training_results)
+  # Return job id
+  return jsonify({"job_id": job_id})
+
+# Optimise strategy weights
+@app.route("/optimise-strategy-weights")
+def optimise_strategy_weights():
+  """Searches the voting weights of a late fusion strategy from its last training, without retraining"""
+  # Get arguments
+  strategy_name = request.args.get("strategy_name")
+  metric = request.args.get("metric", "accuracy_score")
+  voting_type = request.args.get("voting", None)
+  apply = request.args.get("apply", "false") == "true"
+
+  try:
+    return jsonify(strategy_handler.optimise_strategy_weights(strategy_name, metric, voting_type, apply))
+  except Exception as e:
+    return jsonify(str(e)), 400
+
+# Predict with a strategy
+@app.route("/predict-strategy", methods=["POST"])
+def predict_strategy():
+  """Predicts a batch of rows, or loaded datasets, with a trained strategy and streams the predictions as newline-delimited JSON, one chunk of rows per line"""
+  request_data = request.get_json()
+  strategy_name = request_data["strategy_name"]
+  rows = request_data.get("rows", None)
+  datasets = request_data.get("datasets", request_data.get("dataset_name", None))
+  chunk_size = int(request_data.get("chunk_size", PREDICTION_CHUNK_SIZE))
+  with_probability = bool(request_data.get("with_probability", False))
+
+  try:
+    chunks = strategy_handler.predict_strategy(strategy_name, rows, datasets, chunk_size, with_probability, data_handler)
+  except KeyError as e:
+    return jsonify(str(e)), 404
+  except Exception as e:
+    return jsonify(str(e)), 400
+
+  def stream():
+    try:
+      for chunk in chunks:
+        yield json.dumps(chunk) + "\n"
+    except Exception as e:
+      # The response has started, so errors are reported in the stream
+      yield json.dumps({"error": str(e)}) + "\n"
+
+  return Response(stream(), mimetype="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Save strategy
+@app.route("/save-strategy")
+def save_strategy():
+  """Saves a trained strategy, so that it can be loaded again or served after a restart"""
+  # Get arguments
+  strategy_name = request.args.get("strategy_name")
+
+  try:
+    strategy_handler.save_strategy(strategy_name)
+  except KeyError as e:
+    return jsonify(str(e)), 404
+  except Exception as e:
+    return jsonify(str(e)), 400
+
+  return jsonify("Strategy saved successfully!")
+
+# Load strategy
+@app.route("/load-strategy")
+def load_strategy():
+  """Loads a saved strategy, replacing the strategy with the same name"""
+  # Get arguments
+  strategy_name = request.args.get("strategy_name")
+
+  try:
+    strategy_handler.load_strategy(strategy_name, data_handler)
+  except KeyError as e:
+    return jsonify(str(e)), 404
+  except Exception as e:
+    return jsonify(str(e)), 400
+
+  return jsonify(strategy_handler.get_strategy_graph(strategy_name))
+
+# Get model cache stats
+@app.route("/get-model-cache-stats")
+def get_model_cache_stats():
+  """Returns the hit and miss counters, the size and the entries of the cache of the saved strategies served"""
+  return jsonify(strategy_handler.get_model_cache_stats())
 
 # Get strategy requirements
 @app.route("/get-strategy-requirements")
@@ -242,14 +385,14 @@ def run_experiment():
   experiment_parameters = request_data["parameters"]
   experiment_metrics = request_data["metrics"]
 
-  # Run experiment
+  # Submit experiment job
   try:
-    experiment_results = experiment_handler.run_experiment(experiment_name, experiment_type, experiment_parameters, experiment_metrics)
+    job_id = job_handler.submit_job("run_experiment", experiment_name, experiment_handler.run_experiment, experiment_name, experiment_type, experiment_parameters, experiment_metrics)
   except Exception as e:
-    return jsonify(str(e))
+    return jsonify(str(e)), 503
 
-  # Return experiment results
-  return jsonify(experiment_results)
+  # Return job id
+  return jsonify({"job_id": job_id})
 
 # Delete experiment run
 @app.route("/rm-run")
@@ -258,7 +401,7 @@ def rm_run():
   # Get arguments
   run_id = request.args.get("run_id")
   # Remove experiment
-  mlflow.delete_run(run_id)
+  experiment_handler.delete_run(run_id)
   # Return success message
   return jsonify("Experiment run deleted successfully!")
 
@@ -270,16 +413,140 @@ def get_experiment_runs():
   return jsonify(experiment_handler.get_experiment_runs())
 
 
+"""
+----------- JOBS ------------
+"""
+# Get jobs information
+@app.route("/get-jobs")
+def get_jobs():
+  """Returns a list containing information of all the submitted jobs"""
+  return jsonify(job_handler.get_jobs_information())
+
+# Get job status
+@app.route("/get-job-status")
+def get_job_status():
+  """Returns the status, progress and timings of a job"""
+  # Get arguments
+  job_id = request.args.get("job_id")
+
+  # Return job information
+  try:
+    return jsonify(job_handler.get_job_information(job_id))
+  except KeyError as e:
+    return jsonify(str(e)), 404
+
+# Get job results
+@app.route("/get-job-results")
+def get_job_results():
+  """Returns the results of a completed job"""
+  # Get arguments
+  job_id = request.args.get("job_id")
+
+  # Return job results
+  try:
+    return jsonify(job_handler.get_job_results(job_id))
+  except KeyError as e:
+    return jsonify(str(e)), 404
+  except Exception as e:
+    return jsonify(str(e)), 409
+
+# Cancel job
+@app.route("/cancel-job")
+def cancel_job():
+  """Cancels a queued or running job"""
+  # Get arguments
+  job_id = request.args.get("job_id")
+
+  # Cancel job
+  try:
+    return jsonify(job_handler.cancel_job(job_id))
+  except KeyError as e:
+    return jsonify(str(e)), 404
+
+# Stream training progress
+@app.route("/stream-progress")
+def stream_progress():
+  """Streams training progress events as Server-Sent Events"""
+  # Get arguments
+  job_id = request.args.get("job_id", None)
+  try:
+    buffer_size = int(request.args.get("buffer_size", 100))
+  except ValueError:
+    return jsonify("buffer_size must be an integer"), 400
+  if not 1 <= buffer_size <= 1000:
+    return jsonify("buffer_size must be between 1 and 1000"), 400
+  if job_id and job_id not in job_handler.jobs:
+    return jsonify("Job not found: " + job_id), 404
+
+  # Subscribe to the events of the job, or to all events
+  subscription = EVENT_BROKER.subscribe({"job_id": job_id} if job_id else None, buffer_size)
+
+  def stream():
+    try:
+      # The job may have finished before the client subscribed
+      if job_id and job_id in job_handler.jobs and job_handler.jobs[job_id].done:
+        yield f"event: job\ndata: {json.dumps(job_handler.get_job_information(job_id))}\n\n"
+        return
+      while True:
+        event = subscription.get(timeout=15)
+        if event is None:
+          if job_id and job_id not in job_handler.jobs:
+            # The job was removed, its final event will never come
+            break
+          # Keep the connection alive while there are no events
+          yield ": keep-alive\n\n"
+          continue
+        yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        if job_id and event["type"] == "job":
+          break
+    finally:
+      EVENT_BROKER.unsubscribe(subscription)
+
+  return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Remove job
+@app.route("/rm-job")
+def rm_job():
+  """Removes a finished job and its results"""
+  # Get arguments
+  job_id = request.args.get("job_id")
+
+  try:
+    job_handler.rm_job(job_id)
+  except Exception as e:
+    return jsonify(str(e))
+
+  # Return success message
+  return jsonify("Job removed successfully!")
+
+
 """
 -------------------------- APP SERVICES ----------------------------
 """
+def shutdown_server():
+  """Cancels the pending jobs and interrupts the server, which lets in-flight requests finish before exiting"""
+  job_handler.shutdown()
+  signal.raise_signal(signal.SIGINT)
+
 # Quits Flask on Electron exit
 @app.route("/quit")
 def quit():
-  shutdown = request.environ.get("werkzeug.server.shutdown")
-  shutdown()
+  # Shut down once this response has been sent
+  threading.Timer(0.5, shutdown_server).start()
 
-  return
+  return jsonify("Shutting down...")
 
 if __name__ == "__main__":
-  app.run(**app_config)
+  # Make sure /quit can interrupt the server, even if SIGINT was ignored by the parent process
+  signal.signal(signal.SIGINT, signal.default_int_handler)
+
+  # Load the strategies to serve into the model cache, without delaying the startup
+  if WARM_STRATEGIES:
+    threading.Thread(target=strategy_handler.warm_up, args=(WARM_STRATEGIES,), daemon=True).start()
+
+  if server_config["server"] == "waitress":
+    # Each open /stream-progress connection occupies one of the threads
+    from waitress import serve
+    serve(app, host=app_config["host"], port=app_config["port"], threads=server_config["threads"])
+  else:
+    app.run(**app_config, threaded=True)
@@ -0,0 +1,81 @@
+"""
+Compares the time and memory taken to load a synthetic CSV file with `pandas.read_csv`
+and with the Arrow reader used by `Dataset`, on the first load (types inferred, downcast
+and cached) and on a second load (cached types).
+
+Usage:
+    python benchmarks/csv_loading.py [--size-mb 1024] [--runs 3] [--path /tmp/synthetic.csv]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def generate_csv(path, size_mb, seed=0):
+    """Writes a CSV file of about `size_mb` megabytes with numeric, categorical and label columns."""
+    random = np.random.default_rng(seed)
+    target_size = size_mb * 1024 * 1024
+    n_rows = 200000
+    header = True
+
+    with open(path, "w") as file:
+        while file.tell() < target_size:
+            chunk = pd.DataFrame({
+                **{f"float_{i}": random.normal(size=n_rows).round(6) for i in range(8)},
+                **{f"int_{i}": random.integers(0, 1000, n_rows) for i in range(4)},
+                "category": random.choice(["alpha", "beta", "gamma", "delta"], n_rows),
+                "label": random.integers(0, 3, n_rows),
+            })
+            chunk.to_csv(file, index=False, header=header)
+            header = False
+
+
+def time_load(load, runs):
+    """Returns the median load time in seconds and the memory usage of the loaded DataFrame in MB."""
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        data = load()
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times), data.memory_usage(deep=True).sum() / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=1024, help="size of the synthetic CSV file")
+    parser.add_argument("--runs", type=int, default=3, help="number of timed loads per reader")
+    parser.add_argument("--path", default=None, help="where to write the CSV file, kept if given")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Keeps the schema cache of the benchmark out of the user cache
+        os.environ["NEUROGEMS_CACHE_DIR"] = os.path.join(directory, "cache")
+        sys.path.insert(0, ROOT)
+        from python.readers import read_csv
+
+        path = args.path or os.path.join(directory, "synthetic.csv")
+        print(f"Generating {args.size_mb} MB CSV at {path}...")
+        generate_csv(path, args.size_mb)
+        print(f"File size: {os.path.getsize(path) / 1024 / 1024:.0f} MB\n")
+
+        results = {
+            "pandas.read_csv": time_load(lambda: pd.read_csv(path), args.runs),
+            "arrow, first load": time_load(lambda: read_csv(path), 1),
+            "arrow, cached schema": time_load(lambda: read_csv(path), args.runs),
+        }
+
+        print(f"{'reader':<24}{'time (s)':>10}{'memory (MB)':>14}")
+        for reader, (load_time, memory) in results.items():
+            print(f"{reader:<24}{load_time:>10.2f}{memory:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Measures the startup time of the Flask backend, from spawning `app.py` to the first
+successful response of a catalogue endpoint, and the time taken to import the `python`
+package on its own.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--route get-supported-strategies]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_free_port():
+    """Returns a free TCP port on localhost."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_import():
+    """Returns the number of seconds taken to import the `python` package in a fresh interpreter."""
+    start_time = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import python"], cwd=ROOT, check=True)
+    return time.perf_counter() - start_time
+
+
+def time_first_request(route, timeout):
+    """Returns the number of seconds from spawning the backend to the first successful request."""
+    port = get_free_port()
+    env = {**os.environ, "NEUROGEMS_SERVER": "waitress"}
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "app.py", str(port)],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        while time.perf_counter() - start_time < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/{route}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start_time
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.01)
+        raise TimeoutError(f"No successful response from /{route} within {timeout} seconds")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="number of measurements")
+    parser.add_argument("--route", default="get-supported-strategies", help="route of the first request")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for the backend")
+    args = parser.parse_args()
+
+    import_times = [time_import() for _ in range(args.runs)]
+    request_times = [time_first_request(args.route, args.timeout) for _ in range(args.runs)]
+
+    print(f"{'measurement':<32}{'min (s)':>10}{'median (s)':>12}{'max (s)':>10}")
+    for name, times in [("import python", import_times), (f"first /{args.route}", request_times)]:
+        print(f"{name:<32}{min(times):>10.3f}{statistics.median(times):>12.3f}{max(times):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
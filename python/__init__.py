@@ -1,4 +1,6 @@
 from python.data import DataHandler
 from python.model import ModelHandler, MLModel
 from python.strategy import StrategyHandler
-from python.experiment import ExperimentHandler
\ No newline at end of file
+from python.experiment import ExperimentHandler
+from python.job import JobHandler
+from python.events import EVENT_BROKER
@@ -0,0 +1,529 @@
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+##########################################################################################
+
+CACHE_DIR = os.environ.get("NEUROGEMS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".neurogems", "cache"))
+PROFILE_CACHE_SIZE = int(os.environ.get("NEUROGEMS_PROFILE_CACHE_SIZE", 256)) * 1024 * 1024
+MODEL_CACHE_SIZE = int(os.environ.get("NEUROGEMS_MODEL_CACHE_SIZE", 2048)) * 1024 * 1024
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+# The file of a versioned directory naming its current version
+CURRENT_VERSION_FILE = "CURRENT"
+_versions_lock = threading.Lock()
+
+##########################################################################################
+
+def file_fingerprint(path: str, block_size: int = 1024 * 1024) -> str:
+    """
+    Returns a hash of the contents of a file. The hash is memoised on the path, size and
+    modification time of the file, so an unchanged file is only read once per process.
+
+    Parameters:
+    -----------
+    path: str
+        The path to the file.
+    block_size: int, default=1 MB
+        The number of bytes read at a time.
+
+    Returns:
+    --------
+    The hex digest of the file contents.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    fingerprint = _fingerprints.get(memo_key)
+    if fingerprint is not None:
+        return fingerprint
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    fingerprint = digest.hexdigest()
+
+    with _fingerprints_lock:
+        _fingerprints[memo_key] = fingerprint
+
+    return fingerprint
+
+
+def remember_fingerprint(path: str, size: int, mtime_ns: int, fingerprint: str) -> None:
+    """
+    Remembers the fingerprint of a file computed by a previous process, e.g. recorded in the
+    dataset catalogue, so that it is not hashed again while the file is unchanged.
+
+    Parameters:
+    -----------
+    path: str
+        The path to the file.
+    size: int
+        The size of the file when the fingerprint was computed.
+    mtime_ns: int
+        The modification time of the file, in nanoseconds, when the fingerprint was computed.
+    fingerprint: str
+        The fingerprint of the file.
+    """
+    with _fingerprints_lock:
+        _fingerprints[(os.path.abspath(path), size, mtime_ns)] = fingerprint
+
+
+def make_file_key(path: str, options: dict) -> str:
+    """
+    Returns a cache key for a file read or processed with the given options.
+
+    Parameters:
+    -----------
+    path: str
+        The path to the file.
+    options: dict
+        The JSON serialisable options.
+
+    Returns:
+    --------
+    The hex digest of the contents of the file and the options.
+    """
+    options = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.blake2b((file_fingerprint(path) + options).encode(), digest_size=16).hexdigest()
+
+
+def evict_least_recently_used(directory: str, suffix: str, max_size: int) -> None:
+    """
+    Removes the least recently used files of a cache directory, by modification time, until
+    their total size fits in `max_size` bytes. Files that cannot be removed, e.g. because
+    they are memory-mapped on Windows, are skipped.
+
+    Parameters:
+    -----------
+    directory: str
+        The cache directory.
+    suffix: str
+        The suffix of the cache files.
+    max_size: int
+        The maximum total size of the cache files, in bytes.
+    """
+    if not os.path.isdir(directory):
+        return
+
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(suffix):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, path in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            os.remove(path)
+            size -= entry_size
+        except OSError:
+            pass
+
+def get_object_size(value: Any) -> int:
+    """
+    Returns the approximate number of bytes of memory held by a loaded object: the size of
+    its pickle, in which the buffers of its arrays, including memory-mapped ones, are
+    counted by their size rather than copied.
+    """
+    buffers = []
+    size = len(pickle.dumps(value, protocol=5, buffer_callback=buffers.append))
+    return size + sum(memoryview(buffer).nbytes for buffer in buffers)
+
+
+def get_current_directory(path: str) -> str:
+    """
+    Returns the current version of a versioned directory written by `replace_directory`.
+    Other paths, e.g. directories saved before versioning, are returned as they are.
+
+    Parameters:
+    -----------
+    path: str
+        The versioned directory.
+
+    Raises:
+    -------
+    FileNotFoundError:
+        If nothing exists at the path.
+    """
+    try:
+        with open(os.path.join(path, CURRENT_VERSION_FILE), "r", encoding="utf-8") as file:
+            return os.path.join(path, file.read().strip())
+    except (FileNotFoundError, NotADirectoryError):
+        if not os.path.exists(path):
+            raise FileNotFoundError("Not found: " + path)
+        return path
+
+
+def _get_version_number(name: str) -> int:
+    try:
+        return int(name[1:].split(".")[0]) if name.startswith("v") else -1
+    except ValueError:
+        return -1
+
+
+def make_temporary_directory(path: str) -> str:
+    """
+    Creates a uniquely named directory next to a versioned directory, in which a new
+    version is written before `replace_directory` makes it current. Each save gets its own
+    directory, so concurrent saves of the same path do not write over each other.
+
+    Parameters:
+    -----------
+    path: str
+        The versioned directory.
+
+    Returns:
+    --------
+    The path of the temporary directory.
+    """
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return tempfile.mkdtemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+
+
+def replace_directory(temporary_path: str, path: str) -> None:
+    """
+    Makes a directory written next to a versioned directory its current version. The
+    directory is moved into the versioned directory under a new version, then the file
+    naming the current version is replaced atomically, so that readers see either the old
+    or the new version, never a missing one. The old versions are kept for the readers
+    still using them, until `remove_old_versions` is called.
+
+    Parameters:
+    -----------
+    temporary_path: str
+        The directory written.
+    path: str
+        The versioned directory.
+    """
+    with _versions_lock:
+        if os.path.isfile(path):
+            # A single file saved before versioning
+            os.remove(path)
+        os.makedirs(path, exist_ok=True)
+
+        version = "v" + str(time.time_ns()) + "." + str(os.getpid())
+        os.replace(temporary_path, os.path.join(path, version))
+
+        pointer_path = os.path.join(path, CURRENT_VERSION_FILE + "." + version + ".tmp")
+        with open(pointer_path, "w", encoding="utf-8") as file:
+            file.write(version)
+        os.replace(pointer_path, os.path.join(path, CURRENT_VERSION_FILE))
+
+
+def remove_old_versions(path: str) -> None:
+    """
+    Removes the versions of a versioned directory older than its current one, and the
+    files saved there before versioning. Files that cannot be removed, e.g. still
+    memory-mapped on Windows, are left for the next call.
+
+    Parameters:
+    -----------
+    path: str
+        The versioned directory.
+    """
+    current_path = get_current_directory(path)
+    if current_path == path:
+        return
+
+    current = os.path.basename(current_path)
+    current_number = _get_version_number(current)
+
+    for name in os.listdir(path):
+        if name == current or name.startswith(CURRENT_VERSION_FILE) or _get_version_number(name) > current_number:
+            # The newer versions are being written by concurrent saves
+            continue
+        entry = os.path.join(path, name)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+
+##########################################################################################
+
+class ProfileCache():
+    """
+    A persistent cache of dataset profiles. Each profile is stored as a gzip compressed
+    JSON file named after the hash of the source file contents and the profiling options.
+    When the cache grows past `max_size` bytes, the least recently used entries are
+    removed.
+
+    Attributes:
+    -----------
+    directory: str
+        The directory in which the profiles are stored.
+    max_size: int
+        The maximum total size of the cached profiles, in bytes.
+
+    Methods:
+    --------
+    make_key(self, path: str, options: dict) -> str:
+        Returns the cache key of a file profiled with the given options.
+    get(self, key: str) -> Any:
+        Returns a cached profile, or None.
+    put(self, key: str, profile: Any) -> None:
+        Stores a profile and evicts old entries if needed.
+    """
+
+    def __init__(self, directory: str = os.path.join(CACHE_DIR, "profiles"), max_size: int = PROFILE_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json.gz")
+
+    def make_key(self, path: str, options: dict) -> str:
+        """
+        Returns the cache key of a file profiled with the given options.
+
+        Parameters:
+        -----------
+        path: str
+            The path to the profiled file.
+        options: dict
+            The profiling options, e.g. `minimal` or `tsmode`.
+
+        Returns:
+        --------
+        The cache key.
+        """
+        return make_file_key(path, options)
+
+    def get(self, key: str) -> Any:
+        """
+        Returns a cached profile.
+
+        Parameters:
+        -----------
+        key: str
+            The cache key.
+
+        Returns:
+        --------
+        The cached profile, or None if it is not in the cache or could not be read.
+        """
+        path = self._get_path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                profile = json.load(file)
+            os.utime(path)  # Marks the entry as recently used
+            return profile
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, profile: Any) -> None:
+        """
+        Stores a profile, then evicts the least recently used entries if the cache is over
+        its maximum size. Failures to write are ignored, as the cache is only an optimisation.
+
+        Parameters:
+        -----------
+        key: str
+            The cache key.
+        profile: Any
+            The JSON serialisable profile.
+        """
+        path = self._get_path(key)
+        temporary_path = path + "." + str(threading.get_ident()) + ".tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with gzip.open(temporary_path, "wt", encoding="utf-8", compresslevel=6) as file:
+                json.dump(profile, file, separators=(",", ":"))
+            os.replace(temporary_path, path)
+        except OSError:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache fits in `max_size` bytes.
+        """
+        with self._lock:
+            evict_least_recently_used(self.directory, ".json.gz", self.max_size)
+
+    def clear(self) -> None:
+        """
+        Removes all the cached profiles.
+        """
+        with self._lock:
+            if os.path.isdir(self.directory):
+                for entry in os.scandir(self.directory):
+                    if entry.name.endswith(".json.gz"):
+                        os.remove(entry.path)
+
+##########################################################################################
+
+class ModelCache():
+    """
+    An in-process cache of objects loaded from disk, such as saved models and strategies,
+    so that serving them does not load them again for every request. The entries are keyed
+    on their path, and are loaded again when the current version of a versioned directory,
+    or the modification time of other paths, changes. The size of an entry is the memory
+    of the loaded object, measured by `get_object_size`, rather than the size of its
+    compressed files. When the total size of the entries grows past `max_size` bytes, the
+    least recently used entries are evicted. The entry being added is kept even if it is
+    larger on its own.
+
+    Objects returned by the cache are shared between the callers, which must not change
+    them.
+
+    Attributes:
+    -----------
+    max_size: int
+        The maximum total memory of the loaded entries, in bytes.
+
+    Methods:
+    --------
+    get(self, path: str, load: Callable[[str], Any]) -> Any:
+        Returns the object saved at a path, loading it on a miss.
+    invalidate(self, path: str) -> None:
+        Removes an entry.
+    get_stats(self) -> dict:
+        Returns the hit and miss counters and the entries of the cache.
+    """
+
+    def __init__(self, max_size: int = MODEL_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: str, load: Callable[[str], Any]) -> Any:
+        """
+        Returns the object saved at a path. On a miss, the object is loaded outside the
+        lock, so loading one entry does not block the hits on others.
+
+        Parameters:
+        -----------
+        path: str
+            The path of the saved object.
+        load: Callable[[str], Any]
+            The function loading the object from its path, e.g. `MLModel.load`.
+
+        Returns:
+        --------
+        The loaded object.
+
+        Raises:
+        -------
+        KeyError:
+            If nothing is saved at the path.
+        """
+        path = os.path.abspath(path)
+        while True:
+            try:
+                current_path, stamp = self._get_stamp(path)
+            except FileNotFoundError:
+                raise KeyError("Not found: " + path)
+
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None and entry["stamp"] == stamp:
+                    self._entries.move_to_end(path)
+                    self._hits += 1
+                    return entry["value"]
+                self._misses += 1
+
+            try:
+                value = load(path)
+                break
+            except FileNotFoundError:
+                # The version was replaced and removed while loading, the new one is loaded
+                if self._get_stamp(path)[0] == current_path:
+                    raise
+
+        size = get_object_size(value)
+        with self._lock:
+            self._remove(path)
+            self._entries[path] = {"stamp": stamp, "value": value, "size": size}
+            self._size += size
+            while self._size > self.max_size and len(self._entries) > 1:
+                self._size -= self._entries.popitem(last=False)[1]["size"]
+                self._evictions += 1
+
+        return value
+
+    def _get_stamp(self, path: str) -> tuple:
+        """
+        Returns the current version of a path and its modification time, which change
+        when the object is saved again.
+        """
+        while True:
+            current_path = get_current_directory(path)
+            try:
+                return current_path, (current_path, os.stat(current_path).st_mtime_ns)
+            except FileNotFoundError:
+                # The version was removed by a save since it was read, the new one is used
+                if get_current_directory(path) == current_path:
+                    raise
+
+    def _remove(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._size -= entry["size"]
+
+    def invalidate(self, path: str) -> None:
+        """
+        Removes an entry, e.g. after the object is saved again.
+
+        Parameters:
+        -----------
+        path: str
+            The path of the saved object.
+        """
+        with self._lock:
+            self._remove(os.path.abspath(path))
+
+    def clear(self) -> None:
+        """
+        Removes all the entries. The counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self) -> dict:
+        """
+        Returns the hit and miss counters of the cache, its size and its entries, from the
+        least to the most recently used.
+        """
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / requests if requests else None,
+                "size": self._size,
+                "max_size": self.max_size,
+                "entries": [{"path": path, "size": entry["size"]} for path, entry in self._entries.items()],
+            }
+
+##########################################################################################
+
+PROFILE_CACHE = ProfileCache()
+MODEL_CACHE = ModelCache()
@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict
+
+from .cache import CACHE_DIR, remember_fingerprint
+
+##########################################################################################
+
+# Whether the backend persists its datasets across restarts. Only the catalogue, a small
+# JSON file under CACHE_DIR, is written: the datasets are read again from their source files
+PERSIST_DATASETS = os.environ.get("NEUROGEMS_PERSIST_DATASETS", "true").lower() in ["1", "true", "yes"]
+
+# Whether the persisted datasets are also copied to the columnar store, so they are mapped
+# rather than read again after a restart. Off by default, as it copies every dataset to disk
+PERSIST_DATASETS_DATA = os.environ.get("NEUROGEMS_PERSIST_DATASETS_DATA", "false").lower() in ["1", "true", "yes"]
+
+CATALOGUE_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+##########################################################################################
+
+class DatasetCatalogue():
+    """
+    A persistent record of the datasets added to a `DataHandler`, stored as a JSON file.
+    Each entry holds what is needed to rehydrate a dataset without reading its source file:
+    its type and attributes, the key of its data in the columnar store, and the size,
+    modification time and fingerprint of the source file.
+
+    On load, the source files are only stat-ed. The fingerprints of unchanged files are
+    remembered, so the keys of their cached profiles and stored data are found without
+    hashing the files again.
+
+    Attributes:
+    -----------
+    path: str
+        The path to the catalogue file.
+    store_data: bool
+        Whether the data of the catalogued datasets is copied to the columnar store.
+
+    Methods:
+    --------
+    load(self) -> Dict[str, dict]:
+        Returns the catalogue entries, flagging the entries whose source file changed.
+    save(self, entries: Dict[str, dict]) -> None:
+        Replaces the catalogue entries.
+    """
+
+    def __init__(self, path: str = os.path.join(CACHE_DIR, "catalogue.json"), store_data: bool = PERSIST_DATASETS_DATA):
+        self.path = path
+        self.store_data = store_data
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, dict]:
+        """
+        Returns the catalogue entries. Each entry gets a `changed` flag, set when the size or
+        modification time of its source file differs from the recorded ones.
+
+        Returns:
+        --------
+        A dictionary mapping dataset names to their entries, empty if the catalogue does not
+        exist or cannot be read.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                catalogue = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        if catalogue.get("version") != CATALOGUE_VERSION:
+            return {}
+
+        entries = {}
+        for name, entry in catalogue.get("datasets", {}).items():
+            try:
+                stat = os.stat(entry["attributes"]["path"])
+                entry["changed"] = stat.st_size != entry["size"] or stat.st_mtime_ns != entry["mtime_ns"]
+            except OSError:
+                # The source file is gone, the dataset is only usable from the store
+                entry["changed"] = False
+
+            if not entry["changed"] and entry.get("fingerprint") is not None:
+                remember_fingerprint(entry["attributes"]["path"], entry["size"], entry["mtime_ns"], entry["fingerprint"])
+
+            entries[name] = entry
+
+        return entries
+
+    def save(self, entries: Dict[str, dict]) -> None:
+        """
+        Replaces the catalogue entries. Failures to write are logged but not raised, the
+        datasets then simply have to be added again after a restart.
+
+        Parameters:
+        -----------
+        entries: Dict[str, dict]
+            A dictionary mapping dataset names to their entries.
+        """
+        temporary_path = self.path + "." + str(threading.get_ident()) + ".tmp"
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(temporary_path, "w", encoding="utf-8") as file:
+                    json.dump({"version": CATALOGUE_VERSION, "datasets": entries}, file, indent=2, default=str)
+                os.replace(temporary_path, self.path)
+            except OSError:
+                logger.exception("Could not write the dataset catalogue %s", self.path)
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
@@ -1,17 +1,59 @@
+import numpy as np
 import pandas as pd
-from ydata_profiling import ProfileReport
 import json
+import logging
+import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .cache import PROFILE_CACHE, file_fingerprint, make_file_key
+from .readers import get_types_mapper, iter_batches, read_dataset
+from .store import COLUMNAR_STORE, USE_STORE
+from .profiling import PROFILE_SAMPLE_SIZE, PROFILE_SAMPLINGS, ReservoirSampler, StreamingStatistics, apply_exact_statistics
+
+# The memory the datasets can hold before the least recently used ones are spilled to disk
+MEMORY_BUDGET = int(os.environ.get("NEUROGEMS_MEMORY_BUDGET", 4096)) * 1024 * 1024
+
+# Files larger than this are ingested in chunks straight into the columnar store
+STREAMING_THRESHOLD = int(os.environ.get("NEUROGEMS_STREAMING_THRESHOLD", 1024)) * 1024 * 1024
+
+# The number of rows processed at a time when computing statistics over a whole dataset
+CHUNK_SIZE = 1000000
+
+logger = logging.getLogger(__name__)
 
 class DataHandler():
+    """
+    Handles the collection of datasets.
+
+    The `datasets` dictionary is copy-on-write: it is replaced, never mutated, while holding
+    a lock, so request handlers and training jobs can read or iterate it without locking.
+
+    Dataset profiles are generated in a background thread, so adding a dataset returns as
+    soon as it has been loaded.
+
+    When the datasets held in memory exceed the memory budget, the least recently used ones
+    are spilled to the columnar store and transparently mapped back when accessed.
+
+    With a catalogue, the datasets are persisted across restarts: they are rehydrated from
+    the catalogue without reading their source files, and loaded on first access. The
+    catalogue entry of a dataset is written in its own background thread as soon as it is
+    added, without waiting for its profile.
+    """
 
-    def __init__(self):
+    def __init__(self, memory_budget=MEMORY_BUDGET, catalogue=None):
         """
         Initializes the data handler
 
         Parameters
         ----------
-        None
+        memory_budget : int, default=MEMORY_BUDGET
+            The number of bytes the datasets can hold in memory
+
+        catalogue : DatasetCatalogue, default=None
+            The catalogue in which the datasets are persisted. The datasets are not persisted
+            if None
 
         Returns
         -------
@@ -19,8 +61,87 @@ class DataHandler():
 
         """
         self.datasets = {}
+        self.memory_budget = memory_budget
+        self.catalogue = catalogue
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._profile_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile")
+        self._catalogue_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalogue")
+
+        if catalogue is not None:
+            self._rehydrate_datasets()
+
+    def _rehydrate_datasets(self):
+        """
+        Adds the datasets of the catalogue, without loading their data
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        datasets = {}
+        for dataset_name, entry in self.catalogue.load().items():
+            if entry["type"] not in DATASET_TYPES:
+                continue
+            datasets[dataset_name] = DATASET_TYPES[entry["type"]].from_catalogue_entry(entry)
+
+        with self._lock:
+            self.datasets = {**datasets, **self.datasets}
+
+    def _save_catalogue(self):
+        """
+        Saves the current datasets to the catalogue
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        if self.catalogue is None:
+            return
+
+        entries = {}
+        for dataset_name, dataset in self.datasets.items():
+            try:
+                entries[dataset_name] = dataset.get_catalogue_entry()
+            except Exception:
+                # e.g. the source file was removed and the dataset was never stored
+                pass
+
+        self.catalogue.save(entries)
+
+    def _persist_dataset(self, dataset):
+        """
+        Saves the catalogue with the dataset. If the catalogue stores the data, the dataset
+        is first written to the columnar store, so it can be mapped after a restart rather
+        than read again from its source file
+
+        Parameters
+        ----------
+        dataset : Dataset
+            The dataset to persist
+
+        Returns
+        -------
+        None
+        """
+        if self.catalogue.store_data:
+            try:
+                dataset.save_to_store()
+            except Exception:
+                # The dataset is still catalogued, it is read from its source after a restart
+                logger.exception("Could not write dataset %s to the columnar store", dataset.name)
 
-    def add_dataset(self, dataset_name, dataset_path, label_column, time_column=None):
+        self._save_catalogue()
+
+    def add_dataset(self, dataset_name, dataset_path, label_column, time_column=None, profile_sample_size=PROFILE_SAMPLE_SIZE, profile_sampling="stratified", columns=None, filters=None, use_store=USE_STORE, streaming=None, id_column=None):
         """
         Adds a new dataset to the collection
 
@@ -32,18 +153,92 @@ class DataHandler():
             The path to the dataset
         label_column : str
             The name of the label column
+        time_column : str, default=None
+            The name of the time column, for time series datasets
+        profile_sample_size : int, default=PROFILE_SAMPLE_SIZE
+            The number of rows above which the profile is generated on a sample. 0 or None
+            profiles every row
+        profile_sampling : str, default="stratified"
+            How the rows are sampled, one of PROFILE_SAMPLINGS
+        columns : list, default=None
+            The columns to load, all of them if None
+        filters : list, default=None
+            The rows to load, as (column, operator, value) conditions
+        use_store : bool, default=USE_STORE
+            Whether to keep the dataset in the memory-mapped columnar store
+        streaming : bool, default=None
+            Whether to ingest the dataset in chunks, for files larger than memory. By default
+            files larger than STREAMING_THRESHOLD are streamed
+        id_column : str, default=None
+            The name of the column identifying the subjects, used to join modalities
 
         Returns
         -------
-        dict
-            The dataset information
+        None
 
         """
         if time_column is not None:
-            dataset = TimeSeriesDataset(dataset_name, dataset_path, label_column, time_column)
+            dataset = TimeSeriesDataset(dataset_name, dataset_path, label_column, time_column, profile_sample_size, profile_sampling, columns, filters, use_store, streaming, id_column)
         else:
-            dataset = Dataset(dataset_name, dataset_path, label_column)
-        self.datasets[dataset_name] = dataset
+            dataset = Dataset(dataset_name, dataset_path, label_column, profile_sample_size, profile_sampling, columns, filters, use_store, streaming, id_column)
+
+        with self._lock:
+            self.datasets = {**self.datasets, dataset_name: dataset}
+
+        self._enforce_memory_budget()
+        dataset.start_profiling(self._profile_executor)
+
+        if self.catalogue is not None:
+            self._catalogue_executor.submit(self._persist_dataset, dataset)
+
+    def _enforce_memory_budget(self):
+        """
+        Spills the least recently used datasets holding process memory until they fit in
+        the memory budget
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        with self._spill_lock:
+            datasets = sorted(self.datasets.values(), key=lambda dataset: dataset.last_access)
+            resident_size = sum(dataset.resident_size for dataset in datasets)
+
+            for dataset in datasets:
+                if resident_size <= self.memory_budget:
+                    break
+                dataset_resident_size = dataset.resident_size
+                if dataset_resident_size > 0:
+                    resident_size -= dataset_resident_size
+                    dataset.spill()
+
+    def get_datasets_memory_information(self):
+        """
+        Returns the memory used by the datasets
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The memory budget, the total resident size, and the state, resident size and
+            spilled size of each dataset, in bytes
+
+        """
+        datasets = [dataset.get_memory_information() for dataset in self.datasets.values()]
+
+        return {
+            "memory_budget": self.memory_budget,
+            "resident_size": sum(dataset["resident_size"] for dataset in datasets),
+            "spilled_size": sum(dataset["spilled_size"] for dataset in datasets),
+            "datasets": datasets
+        }
         
     def get_dataset(self, dataset_name):
         """
@@ -65,13 +260,14 @@ class DataHandler():
             If the dataset name is not found
                 
         """
-        if dataset_name not in self.datasets:
+        datasets = self.datasets
+        if dataset_name not in datasets:
             raise KeyError("Dataset not found")
 
-        return self.datasets[dataset_name]
+        return datasets[dataset_name]
 
     
-    def get_dataset_information(self, dataset_name, return_profile=False):
+    def get_dataset_information(self, dataset_name, return_profile=False, wait_profile=True):
         """
         Returns the dataset information for the given dataset name
 
@@ -83,6 +279,10 @@ class DataHandler():
         return_profile : bool, default=False
             Whether to include the dataset profile in the returned information
 
+        wait_profile : bool, default=True
+            Whether to wait for a pending profile. If False, the generation of a pending
+            profile is started in the background and the profile is returned as None
+
         Returns
         -------
         dict
@@ -94,12 +294,18 @@ class DataHandler():
             If the dataset name is not found
 
         """
-        if dataset_name not in self.datasets:
+        datasets = self.datasets
+        if dataset_name not in datasets:
             raise KeyError("Dataset not found:" + dataset_name)
 
-        return self.datasets[dataset_name].get_information(return_profile)
+        dataset = datasets[dataset_name]
+        if return_profile and not wait_profile:
+            # e.g. datasets rehydrated from the catalogue, which are profiled on demand
+            dataset.start_profiling(self._profile_executor)
 
-    def get_datasets_information(self, return_profile=False):
+        return dataset.get_information(return_profile, wait_profile)
+
+    def get_datasets_information(self, return_profile=False, wait_profile=True):
         """
         Returns the dataset information for all datasets
 
@@ -108,13 +314,22 @@ class DataHandler():
         return_profile : bool, default=False
             Whether to include the dataset profile in the returned information
 
+        wait_profile : bool, default=True
+            Whether to wait for pending profiles. If False, the generation of the pending
+            profiles is started in the background and they are returned as None
+
         Returns
         -------
         list
             The list of dataset information
 
         """
-        return [self.get_dataset_information(dataset_name, return_profile) for dataset_name in self.datasets]
+        datasets = list(self.datasets.values())
+        if return_profile and not wait_profile:
+            for dataset in datasets:
+                dataset.start_profiling(self._profile_executor)
+
+        return [dataset.get_information(return_profile, wait_profile) for dataset in datasets]
 
     def rm_dataset(self, dataset_name):
         """
@@ -135,10 +350,13 @@ class DataHandler():
             If the dataset name is not found
 
         """
-        if dataset_name not in self.datasets:
-            raise KeyError("Dataset not found")
+        with self._lock:
+            if dataset_name not in self.datasets:
+                raise KeyError("Dataset not found")
 
-        self.datasets.pop(dataset_name)
+            self.datasets = {name: dataset for name, dataset in self.datasets.items() if name != dataset_name}
+
+        self._save_catalogue()
 
     def rm_all_datasets(self):
         """
@@ -153,7 +371,10 @@ class DataHandler():
         None
 
         """
-        self.datasets = {}
+        with self._lock:
+            self.datasets = {}
+
+        self._save_catalogue()
 
     @property
     def dataset_names(self):
@@ -208,7 +429,10 @@ class DataHandler():
 
 
 class Dataset():
-    def __init__(self, name, path, target_column):
+    # The attributes persisted in the dataset catalogue
+    CATALOGUE_ATTRIBUTES = ["name", "path", "target_column", "id_column", "columns", "filters", "profile_sample_size", "profile_sampling", "description", "n_rows", "memory_size"]
+
+    def __init__(self, name, path, target_column, profile_sample_size=PROFILE_SAMPLE_SIZE, profile_sampling="stratified", columns=None, filters=None, use_store=USE_STORE, streaming=None, id_column=None):
         """
         Initializes the dataset
 
@@ -223,26 +447,98 @@ class Dataset():
         target_column : str
             The name of the target column
 
+        profile_sample_size : int, default=PROFILE_SAMPLE_SIZE
+            The number of rows above which the profile is generated on a sample. 0 or None
+            profiles every row
+
+        profile_sampling : str, default="stratified"
+            How the rows are sampled: "stratified" on the target column or "reservoir"
+
+        columns : list, default=None
+            The columns to load. The target column is always loaded. All the columns are
+            loaded if None
+
+        filters : list, default=None
+            The rows to load, as (column, operator, value) conditions. See
+            readers.read_dataset
+
+        use_store : bool, default=USE_STORE
+            Whether to keep the dataset in the memory-mapped columnar store rather than in
+            process memory
+
+        streaming : bool, default=None
+            Whether to ingest the dataset in chunks straight into the columnar store, for
+            files larger than memory. By default files larger than STREAMING_THRESHOLD are
+            streamed
+
+        id_column : str, default=None
+            The name of the column identifying the subjects, used to join the dataset with
+            other modalities. It is not used as a feature
+
         Returns
         -------
         None
         """
+        if columns is not None and target_column not in columns:
+            columns = list(columns) + [target_column]
+        if columns is not None and id_column is not None and id_column not in columns:
+            columns = list(columns) + [id_column]
+        if streaming is None:
+            streaming = os.path.getsize(path) > STREAMING_THRESHOLD
+
         self.name = name
         self.path = path
-        self.data = self._load_data(path)
-        self.target_column = self._check_target_column(target_column)
-        self.description = str(self.data.shape[0]) + " rows, " + str(self.data.shape[1]) + " columns | " + "{:.1f}".format(self.data.memory_usage().sum() / 1024 / 1024) + " MB"  # TODO: format file size in a better way
-        self.profile = self._generate_profile(self.data, name)
+        self.columns = columns
+        self.filters = filters
+        self.target_column = target_column
+        self.profile_sample_size = profile_sample_size or None
+        self.profile_sampling = self._check_profile_sampling(profile_sampling)
+        self._ingestion = None
+        self.store_key = make_file_key(path, {"columns": columns, "filters": filters}) if use_store or streaming else None
+        if streaming:
+            self.data = self._ingest_data(path, columns, filters)
+        else:
+            self.data = self._load_stored_data(path, columns, filters) if use_store else self._load_data(path, columns, filters)
+        self._check_target_column(target_column)
+        self.id_column = self._check_id_column(id_column)
+        self.description = self._describe(self.data)
+        self._profile = None
+        self._profile_error = None
+        self._profile_lock = threading.Lock()
+        self._profile_future = None
+
+    def _describe(self, data):
+        """
+        Returns the description of the dataset: its number of rows and columns and its size
 
-    def _load_data(self, path):
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            The dataset
+
+        Returns
+        -------
+        str
+            The description of the dataset
         """
-        Loads the dataset from the given path
+        return str(data.shape[0]) + " rows, " + str(data.shape[1]) + " columns | " + "{:.1f}".format(data.memory_usage().sum() / 1024 / 1024) + " MB"  # TODO: format file size in a better way
+
+    def _load_data(self, path, columns=None, filters=None):
+        """
+        Loads the dataset from the given path. CSV, Parquet and Feather files are supported,
+        see readers.SUPPORTED_FORMATS
         
         Parameters
         ----------
         path : str
             The path to the dataset
 
+        columns : list, default=None
+            The columns to load
+
+        filters : list, default=None
+            The rows to load
+
         Returns
         -------
         pandas.DataFrame
@@ -254,220 +550,525 @@ class Dataset():
             If the dataset could not be loaded
         """
         try:
-            return pd.read_csv(path)
+            return read_dataset(path, columns, filters)
         except:
-            raise Exception("Could not load dataset at: " + path + "\n because of the following error: " + sys.exc_info()[0])
+            raise Exception("Could not load dataset at: " + path + "\n because of the following error: " + str(sys.exc_info()[1]))
 
-    def _check_target_column(self, target_column):
+    def _ingest_data(self, path, columns=None, filters=None):
         """
-        Checks if the target column is in the dataset
-        
+        Ingests the dataset in chunks: each chunk is written to the columnar store and added
+        to the statistics and the row sample of the profile, then released, so the dataset
+        never has to fit in memory. The returned DataFrame is a view on the memory-mapped
+        store entry
+
         Parameters
         ----------
-        target_column : str
-            The name of the target column
-            
+        path : str
+            The path to the dataset
+
+        columns : list, default=None
+            The columns to load
+
+        filters : list, default=None
+            The rows to load
+
         Returns
         -------
-        str
-            The name of the target column
+        pandas.DataFrame
+            The loaded dataset
 
         Raises
         ------
         Exception
-            If the target column is not in the dataset
+            If the dataset could not be loaded
         """
-        if target_column not in self.data.columns:
-            raise Exception("Target column not found in dataset: " + self.name)
+        try:
+            return COLUMNAR_STORE.get(self.store_key)
+        except KeyError:
+            pass
+
+        statistics = StreamingStatistics()
+        sampler = None
+        if self.profile_sample_size is not None:
+            stratify_column = self.target_column if self.profile_sampling == "stratified" else None
+            sampler = ReservoirSampler(self.profile_sample_size, stratify_column, random_state=0)
+
+        def batches():
+            for batch in iter_batches(path, columns, filters):
+                chunk = batch.to_pandas(types_mapper=get_types_mapper())
+                statistics.update(chunk)
+                if sampler is not None and (sampler.stratify_column is None or sampler.stratify_column in chunk.columns):
+                    sampler.update(chunk)
+                yield batch
 
-        return target_column
+        try:
+            data = COLUMNAR_STORE.put_batches(self.store_key, batches())
+        except:
+            raise Exception("Could not load dataset at: " + path + "\n because of the following error: " + str(sys.exc_info()[1]))
 
-    def _generate_profile(self, data, name):
+        self._ingestion = (statistics, sampler)
+        return data
+
+    def _load_stored_data(self, path, columns=None, filters=None):
         """
-        Generates a profile for the dataset
+        Loads the dataset from the columnar store, materialising it first if it is not in
+        the store yet. The returned DataFrame is a view on a memory-mapped file
 
         Parameters
         ----------
-        data : pandas.DataFrame
-            The dataset to generate the profile for
+        path : str
+            The path to the dataset
 
-        name : str
-            The name of the dataset
+        columns : list, default=None
+            The columns to load
+
+        filters : list, default=None
+            The rows to load
 
         Returns
         -------
-        dict
-            The dataset profile
-
-        Raises
-        ------
-        Exception
-            If the profile could not be generated
+        pandas.DataFrame
+            The loaded dataset
         """
-
         try:
-            return json.loads(ProfileReport(data, title=name, minimal=True).to_json().replace(" NaN", " null"))
-        except:
-            raise Exception("Could not generate profile for dataset: " + name)
+            return COLUMNAR_STORE.get(self.store_key)
+        except KeyError:
+            return COLUMNAR_STORE.put(self.store_key, self._load_data(path, columns, filters))
 
-    def get_data(self, drop_target=False):
+    def __getstate__(self):
         """
-        Returns the dataset
+        Returns the state of the dataset to pickle, e.g. to send it to another process.
+        Datasets in the columnar store are pickled without their data, which is mapped
+        again from the store when unpickled
 
         Parameters
         ----------
-        drop_target : bool, default=False
-            Whether to drop the target column from the dataset
+        None
 
         Returns
         -------
-        pandas.DataFrame
-            The dataset
+        dict
+            The state of the dataset
         """
-        if drop_target:
-            return self.data.drop(self.target_column, axis=1)
+        state = {key: value for key, value in self.__dict__.items() if key not in ["_profile_lock", "_profile_future", "_features", "_encoded_target", "_ingestion"]}
+        if self.store_key is not None:
+            state.pop("_data")
 
-        return self.data
+        return state
 
-    def get_target(self):
+    def __setstate__(self, state):
         """
-        Returns the target column
+        Restores the state of an unpickled dataset
 
         Parameters
         ----------
-        None
+        state : dict
+            The state of the dataset
 
         Returns
         -------
-        pandas.Series
-            The target column
+        None
         """
-        return self.data[self.target_column]
+        self.__dict__.update(state)
+        self._profile_lock = threading.Lock()
+        self._profile_future = None
+        self._features = None
+        self._encoded_target = None
+        self._ingestion = None
+        if self.store_key is not None:
+            self.data = COLUMNAR_STORE.get(self.store_key)
 
-    def get_information(self, return_profile=False):
+    @property
+    def data(self):
         """
-        Returns the dataset information
-        
+        Returns the dataset. A spilled dataset is mapped back from the columnar store, or
+        loaded again from its source if it has been evicted from the store
+
         Parameters
         ----------
-        return_profile : bool, default=False
-            Whether to include the dataset profile in the returned information
+        None
 
         Returns
         -------
-        dict
-            The dataset information
+        pandas.DataFrame
+            The dataset
         """
-        information = {
-            "name": self.name,
-            "path": self.path,
-            "target_column": self.target_column,
-            "description": self.description
-        }
+        self.last_access = time.time()
+        data = self._data
+        if data is None:
+            if self.store_key is None:
+                # Rehydrated from the catalogue, but the source file changed since
+                self.store_key = make_file_key(self.path, {"columns": self.columns, "filters": self.filters})
+                self.data = data = self._load_stored_data(self.path, self.columns, self.filters)
+                self.description = self._describe(data)
+            else:
+                data = self._load_stored_data(self.path, self.columns, self.filters)
+                self._data = data
+
+        return data
+
+    @data.setter
+    def data(self, data):
+        """
+        Replaces the dataset and invalidates the cached features and encoded target
 
-        if return_profile:
-            information["profile"] = self.profile
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            The new dataset
 
-        return information
+        Returns
+        -------
+        None
+        """
+        self._data = data
+        self._features = None
+        self._encoded_target = None
+        self.n_rows = data.shape[0]
+        self.memory_size = int(data.memory_usage().sum())
+        self.last_access = time.time()
 
-class TimeSeriesDataset():
-    def __init__(self, name, path, target_column, time_column):
+    @property
+    def memory_state(self):
         """
-        Initializes the time series dataset
+        Returns where the dataset is held: "memory" in process memory, "mapped" from the
+        columnar store, or "spilled" to the columnar store only
 
         Parameters
         ----------
-        name : str
-            The name of the dataset
+        None
 
-        path : str
-            The path to the dataset
+        Returns
+        -------
+        str
+            The memory state of the dataset
+        """
+        if self._data is None:
+            return "spilled"
+        if self.store_key is not None:
+            return "mapped"
+        return "memory"
 
-        target_column : str
-            The name of the target column
+    @property
+    def resident_size(self):
+        """
+        Returns the number of bytes of process memory held by the dataset. The columns of
+        mapped datasets that are views on the columnar store are backed by the page cache,
+        which the system can reclaim, so only the columns copied when they were mapped,
+        e.g. booleans and columns with missing values, are counted
 
-        time_column : str
-            The name of the time column
+        Parameters
+        ----------
+        None
 
         Returns
         -------
-        None
+        int
+            The resident size of the dataset
         """
-        self.name = name
-        self.path = path
-        self.data = self._load_data(path)
-        self.target_column = self._check_target_column(target_column)
-        self.time_column = self._check_time_column(time_column)
-        self.description = str(self.data.shape[0]) + " rows, " + str(self.data.shape[1]) + " columns | " + "{:.1f}".format(self.data.memory_usage().sum() / 1024 / 1024) + " MB"  # TODO: format file size in a better way
-        self.profile = self._generate_profile(self.data, name)
+        data = self._data
+        if data is None:
+            return 0
+        if self.store_key is not None:
+            resident_size = COLUMNAR_STORE.get_resident_size(data)
+            if resident_size is not None:
+                return resident_size
+        return self.memory_size
 
-    def _load_data(self, path):
+    @property
+    def spilled_size(self):
         """
-        Loads the dataset from the given path
-        
+        Returns the number of bytes of the dataset in the columnar store
+
         Parameters
         ----------
-        path : str
-            The path to the dataset
+        None
 
         Returns
         -------
-        pandas.DataFrame
-            The loaded dataset
-
-        Raises
-        ------
-        Exception
-            If the dataset could not be loaded
+        int
+            The spilled size of the dataset
         """
+        if self.store_key is None:
+            return 0
+
         try:
-            return pd.read_csv(path)
-        except:
-            raise Exception("Could not load dataset at: " + path + "\n because of the following error: " + sys.exc_info()[0])
+            return os.path.getsize(COLUMNAR_STORE.get_path(self.store_key))
+        except OSError:
+            return 0
 
-    def _check_target_column(self, target_column):
+    def spill(self):
         """
-        Checks if the target column is in the dataset
-        
+        Writes the dataset to the columnar store, if it is not there yet, and releases its
+        process memory. The dataset is mapped back from the store on the next access
+
         Parameters
         ----------
-        target_column : str
-            The name of the target column
-            
+        None
+
         Returns
         -------
-        str
-            The name of the target column
-
-        Raises
-        ------
-        Exception
-            If the target column is not in the dataset
+        None
         """
-        if target_column not in self.data.columns:
-            raise Exception("Target column not found in dataset: " + self.name)
+        if self._data is None:
+            return
 
-        return target_column
+        self.store_key = self.save_to_store()
+        self._data = None
+        self._features = None
+        self._encoded_target = None
 
-    def _check_time_column(self, time_column):
+    def save_to_store(self):
         """
-        Checks if the time column is in the dataset
+        Writes the dataset to the columnar store, if it is not there yet. The dataset stays
+        in memory
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        str
+            The key of the dataset in the columnar store
+        """
+        store_key = self.get_data_key()
+        data = self._data
+        if data is not None and not COLUMNAR_STORE.contains(store_key):
+            COLUMNAR_STORE.put(store_key, data)
+
+        return store_key
+
+    def get_data_key(self):
+        """
+        Returns a key identifying the data of the dataset, i.e. the contents of its source
+        file and the selected columns and rows
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        str
+            The key of the data, also its key in the columnar store
+        """
+        return self.store_key or make_file_key(self.path, {"columns": self.columns, "filters": self.filters})
+
+    def get_catalogue_entry(self):
+        """
+        Returns the catalogue entry of the dataset, from which it can be rehydrated without
+        reading its source file
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The catalogue entry
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # The source file is gone, keep the entry the dataset was rehydrated from
+            if getattr(self, "_catalogue_entry", None) is None:
+                raise
+            return self._catalogue_entry
+
+        return {
+            "type": type(self).__name__,
+            "attributes": {attribute: getattr(self, attribute) for attribute in self.CATALOGUE_ATTRIBUTES},
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "fingerprint": file_fingerprint(self.path),
+            "store_key": self.get_data_key()
+        }
+
+    @classmethod
+    def from_catalogue_entry(cls, entry):
+        """
+        Rehydrates a dataset from its catalogue entry. The data is not loaded: it is mapped
+        from the columnar store, or loaded from the source file if it changed, on first
+        access
+
+        Parameters
+        ----------
+        entry : dict
+            The catalogue entry
+
+        Returns
+        -------
+        Dataset
+            The dataset
+        """
+        dataset = cls.__new__(cls)
+        dataset.id_column = None
+        dataset.__dict__.update(entry["attributes"])
+        dataset.store_key = None if entry.get("changed") else entry["store_key"]
+        dataset._data = None
+        dataset._features = None
+        dataset._encoded_target = None
+        dataset._ingestion = None
+        dataset.last_access = 0
+        dataset._profile = None
+        dataset._profile_error = None
+        dataset._profile_lock = threading.Lock()
+        dataset._profile_future = None
+        dataset._catalogue_entry = {key: value for key, value in entry.items() if key != "changed"}
+
+        return dataset
+
+    def get_memory_information(self):
+        """
+        Returns the memory used by the dataset
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The memory state, resident size and spilled size of the dataset
+        """
+        return {
+            "name": self.name,
+            "state": self.memory_state,
+            "resident_size": self.resident_size,
+            "spilled_size": self.spilled_size,
+            "last_access": self.last_access
+        }
+
+    def _check_target_column(self, target_column):
+        """
+        Checks if the target column is in the dataset
         
         Parameters
         ----------
-        time_column : str
-            The name of the time column
+        target_column : str
+            The name of the target column
             
         Returns
         -------
         str
-            The name of the time column
+            The name of the target column
+
+        Raises
+        ------
+        Exception
+            If the target column is not in the dataset
         """
-        if time_column not in self.data.columns:
-            raise Exception("Time column not found in dataset: " + self.name)
+        if target_column not in self.data.columns:
+            raise Exception("Target column not found in dataset: " + self.name)
+
+        return target_column
+
+    def _check_id_column(self, id_column):
+        """
+        Checks if the id column is in the dataset and identifies each row once
+
+        Parameters
+        ----------
+        id_column : str
+            The name of the id column, or None
+
+        Returns
+        -------
+        str
+            The name of the id column
+
+        Raises
+        ------
+        Exception
+            If the id column is not in the dataset or has missing or duplicated values
+        """
+        if id_column is None:
+            return None
+
+        if id_column not in self.data.columns:
+            raise Exception("Id column not found in dataset: " + self.name)
+
+        ids = self.data[id_column]
+        if ids.isna().any() or ids.duplicated().any():
+            raise Exception("Id column has missing or duplicated values in dataset: " + self.name)
+
+        return id_column
+
+    def _check_profile_sampling(self, profile_sampling):
+        """
+        Checks if the profile sampling is supported
+
+        Parameters
+        ----------
+        profile_sampling : str
+            The profile sampling
+
+        Returns
+        -------
+        str
+            The profile sampling
+
+        Raises
+        ------
+        Exception
+            If the profile sampling is not supported
+        """
+        if profile_sampling not in PROFILE_SAMPLINGS:
+            raise Exception("Profile sampling not supported: " + str(profile_sampling))
+
+        return profile_sampling
+
+    @property
+    def profile_sampled(self):
+        """
+        Returns whether the profile is generated on a sample of the rows
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        bool
+            Whether the profile is approximate
+        """
+        return self.profile_sample_size is not None and self.n_rows > self.profile_sample_size
+
+    def _get_sampling_options(self):
+        """
+        Returns the options used to sample the rows to profile
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The sampling options, empty if every row is profiled
+        """
+        if not self.profile_sampled:
+            return {}
+
+        return {"sample_size": self.profile_sample_size, "sampling": self.profile_sampling, "random_state": 0}
+
+    def _get_profile_options(self):
+        """
+        Returns the options passed to the profile report
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The profile report options
+        """
+        return {"minimal": True}
 
-        return time_column
-    
     def _generate_profile(self, data, name):
         """
         Generates a profile for the dataset
@@ -490,20 +1091,139 @@ class TimeSeriesDataset():
         Exception
             If the profile could not be generated
         """
+        # Imported here as ydata_profiling takes seconds to import
+        from ydata_profiling import ProfileReport
+
+        sampling_options = self._get_sampling_options()
+        if sampling_options and self._ingestion is not None:
+            # The statistics and the sample were computed while ingesting the dataset
+            statistics, sampler = self._ingestion
+            data = sampler.get_sample()
+        elif sampling_options:
+            # Profile a sample of the rows, then overwrite the statistics that are cheap to
+            # compute exactly on every row
+            stratify_column = self.target_column if sampling_options["sampling"] == "stratified" else None
+            sampler = ReservoirSampler(sampling_options["sample_size"], stratify_column, sampling_options["random_state"])
+            statistics = StreamingStatistics()
+            for start in range(0, data.shape[0], CHUNK_SIZE):
+                chunk = data.iloc[start:start + CHUNK_SIZE]
+                sampler.update(chunk)
+                statistics.update(chunk)
+            data = sampler.get_sample()
 
         try:
-            return json.loads(ProfileReport(data, tsmode=True, sortby=self.time_column, title=name, minimal=True).to_json().replace(" NaN", " null"))
+            profile = json.loads(ProfileReport(data, title=name, **self._get_profile_options()).to_json().replace(" NaN", " null"))
         except:
             raise Exception("Could not generate profile for dataset: " + name)
-        
+
+        if sampling_options:
+            profile = apply_exact_statistics(profile, statistics, {"n_rows": data.shape[0], "sampling": "stratified" if sampler.stratified else "reservoir"})
+
+        return profile
+
+    def generate_profile(self):
+        """
+        Generates the profile of the dataset, unless it has already been generated. If the
+        profile is being generated by another thread, waits for it instead. Profiles are
+        cached on disk, keyed by the contents of the file and the profile options.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        with self._profile_lock:
+            if self._profile is not None or self._profile_error is not None:
+                return
+
+            try:
+                cache_options = {**self._get_profile_options(), **self._get_sampling_options(), "columns": self.columns, "filters": self.filters}
+                cache_key = PROFILE_CACHE.make_key(self.path, cache_options)
+                profile = PROFILE_CACHE.get(cache_key)
+                if profile is None:
+                    profile = self._generate_profile(self.data, self.name)
+                    PROFILE_CACHE.put(cache_key, profile)
+                elif "analysis" in profile:
+                    profile["analysis"]["title"] = self.name
+                self._profile = profile
+            except Exception as e:
+                self._profile_error = str(e)
+
+            # The ingestion sample is only needed for the first profile
+            self._ingestion = None
+
+    def start_profiling(self, executor):
+        """
+        Generates the profile of the dataset in the background, unless its generation was
+        already started
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor
+            The executor to generate the profile in
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future of the profile generation
+        """
+        # Not under the profile lock, which is held while the profile is generated. A
+        # concurrent call may submit a second generation, which returns immediately
+        if self._profile_future is None:
+            self._profile_future = executor.submit(self.generate_profile)
+        return self._profile_future
+
+    @property
+    def profile_state(self):
+        """
+        Returns the state of the dataset profile: "pending", "ready" or "failed"
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        str
+            The state of the dataset profile
+        """
+        if self._profile is not None:
+            return "ready"
+        if self._profile_error is not None:
+            return "failed"
+        return "pending"
+
+    @property
+    def profile(self):
+        """
+        Returns the dataset profile, generating it first if it is still pending
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The dataset profile, or None if it could not be generated
+        """
+        if self.profile_state == "pending":
+            self.generate_profile()
+
+        return self._profile
+
     def get_data(self, drop_target=False):
         """
-        Returns the dataset
+        Returns the dataset. The features, without the target and id columns, are computed
+        once and cached until the dataset changes, so they should not be modified in place
 
         Parameters
         ----------
         drop_target : bool, default=False
-            Whether to drop the target column from the dataset
+            Whether to drop the target column, and the id column, from the dataset
 
         Returns
         -------
@@ -511,10 +1231,14 @@ class TimeSeriesDataset():
             The dataset
         """
         if drop_target:
-            return self.data.drop(self.target_column, axis=1)
+            features = self._features
+            if features is None:
+                features = self.data.drop([self.target_column] + ([self.id_column] if self.id_column is not None else []), axis=1)
+                self._features = features
+            return features
 
         return self.data
-    
+
     def get_target(self):
         """
         Returns the target column
@@ -529,10 +1253,10 @@ class TimeSeriesDataset():
             The target column
         """
         return self.data[self.target_column]
-    
-    def get_time(self):
+
+    def get_ids(self):
         """
-        Returns the time column
+        Returns the id column
 
         Parameters
         ----------
@@ -541,11 +1265,48 @@ class TimeSeriesDataset():
         Returns
         -------
         pandas.Series
-            The time column
+            The id column, or None if the dataset has no id column
         """
-        return self.data[self.time_column]
-    
-    def get_information(self, return_profile=False):
+        if self.id_column is None:
+            return None
+
+        return self.data[self.id_column]
+
+    def get_encoded_target(self):
+        """
+        Returns the target column encoded as integers, in the same way as sklearn's
+        LabelEncoder: the classes are sorted and each value is replaced by the index of its
+        class. The encoding is cached until the dataset changes
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        numpy.ndarray
+            The encoded target
+
+        numpy.ndarray
+            The sorted classes
+
+        Raises
+        ------
+        Exception
+            If the target column has missing values
+        """
+        encoded_target = self._encoded_target
+        if encoded_target is None:
+            codes, classes = pd.factorize(self.get_target(), sort=True)
+            if (codes < 0).any():
+                raise Exception("Target column has missing values in dataset: " + self.name)
+            codes.setflags(write=False)
+            encoded_target = (codes, np.asarray(classes))
+            self._encoded_target = encoded_target
+
+        return encoded_target
+
+    def get_information(self, return_profile=False, wait_profile=True):
         """
         Returns the dataset information
         
@@ -554,6 +1315,10 @@ class TimeSeriesDataset():
         return_profile : bool, default=False
             Whether to include the dataset profile in the returned information
 
+        wait_profile : bool, default=True
+            Whether to wait for a pending profile. If False, a pending profile is returned
+            as None
+
         Returns
         -------
         dict
@@ -563,11 +1328,152 @@ class TimeSeriesDataset():
             "name": self.name,
             "path": self.path,
             "target_column": self.target_column,
-            "time_column": self.time_column,
-            "description": self.description
+            "id_column": self.id_column,
+            "description": self.description,
+            "profile_approximate": self.profile_sampled,
+            "stored": self.store_key is not None
         }
 
         if return_profile:
-            information["profile"] = self.profile
+            information["profile"] = self.profile if wait_profile else self._profile
+
+        information["profile_state"] = self.profile_state
+        if self._profile_error is not None:
+            information["profile_error"] = self._profile_error
 
         return information
+
+class TimeSeriesDataset(Dataset):
+    CATALOGUE_ATTRIBUTES = Dataset.CATALOGUE_ATTRIBUTES + ["time_column"]
+
+    def __init__(self, name, path, target_column, time_column, profile_sample_size=PROFILE_SAMPLE_SIZE, profile_sampling="stratified", columns=None, filters=None, use_store=USE_STORE, streaming=None, id_column=None):
+        """
+        Initializes the time series dataset
+
+        Parameters
+        ----------
+        name : str
+            The name of the dataset
+
+        path : str
+            The path to the dataset
+
+        target_column : str
+            The name of the target column
+
+        time_column : str
+            The name of the time column
+
+        profile_sample_size : int, default=PROFILE_SAMPLE_SIZE
+            The number of rows above which the profile is generated on a sample. 0 or None
+            profiles every row
+
+        profile_sampling : str, default="stratified"
+            How the rows are sampled: "stratified" on the target column or "reservoir"
+
+        columns : list, default=None
+            The columns to load. The target and time columns are always loaded. All the columns are
+            loaded if None
+
+        filters : list, default=None
+            The rows to load, as (column, operator, value) conditions. See
+            readers.read_dataset
+
+        use_store : bool, default=USE_STORE
+            Whether to keep the dataset in the memory-mapped columnar store rather than in
+            process memory
+
+        streaming : bool, default=None
+            Whether to ingest the dataset in chunks straight into the columnar store. By
+            default files larger than STREAMING_THRESHOLD are streamed
+
+        id_column : str, default=None
+            The name of the column identifying the subjects, used to join the dataset with
+            other modalities
+
+        Returns
+        -------
+        None
+        """
+        if columns is not None and time_column not in columns:
+            columns = list(columns) + [time_column]
+
+        super().__init__(name, path, target_column, profile_sample_size, profile_sampling, columns, filters, use_store, streaming, id_column)
+        self.time_column = self._check_time_column(time_column)
+
+    def _check_time_column(self, time_column):
+        """
+        Checks if the time column is in the dataset
+        
+        Parameters
+        ----------
+        time_column : str
+            The name of the time column
+            
+        Returns
+        -------
+        str
+            The name of the time column
+        """
+        if time_column not in self.data.columns:
+            raise Exception("Time column not found in dataset: " + self.name)
+
+        return time_column
+
+    def _get_profile_options(self):
+        """
+        Returns the options passed to the profile report
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The profile report options
+        """
+        return {"tsmode": True, "sortby": self.time_column, "minimal": True}
+
+    def get_time(self):
+        """
+        Returns the time column
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        pandas.Series
+            The time column
+        """
+        return self.data[self.time_column]
+    
+    def get_information(self, return_profile=False, wait_profile=True):
+        """
+        Returns the dataset information
+        
+        Parameters
+        ----------
+        return_profile : bool, default=False
+            Whether to include the dataset profile in the returned information
+
+        wait_profile : bool, default=True
+            Whether to wait for a pending profile. If False, a pending profile is returned
+            as None
+
+        Returns
+        -------
+        dict
+            The dataset information
+        """
+        information = super().get_information(return_profile, wait_profile)
+        information["time_column"] = self.time_column
+
+        return information
+
+DATASET_TYPES = {
+    "Dataset": Dataset,
+    "TimeSeriesDataset": TimeSeriesDataset
+}
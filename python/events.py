@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import deque
+from typing import List
+
+##########################################################################################
+
+class Subscription():
+    """
+    A bounded buffer of events delivered to a single subscriber. When the buffer is full
+    the oldest events are dropped, so a slow subscriber can never grow server memory.
+
+    Attributes:
+    -----------
+    filters: dict
+        Only events whose fields match all of these values are delivered.
+    max_size: int
+        The maximum number of buffered events.
+    n_dropped: int
+        The number of events dropped because the buffer was full.
+    """
+
+    def __init__(self, filters: dict = None, max_size: int = 100):
+        self.filters = filters or {}
+        self.max_size = max_size
+        self.n_dropped = 0
+        self.closed = False
+        self._events = deque(maxlen=max_size)
+        self._condition = threading.Condition()
+
+    def matches(self, event: dict) -> bool:
+        """
+        Returns whether the event should be delivered to this subscriber.
+
+        Parameters:
+        -----------
+        event: dict
+            The event to check.
+        """
+        return all(event.get(key) == value for key, value in self.filters.items())
+
+    def put(self, event: dict) -> None:
+        """
+        Adds an event to the buffer, dropping the oldest event if the buffer is full.
+
+        Parameters:
+        -----------
+        event: dict
+            The event to add.
+        """
+        with self._condition:
+            if len(self._events) == self.max_size:
+                self.n_dropped += 1
+            self._events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout: float = None):
+        """
+        Returns the next event, waiting until one is available.
+
+        Parameters:
+        -----------
+        timeout: float, default=None
+            The maximum number of seconds to wait.
+
+        Returns:
+        --------
+        The next event, or None if the timeout expired or the subscription was closed.
+        """
+        with self._condition:
+            if not self._events and not self.closed:
+                self._condition.wait(timeout)
+            if not self._events:
+                return None
+            return self._events.popleft()
+
+    def close(self) -> None:
+        """
+        Closes the subscription and wakes up any waiting reader.
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+##########################################################################################
+
+class EventBroker():
+    """
+    An in-process publish/subscribe broker for structured events, e.g. training progress.
+
+    Methods:
+    --------
+    subscribe(self, filters: dict = None, max_size: int = 100) -> Subscription:
+        Registers a new subscriber.
+    unsubscribe(self, subscription: Subscription) -> None:
+        Removes a subscriber.
+    publish(self, event: dict) -> None:
+        Delivers an event to all the matching subscribers.
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, filters: dict = None, max_size: int = 100) -> Subscription:
+        """
+        Registers a new subscriber.
+
+        Parameters:
+        -----------
+        filters: dict, default=None
+            Only events whose fields match all of these values are delivered.
+        max_size: int, default=100
+            The maximum number of events buffered for the subscriber.
+
+        Returns:
+        --------
+        The Subscription object.
+        """
+        subscription = Subscription(filters, max_size)
+        with self._lock:
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Removes a subscriber.
+
+        Parameters:
+        -----------
+        subscription: Subscription
+            The subscription to remove.
+        """
+        subscription.close()
+        with self._lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+
+    def publish(self, event: dict) -> None:
+        """
+        Delivers an event to all the matching subscribers. Never blocks on slow subscribers.
+
+        Parameters:
+        -----------
+        event: dict
+            The event to publish.
+        """
+        event = {"timestamp": time.time(), **event}
+        for subscription in self.subscriptions:
+            if subscription.matches(event):
+                subscription.put(event)
+
+    @property
+    def n_subscribers(self) -> int:
+        """
+        Returns the number of subscribers.
+        """
+        return len(self.subscriptions)
+
+    def get_subscribers_information(self) -> List[dict]:
+        """
+        Returns a list containing information of all the subscribers.
+
+        Returns:
+        --------
+        A list of dictionaries containing the filters and dropped event counts.
+        """
+        return [
+            {
+                "filters": subscription.filters,
+                "max_size": subscription.max_size,
+                "n_dropped": subscription.n_dropped
+            }
+            for subscription in self.subscriptions
+        ]
+
+##########################################################################################
+
+EVENT_BROKER = EventBroker()
+
+
+def publish_event(event_type: str, **event) -> None:
+    """
+    Publishes an event on the process-wide broker.
+
+    Parameters:
+    -----------
+    event_type: str
+        The type of the event, e.g. "progress".
+    event: dict
+        The fields of the event.
+    """
+    EVENT_BROKER.publish({"type": event_type, **event})
@@ -1,7 +1,11 @@
 from typing import List
-import mlflow
+import threading
 from sklearn.metrics import *
 
+from .lazy import lazy_import
+
+mlflow = lazy_import("mlflow")
+
 ##########################################################################################
 
 SUPPORTED_METRICS = {}
@@ -19,15 +23,37 @@ classification_metrics = [
     roc_auc_score,
 ]
 
+# The descriptions are parsed from the docstrings when the metrics are first listed
 for metric in classification_metrics:
     SUPPORTED_METRICS[metric.__name__] = {
-        "description": metric.__doc__.split("Read more")[0].strip(),
         "function": metric,
         "type": "classification"
     }
 
 ##########################################################################################
 
+TRACKING_URI = "file:public/mlruns"
+EXPERIMENT_NAME = "default"
+
+_tracking_lock = threading.Lock()
+_tracking_ready = False
+
+
+def setup_tracking() -> None:
+    """
+    Points MLflow at the local tracking store and selects the default experiment. Only the
+    first call imports MLflow and does any work, so it can be called before every run.
+    """
+    global _tracking_ready
+
+    with _tracking_lock:
+        if not _tracking_ready:
+            mlflow.set_tracking_uri(TRACKING_URI)
+            mlflow.set_experiment(EXPERIMENT_NAME)
+            _tracking_ready = True
+
+##########################################################################################
+
 class ExperimentHandler():
     """
     The `ExperimentHandler` class is responsible for tracking the experiments. It allows
@@ -37,10 +63,25 @@ class ExperimentHandler():
     def __init__(self, strategy_handler):
         self.strategy_handler = strategy_handler
         self.experiments = []
-        mlflow.set_tracking_uri("file:public/mlruns")
-        mlflow.set_experiment("default")
-        self.mlflow_client = mlflow.tracking.MlflowClient()
-        self.mlflow_experiment = self.mlflow_client.get_experiment_by_name("default")
+        self._lock = threading.Lock()
+        self._mlflow_client = None
+
+    @property
+    def mlflow_client(self):
+        """
+        Returns the MLflow client, creating it on first use.
+        """
+        if self._mlflow_client is None:
+            setup_tracking()
+            self._mlflow_client = mlflow.tracking.MlflowClient()
+        return self._mlflow_client
+
+    @property
+    def mlflow_experiment(self):
+        """
+        Returns the MLflow experiment the runs are logged to.
+        """
+        return self.mlflow_client.get_experiment_by_name(EXPERIMENT_NAME)
 
     def get_supported_metrics_information(self) -> List[dict]:
         """
@@ -53,7 +94,7 @@ class ExperimentHandler():
         return [
             {
                 "name": metric_name,
-                "description": metric_info["description"],
+                "description": (metric_info["function"].__doc__ or "").split("Read more")[0].strip(),
                 "type": metric_info["type"]
             }
             for metric_name, metric_info in SUPPORTED_METRICS.items()
@@ -88,17 +129,20 @@ class ExperimentHandler():
         validation_parameters = {k: None if v == "None" else v for k, v in validation_parameters.items()}
 
         # Train model
-        training_results = self.strategy_handler.train_strategy(strategy_name, validation, validation_parameters)
-
-        self.experiments.append({
-            "name": name,
-            "type": type,
-            "parameters": parameters,
-            "metrics": metrics,
-            "results": training_results
-        })
-
-        return self.experiments
+        training_results = self.strategy_handler.train_strategy(name, strategy_name, validation, validation_parameters)
+
+        # The list is copy-on-write so that readers never see it change under them
+        with self._lock:
+            self.experiments = self.experiments + [{
+                "name": name,
+                "type": type,
+                "parameters": parameters,
+                "metrics": metrics,
+                "results": training_results
+            }]
+            experiments = self.experiments
+
+        return experiments
     
     def get_experiment_runs(self):
         """
@@ -125,6 +169,17 @@ class ExperimentHandler():
         return runs
 
 
+    def delete_run(self, run_id: str) -> None:
+        """
+        Deletes an experiment run.
+
+        Parameters:
+        -----------
+        run_id: str
+            The id of the run to delete.
+        """
+        self.mlflow_client.delete_run(run_id)
+
     def get_experiments_log(self):
         """
         Returns the experiments log.
@@ -0,0 +1,473 @@
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+##########################################################################################
+
+def _get_join_ids(ids: List[pd.Series]) -> List[np.ndarray]:
+    """
+    Returns the ids of each dataset as NumPy arrays of a common type. Ids of different kinds,
+    e.g. integers in one modality and strings in another, are compared as strings.
+    """
+    ids = [dataset_ids.to_numpy() for dataset_ids in ids]
+    if len({dataset_ids.dtype.kind for dataset_ids in ids}) > 1 or any(dataset_ids.dtype == object for dataset_ids in ids):
+        ids = [dataset_ids.astype(str) for dataset_ids in ids]
+    return ids
+
+
+def join_datasets(datasets) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Joins datasets on their id columns. See `join_frames`.
+
+    Parameters:
+    -----------
+    datasets: List[Dataset]
+        The datasets to join.
+
+    Returns:
+    --------
+    The joined ids, or None if the datasets are aligned by position, and for each dataset
+    the positions of the joined rows.
+    """
+    return join_frames([dataset.data for dataset in datasets], [dataset.id_column for dataset in datasets])
+
+
+def join_frames(frames: List[pd.DataFrame], id_columns: List[str]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Joins DataFrames on their id columns. The join is an inner sort-merge join: the rows
+    whose id is missing from any of the frames are dropped. Frames without an id column are
+    aligned by position instead, and must then have the same number of rows.
+
+    Parameters:
+    -----------
+    frames: List[pd.DataFrame]
+        The frames to join, e.g. the data of datasets.
+    id_columns: List[str]
+        The name of the id column of each frame, or None.
+
+    Returns:
+    --------
+    The joined ids, in the order of the first dataset, or None if the datasets are aligned
+    by position, and for each dataset the positions of the joined rows.
+
+    Raises:
+    -------
+    ValueError:
+        If only some of the frames have an id column, if frames aligned by position do not
+        have the same number of rows, or if no row is shared by all the frames.
+    """
+    with_ids = [id_column is not None for id_column in id_columns]
+
+    if not any(with_ids):
+        n_rows = {len(frame) for frame in frames}
+        if len(n_rows) > 1:
+            raise ValueError("Datasets without an id column must have the same number of rows")
+        positions = np.arange(n_rows.pop())
+        return None, [positions] * len(frames)
+
+    if not all(with_ids):
+        raise ValueError("Either all or none of the fused datasets must have an id column")
+
+    for frame, id_column in zip(frames, id_columns):
+        if id_column not in frame.columns:
+            raise ValueError("Id column not found: " + id_column)
+
+    ids = _get_join_ids([frame[id_column] for frame, id_column in zip(frames, id_columns)])
+    joined_ids = ids[0]
+    positions = [np.arange(len(joined_ids))]
+    for dataset_ids in ids[1:]:
+        # The ids are unique in each dataset, checked when the dataset is added
+        joined_ids, joined_index, dataset_index = np.intersect1d(joined_ids, dataset_ids, assume_unique=True, return_indices=True)
+        positions = [dataset_positions[joined_index] for dataset_positions in positions] + [dataset_index]
+
+    if len(joined_ids) == 0:
+        raise ValueError("The datasets do not share any id")
+
+    # Keeps the rows in the order of the first dataset, as with positional alignment
+    order = np.argsort(positions[0], kind="stable")
+    return joined_ids[order], [dataset_positions[order] for dataset_positions in positions]
+
+
+def _check_numeric(dataset, features: pd.DataFrame) -> None:
+    for column, dtype in features.dtypes.items():
+        if not pd.api.types.is_numeric_dtype(dtype):
+            raise ValueError(f"Feature {column} of dataset {dataset.name} is not numeric")
+
+
+def _get_numpy_dtype(features: pd.DataFrame) -> np.dtype:
+    """
+    Returns the floating point type holding all the features. Integer features are widened
+    so that missing values can be represented.
+    """
+    dtype = np.result_type(*[dtype.numpy_dtype if hasattr(dtype, "numpy_dtype") else dtype for dtype in features.dtypes])
+    return dtype if dtype.kind == "f" else np.dtype(np.float64)
+
+##########################################################################################
+
+class FusedMatrix():
+    """
+    The fused feature matrix of joined datasets. The features are stored in one column-major
+    array, in which each dataset owns a contiguous block of columns, so that the features of
+    a dataset are addressed by name as a view without copying. The array is allocated with
+    spare columns and grows geometrically, so adding a dataset only gathers its own block.
+
+    The blocks are keyed on the data keys of their datasets and kept in the order of the
+    datasets: when the matrix is synchronised with a list of datasets, only the blocks of the
+    added or changed datasets are gathered, in place of their old block, and the blocks of
+    removed datasets are dropped. All the blocks are rebuilt if the joined rows change.
+
+    Views and frames returned by the matrix stay valid: columns that were handed out are
+    never overwritten, the remaining columns are copied to a new array instead.
+
+    Attributes:
+    -----------
+    ids: np.ndarray
+        The joined ids, or None if the datasets are aligned by position.
+    target: np.ndarray
+        The encoded target of the joined rows, taken from the first dataset.
+    classes: np.ndarray
+        The sorted classes of the target.
+
+    Methods:
+    --------
+    sync(self, datasets: List[Dataset]) -> None:
+        Rebuilds the blocks of the datasets that were added, removed or changed.
+    add_block(self, name: str, features: pd.DataFrame, positions: np.ndarray, key: str = None, index: int = None) -> None:
+        Gathers the features of a dataset into a new block.
+    replace_block(self, name: str, features: pd.DataFrame, positions: np.ndarray, key: str = None) -> None:
+        Gathers the features of a dataset in place of its block.
+    remove_block(self, name: str) -> None:
+        Removes the block of a dataset.
+    get_block(self, name: str) -> np.ndarray:
+        Returns a view on the block of a dataset.
+    to_frame(self) -> pd.DataFrame:
+        Returns the fused features as a DataFrame backed by the matrix.
+    """
+
+    def __init__(self, n_rows: int = 0, ids: np.ndarray = None, index_name: str = None):
+        self._reset(n_rows, ids, index_name)
+
+    def _reset(self, n_rows: int, ids: np.ndarray, index_name: str) -> None:
+        self.ids = ids
+        self.index_name = index_name
+        self.target = None
+        self.classes = None
+        self._n_rows = n_rows
+        self._matrix = None
+        self._n_columns = 0
+        self._blocks = OrderedDict()
+        # Whether views on the columns of the array were handed out
+        self._shared = False
+
+    @property
+    def n_rows(self) -> int:
+        return self._n_rows
+
+    @property
+    def n_columns(self) -> int:
+        return self._n_columns
+
+    @property
+    def block_names(self) -> List[str]:
+        return list(self._blocks)
+
+    @property
+    def columns(self) -> List[str]:
+        """
+        The names of the fused features. Features with the same name in several blocks are
+        prefixed with the name of their block.
+        """
+        names = [column for block in self._blocks.values() for column in block["columns"]]
+        duplicated = {name for name in names if names.count(name) > 1}
+        return [
+            f"{block_name}.{column}" if column in duplicated else column
+            for block_name, block in self._blocks.items()
+            for column in block["columns"]
+        ]
+
+    def _reserve(self, n_columns: int, dtype: np.dtype) -> None:
+        """
+        Makes room for `n_columns` more columns of type `dtype`, growing the capacity of the
+        array geometrically and upcasting it if needed.
+        """
+        if self._matrix is not None:
+            dtype = np.result_type(self._matrix.dtype, dtype)
+            if self._n_columns + n_columns <= self._matrix.shape[1] and dtype == self._matrix.dtype:
+                return
+            capacity = max(2 * self._matrix.shape[1], self._n_columns + n_columns)
+        else:
+            capacity = n_columns
+
+        matrix = np.empty((self._n_rows, capacity), dtype=dtype, order="F")
+        if self._matrix is not None:
+            matrix[:, :self._n_columns] = self._matrix[:, :self._n_columns]
+        self._matrix = matrix
+        self._shared = False
+
+    def _own(self) -> None:
+        """
+        Copies the array before it is written to, if views on it were handed out.
+        """
+        if self._shared:
+            matrix = np.empty(self._matrix.shape, dtype=self._matrix.dtype, order="F")
+            matrix[:, :self._n_columns] = self._matrix[:, :self._n_columns]
+            self._matrix = matrix
+            self._shared = False
+
+    def _gather(self, start: int, features: pd.DataFrame, positions: np.ndarray) -> None:
+        for index, column in enumerate(features.columns):
+            values = features[column].to_numpy(dtype=self._matrix.dtype, na_value=np.nan)
+            np.take(values, positions, out=self._matrix[:, start + index])
+
+    def _check_block(self, name: str, positions: np.ndarray) -> None:
+        if len(positions) != self._n_rows:
+            raise ValueError("The block of " + name + " does not have the same number of rows as the fused matrix")
+
+    def add_block(self, name: str, features: pd.DataFrame, positions: np.ndarray, key: str = None, index: int = None) -> None:
+        """
+        Gathers the features of a dataset into a new block. The block is inserted before the
+        block at position `index`, shifting the following blocks right, or after the existing
+        blocks if `index` is None.
+
+        Parameters:
+        -----------
+        name: str
+            The name of the block, usually the name of the dataset.
+        features: pd.DataFrame
+            The numeric features of the dataset.
+        positions: np.ndarray
+            The positions of the joined rows in the features.
+        key: str, default=None
+            The data key of the dataset, to detect when the block is out of date.
+        index: int, default=None
+            The position of the block among the blocks.
+
+        Raises:
+        -------
+        ValueError:
+            If a block with the same name exists, or if the number of joined rows differs
+            from the number of rows of the matrix.
+        """
+        if name in self._blocks:
+            raise ValueError("Block already in fused matrix: " + name)
+        self._check_block(name, positions)
+
+        blocks = list(self._blocks.items())
+        index = len(blocks) if index is None else min(index, len(blocks))
+        start = blocks[index][1]["start"] if index < len(blocks) else self._n_columns
+        width = features.shape[1]
+
+        dtype = _get_numpy_dtype(features) if width > 0 else np.dtype(np.float64)
+        self._reserve(width, dtype)
+        if start < self._n_columns:
+            self._own()
+            self._matrix[:, start + width:self._n_columns + width] = self._matrix[:, start:self._n_columns]
+            for _, block in blocks[index:]:
+                block["start"] += width
+                block["stop"] += width
+        self._gather(start, features, positions)
+        self._n_columns += width
+
+        blocks.insert(index, (name, {"start": start, "stop": start + width, "columns": list(features.columns), "key": key}))
+        self._blocks = OrderedDict(blocks)
+
+    def replace_block(self, name: str, features: pd.DataFrame, positions: np.ndarray, key: str = None) -> None:
+        """
+        Gathers the features of a dataset in place of its block. The other blocks are only
+        moved if the number of features or their type changed.
+
+        Parameters:
+        -----------
+        name: str
+            The name of the block.
+        features: pd.DataFrame
+            The numeric features of the dataset.
+        positions: np.ndarray
+            The positions of the joined rows in the features.
+        key: str, default=None
+            The data key of the dataset.
+
+        Raises:
+        -------
+        KeyError:
+            If the block is not in the matrix.
+        ValueError:
+            If the number of joined rows differs from the number of rows of the matrix.
+        """
+        if name not in self._blocks:
+            raise KeyError("Block not found in fused matrix: " + name)
+        self._check_block(name, positions)
+
+        block = self._blocks[name]
+        dtype = _get_numpy_dtype(features) if features.shape[1] > 0 else self._matrix.dtype
+        if block["stop"] - block["start"] == features.shape[1] and np.result_type(self._matrix.dtype, dtype) == self._matrix.dtype:
+            self._own()
+            self._gather(block["start"], features, positions)
+            block["columns"] = list(features.columns)
+            block["key"] = key
+            return
+
+        index = self.block_names.index(name)
+        self.remove_block(name)
+        self.add_block(name, features, positions, key, index)
+
+    def remove_block(self, name: str) -> None:
+        """
+        Removes the block of a dataset. The blocks after it are shifted left, in place if no
+        views on the array were handed out, and in a new array otherwise.
+
+        Parameters:
+        -----------
+        name: str
+            The name of the block.
+
+        Raises:
+        -------
+        KeyError:
+            If the block is not in the matrix.
+        """
+        if name not in self._blocks:
+            raise KeyError("Block not found in fused matrix: " + name)
+
+        block = self._blocks.pop(name)
+        width = block["stop"] - block["start"]
+        if self._shared:
+            matrix = np.empty(self._matrix.shape, dtype=self._matrix.dtype, order="F")
+            matrix[:, :block["start"]] = self._matrix[:, :block["start"]]
+            self._shared = False
+        else:
+            matrix = self._matrix
+        matrix[:, block["start"]:self._n_columns - width] = self._matrix[:, block["stop"]:self._n_columns]
+        self._matrix = matrix
+        self._n_columns -= width
+
+        for other_block in self._blocks.values():
+            if other_block["start"] >= block["stop"]:
+                other_block["start"] -= width
+                other_block["stop"] -= width
+
+    def get_block_range(self, name: str) -> Tuple[int, int]:
+        """
+        Returns the start and stop columns of the block of a dataset.
+
+        Parameters:
+        -----------
+        name: str
+            The name of the block.
+        """
+        block = self._blocks[name]
+        return block["start"], block["stop"]
+
+    def get_block(self, name: str) -> np.ndarray:
+        """
+        Returns a view on the block of a dataset, without copying.
+
+        Parameters:
+        -----------
+        name: str
+            The name of the block.
+
+        Returns:
+        --------
+        The features of the dataset, as an array of shape (n_rows, n_features).
+        """
+        start, stop = self.get_block_range(name)
+        self._shared = True
+        return self._matrix[:, start:stop]
+
+    def _get_index(self) -> pd.Index:
+        if self.ids is None:
+            return pd.RangeIndex(self._n_rows)
+        return pd.Index(self.ids, name=self.index_name)
+
+    def get_block_frame(self, name: str) -> pd.DataFrame:
+        """
+        Returns the block of a dataset as a DataFrame backed by the matrix.
+
+        Parameters:
+        -----------
+        name: str
+            The name of the block.
+        """
+        return pd.DataFrame(self.get_block(name), columns=self._blocks[name]["columns"], index=self._get_index(), copy=False)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns the fused features as a DataFrame backed by the matrix, without copying.
+        """
+        if self._matrix is None:
+            return pd.DataFrame(np.empty((self._n_rows, 0)), index=self._get_index())
+        self._shared = True
+        matrix = self._matrix[:, :self._n_columns]
+        return pd.DataFrame(matrix, columns=self.columns, index=self._get_index(), copy=False)
+
+    def _same_rows(self, ids: np.ndarray, n_rows: int) -> bool:
+        if self.ids is None or ids is None:
+            return self.ids is None and ids is None and self._n_rows == n_rows
+        return len(self.ids) == len(ids) and bool(np.all(self.ids == ids))
+
+    def _reorder(self, names: List[str]) -> None:
+        """
+        Moves the blocks to the order of `names`, copying them to a new array.
+        """
+        matrix = np.empty(self._matrix.shape, dtype=self._matrix.dtype, order="F")
+        blocks = OrderedDict()
+        start = 0
+        for name in names:
+            block = self._blocks[name]
+            stop = start + block["stop"] - block["start"]
+            matrix[:, start:stop] = self._matrix[:, block["start"]:block["stop"]]
+            blocks[name] = {**block, "start": start, "stop": stop}
+            start = stop
+        self._matrix = matrix
+        self._blocks = blocks
+        self._shared = False
+
+    def sync(self, datasets) -> None:
+        """
+        Synchronises the matrix with a list of datasets. The datasets are joined on their id
+        columns; the blocks of removed datasets are dropped, the blocks of changed datasets
+        are gathered again in place and the blocks of added datasets are inserted at their
+        position, so that the blocks are in the order of the datasets. The blocks of the
+        unchanged datasets are not gathered again. The target is taken from the first dataset.
+
+        Parameters:
+        -----------
+        datasets: List[Dataset]
+            The datasets to fuse.
+
+        Raises:
+        -------
+        ValueError:
+            If the datasets cannot be joined or have non-numeric features.
+        """
+        ids, positions = join_datasets(datasets)
+        n_rows = len(positions[0])
+
+        if not self._same_rows(ids, n_rows):
+            self._reset(n_rows, ids, datasets[0].id_column)
+
+        names = [dataset.name for dataset in datasets]
+        for name in [name for name in self._blocks if name not in names]:
+            self.remove_block(name)
+
+        for index, (dataset, dataset_positions) in enumerate(zip(datasets, positions)):
+            key = dataset.get_data_key()
+            block = self._blocks.get(dataset.name)
+            if block is not None and block["key"] == key:
+                continue
+            features = dataset.get_data(drop_target=True)
+            _check_numeric(dataset, features)
+            if block is None:
+                self.add_block(dataset.name, features, dataset_positions, key, index)
+            else:
+                self.replace_block(dataset.name, features, dataset_positions, key)
+
+        if self.block_names != names:
+            self._reorder(names)
+
+        codes, self.classes = datasets[0].get_encoded_target()
+        self.target = codes[positions[0]]
+        self.target.setflags(write=False)
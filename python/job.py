@@ -0,0 +1,501 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List
+
+from .events import publish_event
+
+##########################################################################################
+
+JOB_STATUSES = ["queued", "running", "completed", "failed", "cancelled"]
+# How long finished jobs and their results are kept, in seconds, and how many are kept
+JOB_RETENTION = int(os.environ.get("NEUROGEMS_JOB_RETENTION", 3600))
+MAX_FINISHED_JOBS = int(os.environ.get("NEUROGEMS_MAX_FINISHED_JOBS", 100))
+
+_current_job = threading.local()
+
+##########################################################################################
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running job when its cancellation has been requested.
+    """
+    pass
+
+
+def get_current_job():
+    """
+    Returns the job running in the calling thread.
+
+    Returns:
+    --------
+    The Job object, or None when called outside of a job.
+    """
+    return getattr(_current_job, "job", None)
+
+
+def report_progress(**progress) -> None:
+    """
+    Reports the progress of the job running in the calling thread and publishes it as a
+    "progress" event. Outside of a job the progress is only published, so training code
+    can call it unconditionally.
+
+    Parameters:
+    -----------
+    progress: dict
+        The progress fields to update, e.g. `fold` and `n_folds`.
+
+    Raises:
+    -------
+    JobCancelled:
+        If the cancellation of the job has been requested.
+    """
+    job = get_current_job()
+    if isinstance(job, WorkerJob):
+        # Published by the process running the job, when it forwards the progress
+        job.update_progress(progress)
+    else:
+        publish_event("progress", job_id=job.id if job is not None else None, **progress)
+
+        if job is None:
+            return
+
+        job.update_progress(progress)
+
+    if job.cancel_requested:
+        raise JobCancelled(f"Job {job.id} was cancelled")
+
+def set_current_job(job) -> None:
+    """
+    Sets the job running in the calling thread, e.g. a `WorkerJob` in a worker process.
+
+    Parameters:
+    -----------
+    job: Job or WorkerJob
+        The job, or None to clear it.
+    """
+    _current_job.job = job
+
+##########################################################################################
+
+class WorkerJob():
+    """
+    Stands in for a job in the worker processes its work is spread over. The progress
+    reported in a worker is put on a queue, from which the process running the job forwards
+    it with `get_progress`, and the cancellation requested by that process is read from a
+    shared event, so that `report_progress` behaves in the workers as in the job's thread.
+
+    The queue and the event must be shared between processes, e.g. created by a
+    `multiprocessing` manager.
+
+    Attributes:
+    -----------
+    id: str
+        The id of the job, or None outside of a job.
+    """
+
+    def __init__(self, job_id: str, queue, cancel_event):
+        self.id = job_id
+        self._queue = queue
+        self._cancel_event = cancel_event
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """
+        Requests the workers to stop, at their next progress report.
+        """
+        self._cancel_event.set()
+
+    def update_progress(self, progress: dict) -> None:
+        """
+        Queues progress fields reported in a worker.
+
+        Parameters:
+        -----------
+        progress: dict
+            The progress fields to update.
+        """
+        self._queue.put(progress)
+
+    def get_progress(self) -> List[dict]:
+        """
+        Returns the progress queued by the workers since the last call, in order.
+        """
+        progress = []
+        while True:
+            try:
+                progress.append(self._queue.get_nowait())
+            except queue.Empty:
+                return progress
+
+##########################################################################################
+
+class Job():
+    """
+    A unit of work submitted to the `JobHandler`.
+
+    Attributes:
+    -----------
+    id: str
+        The unique identifier of the job.
+    type: str
+        The type of the job, e.g. "train_strategy" or "run_experiment".
+    name: str
+        The name of the job.
+    status: str
+        One of `JOB_STATUSES`.
+    progress: dict
+        The latest progress reported by the job.
+    results: Any
+        The results of the job once completed.
+    error: str
+        The error message if the job failed.
+    """
+
+    def __init__(self, job_type: str, job_name: str):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.name = job_name
+        self.status = "queued"
+        self.progress = {}
+        self.results = None
+        self.error = None
+        self.cancel_requested = False
+        self.future = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def queue_time(self) -> float:
+        """
+        Returns the number of seconds the job waited in the queue.
+        """
+        if self.started_at is None:
+            return (self.finished_at or time.time()) - self.submitted_at
+        return self.started_at - self.submitted_at
+
+    @property
+    def run_time(self) -> float:
+        """
+        Returns the number of seconds the job has been running for.
+        """
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def done(self) -> bool:
+        """
+        Returns whether the job has reached a final status.
+        """
+        return self.status in ["completed", "failed", "cancelled"]
+
+    def update_progress(self, progress: dict) -> None:
+        """
+        Merges the given fields into the progress of the job.
+
+        Parameters:
+        -----------
+        progress: dict
+            The progress fields to update.
+        """
+        with self._lock:
+            self.progress = {**self.progress, **progress}
+
+    def get_information(self) -> dict:
+        """
+        Returns a dictionary containing information about the job.
+
+        Returns:
+        --------
+        A dictionary containing the status, progress and timings of the job.
+        """
+        with self._lock:
+            progress = dict(self.progress)
+
+        return {
+            "id": self.id,
+            "type": self.type,
+            "name": self.name,
+            "status": self.status,
+            "progress": progress,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_time": self.queue_time,
+            "run_time": self.run_time,
+        }
+
+##########################################################################################
+
+class JobHandler():
+    """
+    Runs long running tasks, such as training a strategy, on a bounded pool of worker
+    threads so that request handlers can return immediately.
+
+    Attributes:
+    -----------
+    jobs: dict
+        A dictionary mapping job ids to their corresponding Job objects. The dictionary is
+        replaced rather than mutated, so readers can iterate it without locking.
+    max_workers: int
+        The number of jobs that can run at the same time.
+    max_pending: int
+        The number of jobs that can be queued or running at the same time.
+    retention: int
+        The number of seconds finished jobs are kept for, with their results.
+    max_finished: int
+        The number of finished jobs kept. The jobs that finished first are removed first.
+
+    Methods:
+    --------
+    submit_job(self, job_type: str, job_name: str, function: Callable, *args, **kwargs) -> str:
+        Queues a new job and returns its id.
+    get_job_information(self, job_id: str) -> dict:
+        Returns the status, progress and timings of a job.
+    get_job_results(self, job_id: str) -> Any:
+        Returns the results of a completed job.
+    cancel_job(self, job_id: str) -> dict:
+        Requests the cancellation of a job.
+    """
+
+    def __init__(self, max_workers: int = 1, max_pending: int = 16, retention: int = JOB_RETENTION, max_finished: int = MAX_FINISHED_JOBS):
+        # MLflow's fluent API tracks the active run globally, so jobs run one at a time
+        # unless explicitly configured otherwise.
+        self.jobs = {}
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+
+    def submit_job(self, job_type: str, job_name: str, function: Callable, *args, **kwargs) -> str:
+        """
+        Queues a new job.
+
+        Parameters:
+        -----------
+        job_type: str
+            The type of the job.
+        job_name: str
+            The name of the job.
+        function: Callable
+            The function to run. Its return value becomes the results of the job.
+
+        Returns:
+        --------
+        The id of the job.
+
+        Raises:
+        -------
+        Exception:
+            If the maximum number of pending jobs has been reached.
+        """
+        with self._lock:
+            self._evict_finished_jobs()
+            n_pending = len([job for job in self.jobs.values() if not job.done])
+            if n_pending >= self.max_pending:
+                raise Exception("Too many pending jobs, please wait for a job to finish.")
+
+            job = Job(job_type, job_name)
+            self.jobs = {**self.jobs, job.id: job}
+            job.future = self._executor.submit(self._run_job, job, function, *args, **kwargs)
+
+        return job.id
+
+    def _run_job(self, job: Job, function: Callable, *args, **kwargs) -> None:
+        """
+        Runs a job in the calling worker thread and records its outcome.
+
+        Parameters:
+        -----------
+        job: Job
+            The job to run.
+        function: Callable
+            The function to run.
+        """
+        job.started_at = time.time()
+
+        if job.cancel_requested:
+            job.status = "cancelled"
+            job.finished_at = job.started_at
+            return
+
+        job.status = "running"
+        _current_job.job = job
+
+        try:
+            job.results = function(*args, **kwargs)
+            job.status = "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            _current_job.job = None
+            job.finished_at = time.time()
+            publish_event("job", job_id=job.id, status=job.status, error=job.error, run_time=job.run_time)
+
+        with self._lock:
+            self._evict_finished_jobs()
+
+    def _evict_finished_jobs(self) -> None:
+        """
+        Removes the jobs, and their results, that finished more than `retention` seconds
+        ago, then the jobs that finished first beyond `max_finished`. Must be called with
+        the lock held.
+        """
+        finished = sorted((job for job in self.jobs.values() if job.done and job.finished_at is not None), key=lambda job: job.finished_at)
+        now = time.time()
+        evicted = {job.id for job in finished if now - job.finished_at > self.retention}
+        evicted.update(job.id for job in finished[:max(0, len(finished) - self.max_finished)])
+
+        if evicted:
+            self.jobs = {job_id: job for job_id, job in self.jobs.items() if job_id not in evicted}
+
+    def get_job(self, job_id: str) -> Job:
+        """
+        Returns the Job object for the given job id.
+
+        Parameters:
+        -----------
+        job_id: str
+            The id of the job.
+
+        Returns:
+        --------
+        The Job object.
+
+        Raises:
+        -------
+        KeyError:
+            If the job id is not found.
+        """
+        jobs = self.jobs
+        if job_id not in jobs:
+            raise KeyError("Job not found: " + str(job_id))
+
+        return jobs[job_id]
+
+    def get_job_information(self, job_id: str) -> dict:
+        """
+        Returns the status, progress and timings of a job.
+
+        Parameters:
+        -----------
+        job_id: str
+            The id of the job.
+
+        Returns:
+        --------
+        A dictionary containing information about the job.
+        """
+        return self.get_job(job_id).get_information()
+
+    def get_jobs_information(self) -> List[dict]:
+        """
+        Returns a list containing information of all the jobs, most recent first.
+
+        Returns:
+        --------
+        A list of dictionaries containing information about the jobs.
+        """
+        jobs = sorted(self.jobs.values(), key=lambda job: job.submitted_at, reverse=True)
+        return [job.get_information() for job in jobs]
+
+    def get_job_results(self, job_id: str) -> Any:
+        """
+        Returns the results of a completed job.
+
+        Parameters:
+        -----------
+        job_id: str
+            The id of the job.
+
+        Returns:
+        --------
+        The results of the job.
+
+        Raises:
+        -------
+        Exception:
+            If the job has not completed.
+        """
+        job = self.get_job(job_id)
+
+        if job.status != "completed":
+            raise Exception(f"Job {job_id} is {job.status}" + (f": {job.error}" if job.error else ""))
+
+        return job.results
+
+    def cancel_job(self, job_id: str) -> dict:
+        """
+        Requests the cancellation of a job. Queued jobs are cancelled immediately, running
+        jobs stop at the next progress report.
+
+        Parameters:
+        -----------
+        job_id: str
+            The id of the job.
+
+        Returns:
+        --------
+        A dictionary containing information about the job.
+        """
+        job = self.get_job(job_id)
+
+        if not job.done:
+            job.cancel_requested = True
+            if job.future is not None and job.future.cancel():
+                job.status = "cancelled"
+                job.finished_at = time.time()
+
+        return job.get_information()
+
+    def rm_job(self, job_id: str) -> None:
+        """
+        Removes a finished job and its results.
+
+        Parameters:
+        -----------
+        job_id: str
+            The id of the job.
+
+        Raises:
+        -------
+        Exception:
+            If the job has not finished yet.
+        """
+        job = self.get_job(job_id)
+
+        if not job.done:
+            raise Exception("Cannot remove a job that has not finished: " + job_id)
+
+        with self._lock:
+            self.jobs = {other_id: job for other_id, job in self.jobs.items() if other_id != job_id}
+
+    def shutdown(self, wait: bool = False) -> None:
+        """
+        Cancels all pending jobs and stops the worker pool.
+
+        Parameters:
+        -----------
+        wait: bool, default=False
+            Whether to wait for the running jobs to finish.
+        """
+        for job in self.jobs.values():
+            if not job.done:
+                self.cancel_job(job.id)
+
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,83 @@
+import importlib
+import sys
+import types
+
+##########################################################################################
+
+class LazyModule(types.ModuleType):
+    """
+    A stand-in for a module that is imported on first attribute access. Used for heavy
+    libraries, such as mlflow or shap, that are not needed to start the backend.
+
+    Example:
+    --------
+    shap = LazyModule("shap")
+    shap.Explainer(...)  # shap is imported here
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        """
+        Imports the underlying module, once.
+
+        Returns:
+        --------
+        The imported module.
+        """
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Returns the module if it has already been imported, or a LazyModule otherwise.
+
+    Parameters:
+    -----------
+    name: str
+        The fully qualified name of the module, e.g. "matplotlib.pyplot".
+
+    Returns:
+    --------
+    The module or its lazy stand-in.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def lazy_class(module_name: str, class_name: str):
+    """
+    Returns a factory that imports the module and instantiates the class when called, so
+    that the class can be listed (e.g. in `SUPPORTED_MODELS`) without importing it.
+
+    Parameters:
+    -----------
+    module_name: str
+        The name of the module defining the class.
+    class_name: str
+        The name of the class.
+
+    Returns:
+    --------
+    A callable with the same signature as the class constructor.
+    """
+    def factory(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), class_name)(*args, **kwargs)
+
+    factory.__name__ = class_name
+    factory.__qualname__ = class_name
+    factory.__module__ = module_name
+    return factory
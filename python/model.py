@@ -1,5 +1,5 @@
 import numpy as np
-import pickle, os
+import copy, json, pickle, os, shutil, time, types
 import sklearn
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.linear_model import LogisticRegression
@@ -7,14 +7,25 @@ from sklearn.model_selection import train_test_split, KFold, StratifiedKFold, Le
 from sklearn.neighbors import KNeighborsClassifier, KNeighborsRegressor, RadiusNeighborsClassifier, RadiusNeighborsRegressor
 from sklearn.svm import SVC, SVR
 from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
-from xgboost import XGBClassifier, XGBRegressor
-import mlflow
-import shap
-from matplotlib import pyplot as plt
 # from tensorflow import keras
-from .data import Dataset
+from .cache import get_current_directory, make_temporary_directory, remove_old_versions, replace_directory
+from .job import report_progress
+from .lazy import lazy_class, lazy_import
 from .models import WWKNNClassifier, ESNClassifier
 
+mlflow = lazy_import("mlflow")
+shap = lazy_import("shap")
+plt = lazy_import("matplotlib.pyplot")
+joblib = lazy_import("joblib")
+pa = lazy_import("pyarrow")
+
+# Fitted arrays of at least this many kilobytes are saved as separate NumPy files, which
+# are memory-mapped when the model is loaded instead of being read and decompressed
+MMAP_MIN_SIZE = int(os.environ.get("NEUROGEMS_MMAP_MIN_SIZE", 64)) * 1024
+
+# The joblib compression level of the rest of a saved model, from 0 to 9
+MODEL_COMPRESSION = int(os.environ.get("NEUROGEMS_MODEL_COMPRESSION", 3))
+
 ##########################################################################################
 
 SUPPORTED_MODELS = {
@@ -99,8 +110,8 @@ SUPPORTED_MODELS = {
         "description": "XGBoost (GBDT)",
         "group": "Tree",
         "library": "xgboost",
-        "classifier": XGBClassifier,
-        "regressor": XGBRegressor,
+        "classifier": lazy_class("xgboost", "XGBClassifier"),
+        "regressor": lazy_class("xgboost", "XGBRegressor"),
         "params": {
             "n_estimators": [100, 200, 300, 400, 500],
             "max_depth": [1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
@@ -222,6 +233,8 @@ class ModelHandler():
         self.models = {}
         self.model_names = []
         self.n_models = 0
+        # The last training of each model, as (training key, trained model, results)
+        self._trainings = {}
 
 
     def get_supported_models_information(self, group=None, library=None):
@@ -332,11 +345,102 @@ class ModelHandler():
         None
         """
         self.models.pop(model_name)
+        self._trainings.pop(model_name, None)
         self.model_names.remove(model_name)
         self.n_models -= 1
 
 
-    def train_model(self, model_name, data, target, validation_type, validation_params, return_predictions=False):
+    def get_training_key(self, model_name, data_key, validation_type, validation_params, return_predictions=False):
+        """
+        Get the key of a training of a model: its type and parameters, the data it is trained
+        on and the split plan. Two trainings with the same key give the same results.
+
+        Parameters
+        ----------
+        model_name: str
+            The name of the model.
+
+        data_key: str
+            A key identifying the data and the target, e.g. built from the data keys of the
+            datasets.
+
+        validation_type: str
+            The type of validation.
+
+        validation_params: dict
+            The parameters of the validation strategy.
+
+        return_predictions: bool
+            Whether the predictions of the model are returned.
+
+        Returns
+        -------
+        key: str
+            The training key, or None if the split is random, in which case the training
+            is not repeatable.
+        """
+        shuffle = validation_params.get("shuffle", validation_type == "holdout")
+        if shuffle and validation_params.get("random_state") is None:
+            return None
+
+        model = self.models[model_name]
+        return json.dumps([model.type, model.params, data_key, validation_type, validation_params, return_predictions], sort_keys=True, default=str)
+
+
+    def get_trained_model(self, model_name, training_key):
+        """
+        Get the results of the last training of a model if it had the same key. The model
+        trained then is restored, e.g. after the model was added again with the same type
+        and parameters.
+
+        Parameters
+        ----------
+        model_name: str
+            The name of the model.
+
+        training_key: str
+            The training key, from get_training_key.
+
+        Returns
+        -------
+        results: dict
+            A copy of the results of the training, or None if the model must be trained.
+        """
+        training = self._trainings.get(model_name)
+        if training_key is None or training is None or training[0] != training_key:
+            return None
+
+        self.models[model_name] = training[1]
+        return dict(training[2])
+
+
+    def set_trained_model(self, model_name, training_key, model, results):
+        """
+        Record the last training of a model, and replace the model by the trained one, e.g.
+        a copy trained in a worker process.
+
+        Parameters
+        ----------
+        model_name: str
+            The name of the model.
+
+        training_key: str
+            The training key, from get_training_key.
+
+        model: MLModel
+            The trained model.
+
+        results: dict
+            The results of the training.
+        """
+        self.models[model_name] = model
+        if training_key is None:
+            self._trainings.pop(model_name, None)
+        else:
+            self._trainings[model_name] = (training_key, model, dict(results))
+
+
+    def train_model(self, model_name, data, target, validation_type, validation_params, return_predictions=False, labels=None, data_key=None):
         """
         Train a model.
 
@@ -360,14 +464,73 @@ class ModelHandler():
         return_predictions: bool
             Whether to return the predictions of the model.
 
+        labels: numpy.ndarray, default=None
+            The sorted classes, if the target is already encoded as integers.
+
+        data_key: str, default=None
+            A key identifying the data and the target. If given, the model is only trained
+            again if its type or parameters, the data or the split plan changed since its
+            last training.
+
         Returns
         -------
         results: dict
             A dictionary containing the results of the training.
         """
+        training_key = self.get_training_key(model_name, data_key, validation_type, validation_params, return_predictions) if data_key is not None else None
+        results = self.get_trained_model(model_name, training_key)
+        if results is not None:
+            report_progress(model=model_name, stage="cached")
+            self.models[model_name].log_params(results["labels"])
+            return results
+
+        results = self.models[model_name].train(data, target, validation_type, validation_params, return_predictions, labels)
+        self.set_trained_model(model_name, training_key, self.models[model_name], results)
+        return dict(results)
+
+    def predict(self, model_name, data, with_probability=False):
+        """
+        Predict the output of a trained model for the given data.
 
-        results = self.models[model_name].train(data, target, validation_type, validation_params, return_predictions)
-        return results
+        Parameters
+        ----------
+        model_name: str
+            The name of the model.
+
+        data: array-like
+            The data to predict, with the features the model was trained on.
+
+        with_probability: bool, default=False
+            Whether to return the probabilities of the predicted labels or not.
+
+        Returns
+        -------
+        results: dict
+            A dictionary containing the results of the prediction.
+        """
+        return self.models[model_name].predict(data, with_probability)
+
+    def predict_probabilities(self, model_name, data, n_classes):
+        """
+        Predict the probabilities of all the classes with a trained model.
+
+        Parameters
+        ----------
+        model_name: str
+            The name of the model.
+
+        data: array-like
+            The data to predict, with the features the model was trained on.
+
+        n_classes: int
+            The number of classes of the encoded target.
+
+        Returns
+        -------
+        probabilities: numpy.ndarray
+            Float32 array of shape (n_samples, n_classes).
+        """
+        return self.models[model_name]._predict_probabilities(data, n_classes)
 
     def save_model(self, model_name, path):
         """
@@ -389,7 +552,8 @@ class ModelHandler():
 
     def load_model(self, model_name, path):
         """
-        Load a model.
+        Load a model, replacing the model with the same name. The results of its training
+        are not loaded, see MLModel.load_results.
 
         Parameters
         ----------
@@ -403,7 +567,96 @@ class ModelHandler():
         -------
         None
         """
-        self.models[model_name].load(path)
+        model = MLModel.load(path)
+        if model_name not in self.models:
+            self.model_names.append(model_name)
+            self.n_models += 1
+        self.models[model_name] = model
+        self._trainings.pop(model_name, None)
+
+
+##########################################################################################
+
+class _ArrayReference():
+    """
+    Stands for a fitted array saved in its own NumPy file, in the pickled skeleton of a
+    model.
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+
+def _is_state_object(value):
+    """Returns whether the attributes of a value may hold fitted arrays, e.g. an estimator
+    or the network of an ESN."""
+    return hasattr(value, '__dict__') and not isinstance(value, (type, types.ModuleType, types.FunctionType, types.MethodType))
+
+
+def _split_arrays(obj, arrays, prefix='', depth=2):
+    """Returns a shallow copy of an object in which the large fitted arrays are replaced by
+    references, down to `depth` levels of nested objects. The object itself is not
+    changed.
+
+    Parameters
+    ----------
+    obj : object
+        The object, e.g. an estimator.
+
+    arrays : dict
+        The arrays replaced, by key, filled by this function.
+
+    prefix : str, default=''
+        The prefix of the keys of the arrays.
+
+    depth : int, default=2
+        The number of levels of nested objects to search.
+
+    Returns
+    -------
+    obj : object
+        The object, or a copy of it if arrays were replaced.
+    """
+    replaced = {}
+    for name, value in vars(obj).items():
+        key = prefix + name
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject and value.nbytes >= MMAP_MIN_SIZE:
+            arrays[key] = value
+            replaced[name] = _ArrayReference(key)
+        elif depth > 0 and _is_state_object(value):
+            split_value = _split_arrays(value, arrays, key + '.', depth - 1)
+            if split_value is not value:
+                replaced[name] = split_value
+
+    if not replaced:
+        return obj
+
+    obj = copy.copy(obj)
+    vars(obj).update(replaced)
+    return obj
+
+
+def _restore_arrays(obj, directory, depth=2):
+    """Replaces the array references of a loaded skeleton by the arrays saved in
+    `directory`, memory-mapped read-only."""
+    for name, value in vars(obj).items():
+        if isinstance(value, _ArrayReference):
+            setattr(obj, name, np.load(os.path.join(directory, value.key + '.npy'), mmap_mode='r'))
+        elif depth > 0 and _is_state_object(value):
+            _restore_arrays(value, directory, depth - 1)
+
+
+def _write_table(path, columns, metadata=None):
+    """Writes columns to an uncompressed Arrow IPC file, which is memory-mapped when read."""
+    table = pa.table(columns, metadata=metadata)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path):
+    """Reads an Arrow IPC file through a memory map."""
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
 
 
 ##########################################################################################
@@ -525,7 +778,7 @@ class MLModel():
         return self.model
         
 
-    def train(self, data, target, validation_type:str, validation_params:dict={}, return_predictions:bool=False):
+    def train(self, data, target, validation_type:str, validation_params:dict={}, return_predictions:bool=False, labels=None):
         """Trains the model for the given data.
 
         Parameters
@@ -545,14 +798,23 @@ class MLModel():
         return_predictions : bool, default=False
             Whether to return the predictions.
 
+        labels : array-like, default=None
+            The sorted classes, if the target is already encoded as integers, e.g. by
+            Dataset.get_encoded_target. Otherwise the target is encoded here.
+
         Returns
         -------
         results : dict
             Dictionary containing the results of the training.
         """
         X = data
-        label_encoder = sklearn.preprocessing.LabelEncoder()
-        y = label_encoder.fit_transform(target)
+        start_time = time.time()
+        if labels is None:
+            label_encoder = sklearn.preprocessing.LabelEncoder()
+            y = label_encoder.fit_transform(target)
+            labels = label_encoder.classes_
+        else:
+            y = np.asarray(target)
         
         if self.library == 'sklearn' or self.library == 'xgboost' or self.library == 'sklearn-compatible':
             for param in self.model.get_params().keys():
@@ -560,7 +822,9 @@ class MLModel():
 
         # Split the dataset into train and test
         if validation_type == 'holdout':
-            X_train, X_test, y_train, y_test = SUPPORTED_VALIDATIONS[validation_type]["function"](X, y, **validation_params)
+            # The positions are split along, the split itself is the same
+            X_train, X_test, y_train, y_test, _, test_index = SUPPORTED_VALIDATIONS[validation_type]["function"](X, y, np.arange(len(y)), **validation_params)
+            report_progress(model=self.name, stage="training", fold=0, n_folds=1)
 
             # Use the library's functions for training
             if self.library == 'sklearn' or self.library == 'xgboost' or self.library == 'sklearn-compatible':
@@ -568,18 +832,24 @@ class MLModel():
                     self.model.set_params(**{'probability': True})
                 self.model.fit(X_train, y_train)
                 y_pred = self.model.predict(X_test).tolist()
-                X_actual, y_actual = X_test, y_test.tolist()
+                y_actual = y_test.tolist()
                 if return_predictions:
-                    y_prob = self.model.predict_proba(X_test).tolist()
+                    y_prob = self._predict_probabilities(X_test, len(labels))
+                    test_indices = [test_index]
+
+            report_progress(model=self.name, stage="training", fold=1, n_folds=1,
+                            accuracy=float(np.mean(np.array(y_pred) == np.array(y_actual))) * 100, eta=0.0)
 
         else:
             if validation_type not in SUPPORTED_VALIDATIONS:
                 raise Exception("Validation type not supported.")
 
             cv = SUPPORTED_VALIDATIONS[validation_type]["function"](**validation_params)
-            y_pred, X_actual, y_actual, y_prob = [], [], [], []
+            y_pred, y_actual, y_prob, test_indices = [], [], [], []
+            n_folds = cv.get_n_splits(X)
+            report_progress(model=self.name, stage="training", fold=0, n_folds=n_folds)
 
-            for train_index, test_index in cv.split(X):
+            for fold, (train_index, test_index) in enumerate(cv.split(X)):
                 X_train, X_test = X.iloc[train_index], X.iloc[test_index]
                 y_train, y_test = y[train_index], y[test_index]
                 
@@ -592,17 +862,23 @@ class MLModel():
                         self.model.set_params(**{'probability': True})
                     self.model.fit(X_train, y_train)
                     y_pred.extend(self.model.predict(X_test).tolist())
-                    X_actual.extend(X_test.values.tolist())
                     y_actual.extend(y_test.tolist())
                     if return_predictions:
-                        y_prob.extend(self.model.predict_proba(X_test).tolist())
+                        y_prob.append(self._predict_probabilities(X_test, len(labels)))
+                        test_indices.append(test_index)
 
                 # elif self.model_type == 'keras':
                 #     self.model.compile(loss="categorical_crossentropy", optimizer="adam", metrics=["accuracy"])
                 #     self.model.fit(X_train, y_train, batch_size=self.keras_params['batch_size'], epochs=self.keras_params['epochs'], validation_split=self.keras_params['validation_split'])
 
+                elapsed_time = time.time() - start_time
+                report_progress(model=self.name, stage="training", fold=fold + 1, n_folds=n_folds,
+                                accuracy=float(np.mean(np.array(y_pred) == np.array(y_actual))) * 100,
+                                eta=elapsed_time / (fold + 1) * (n_folds - fold - 1))
+
         # Compute SHAP values
         shap_values = []
+        report_progress(model=self.name, stage="explaining")
         if self.library == 'sklearn' or self.library == 'xgboost' or self.library == 'sklearn-compatible':
             explainer = shap.Explainer(self.model.predict, X_train)
             shap_values = explainer(X)
@@ -615,18 +891,72 @@ class MLModel():
             #     shap.plots.bar(shap_values, show=False)
             # self._log_image_artifact(plot_feature_importance, "shap_feature_importance_plot")
 
+        # The model kept for prediction is fitted on all the data, the folds above only
+        # evaluate it. Fitting again starts from scratch and keeps the parameters set for
+        # the training, e.g. the probabilities
+        if self.library == 'sklearn' or self.library == 'xgboost' or self.library == 'sklearn-compatible':
+            report_progress(model=self.name, stage="refitting")
+            self.model.fit(X, y)
+
         # Store the results
         self.results = {}
-        self.results['labels'] = label_encoder.classes_.tolist()
+        self.results['labels'] = np.asarray(labels).tolist()
         mlflow.log_param('labels', self.results['labels'])
         self.results['predictions'] = y_pred
         self.results['target'] = y_actual
         self.results['shap_values'] = shap_values
         if return_predictions:
-            self.results['probabilities'] = y_prob
+            # The out-of-sample probabilities, with the ids of their rows: the index of X if
+            # it is a DataFrame, otherwise the positions of the rows
+            test_index = np.concatenate(test_indices)
+            self.results['probabilities'] = np.concatenate(y_prob) if isinstance(y_prob, list) else y_prob
+            self.results['row_ids'] = X.index.to_numpy()[test_index] if hasattr(X, 'index') else test_index
         
         return self.results
+
+    def _predict_probabilities(self, X, n_classes:int):
+        """Predicts the probabilities of all the classes for the given data.
+
+        Parameters
+        ----------
+        X : array-like
+            Data to be used for prediction.
+
+        n_classes : int
+            The number of classes of the encoded target.
+
+        Returns
+        -------
+        probabilities : numpy.ndarray
+            Float32 array of shape (n_samples, n_classes). Classes missing from the training
+            data, e.g. in a fold, have a probability of 0.
+        """
+        probabilities = self.model.predict_proba(X)
+        if probabilities.shape[1] == n_classes:
+            return probabilities.astype(np.float32, copy=False)
+
+        all_probabilities = np.zeros((probabilities.shape[0], n_classes), dtype=np.float32)
+        all_probabilities[:, self.model.classes_] = probabilities
+        return all_probabilities
         
+    def log_params(self, labels):
+        """Logs the parameters of the model and the classes to the active MLflow run, as a
+        training does, e.g. when the results of a previous training are reused.
+
+        Parameters
+        ----------
+        labels : array-like
+            The sorted classes.
+
+        Returns
+        -------
+        None
+        """
+        if self.library == 'sklearn' or self.library == 'xgboost' or self.library == 'sklearn-compatible':
+            for param in self.model.get_params().keys():
+                mlflow.log_param(param, self.model.get_params()[param])
+        mlflow.log_param('labels', np.asarray(labels).tolist())
+
     def predict(self, X, with_probability:bool=False):
         """Predicts the output for the given data.
 
@@ -660,7 +990,17 @@ class MLModel():
         return results
 
     def save(self, path:str):
-        """Saves the MLModel object to the given path.
+        """Saves the MLModel object to a directory at the given path, replacing it if it
+        exists. The path is a versioned directory, see cache.replace_directory, whose
+        versions hold:
+
+        - model.joblib: the model without its results, compressed with joblib,
+        - arrays/: the large fitted arrays, e.g. the training data of WWKNN or the weights
+          of an ESN, as NumPy files that are memory-mapped when the model is loaded,
+        - results.arrow: the predictions, targets and probabilities of the training,
+        - explanations.arrow: the SHAP values of the training.
+
+        The results and explanations are columnar files, only read by load_results.
 
         Parameters
         ----------
@@ -671,12 +1011,71 @@ class MLModel():
         -------
         None
         """
-        with open(path, 'wb') as f:
-            pickle.dump(self, f)
+        temporary_path = make_temporary_directory(path)
+        try:
+            os.makedirs(os.path.join(temporary_path, 'arrays'))
+            arrays = {}
+            skeleton = copy.copy(self)
+            skeleton.results = None
+            skeleton.model = _split_arrays(self.model, arrays)
+            for key, array in arrays.items():
+                np.save(os.path.join(temporary_path, 'arrays', key + '.npy'), np.ascontiguousarray(array))
+            joblib.dump(skeleton, os.path.join(temporary_path, 'model.joblib'), compress=MODEL_COMPRESSION)
+
+            results = getattr(self, 'results', None)
+            if results:
+                self._save_results(results, temporary_path)
+
+            replace_directory(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                shutil.rmtree(temporary_path, ignore_errors=True)
+        remove_old_versions(path)
+
+    @staticmethod
+    def _save_results(results, directory):
+        """Saves the results of a training as columnar files.
+
+        Parameters
+        ----------
+        results : dict
+            The results of the training.
+
+        directory : str
+            The directory of the saved model.
+
+        Returns
+        -------
+        None
+        """
+        columns = {'prediction': np.asarray(results['predictions']), 'target': np.asarray(results['target'])}
+        if results.get('probabilities') is not None:
+            for index in range(results['probabilities'].shape[1]):
+                columns['probability_' + str(index)] = results['probabilities'][:, index]
+        if results.get('row_ids') is not None:
+            columns['row_id'] = np.asarray(results['row_ids'])
+        _write_table(os.path.join(directory, 'results.arrow'), columns, {'labels': json.dumps(results['labels'], default=str)})
+
+        shap_values = results.get('shap_values')
+        if shap_values is not None and len(shap_values) > 0:
+            values = np.asarray(shap_values.values)
+            values = values.reshape(len(values), -1)
+            feature_names = list(shap_values.feature_names) if shap_values.feature_names is not None else []
+            if len(feature_names) != values.shape[1]:
+                feature_names = ['shap_' + str(index) for index in range(values.shape[1])]
+            columns = {str(name): values[:, index] for index, name in enumerate(feature_names)}
+            metadata = {'feature_names': json.dumps(feature_names, default=str)}
+            base_values = np.asarray(shap_values.base_values)
+            if base_values.ndim == 1 and len(base_values) == len(values):
+                columns['__base_value__'] = base_values
+            _write_table(os.path.join(directory, 'explanations.arrow'), columns, metadata)
 
     @staticmethod
     def load(path:str):
-        """Loads the MLModel object from the given path.
+        """Loads the MLModel object from the given path. The large fitted arrays are
+        memory-mapped read-only, so they are shared by all the processes loading the model.
+        The results are not loaded, see load_results. Models saved as a single pickle file
+        are still supported.
 
         Parameters
         ----------
@@ -688,10 +1087,58 @@ class MLModel():
         model : MLModel
             MLModel object loaded.
         """
-        with open(path, 'rb') as f:
-            model = pickle.load(f)
+        path = get_current_directory(path)
+        if not os.path.isdir(path):
+            with open(path, 'rb') as f:
+                model = pickle.load(f)
+            return model
+
+        model = joblib.load(os.path.join(path, 'model.joblib'))
+        _restore_arrays(model.model, os.path.join(path, 'arrays'))
         return model
 
+    @staticmethod
+    def load_results(path:str):
+        """Loads the results of the training of a saved model.
+
+        Parameters
+        ----------
+        path : str
+            Path of the saved model.
+
+        Returns
+        -------
+        results : dict
+            Dictionary containing the results of the training, or None if they were not
+            saved. The SHAP values are only loaded as a shap Explanation if they were saved.
+        """
+        path = get_current_directory(path)
+        if not os.path.isdir(path):
+            return getattr(MLModel.load(path), 'results', None)
+        if not os.path.exists(os.path.join(path, 'results.arrow')):
+            return None
+
+        table = _read_table(os.path.join(path, 'results.arrow'))
+        results = {
+            'labels': json.loads(table.schema.metadata[b'labels']),
+            'predictions': table.column('prediction').to_pylist(),
+            'target': table.column('target').to_pylist(),
+        }
+        probability_columns = [name for name in table.column_names if name.startswith('probability_')]
+        if probability_columns:
+            results['probabilities'] = np.column_stack([table.column(name).to_numpy() for name in probability_columns])
+        if 'row_id' in table.column_names:
+            results['row_ids'] = table.column('row_id').to_numpy()
+
+        if os.path.exists(os.path.join(path, 'explanations.arrow')):
+            table = _read_table(os.path.join(path, 'explanations.arrow'))
+            feature_names = json.loads(table.schema.metadata[b'feature_names'])
+            values = np.column_stack([table.column(str(name)).to_numpy() for name in feature_names])
+            base_values = table.column('__base_value__').to_numpy() if '__base_value__' in table.column_names else None
+            results['shap_values'] = shap.Explanation(values, base_values=base_values, feature_names=feature_names)
+
+        return results
+
     def __str__(self):
         """Returns the string representation of the MLModel object.
 
@@ -704,4 +1151,4 @@ class MLModel():
         str
             String representation of the MLModel object.
         """
-        return f"Name: {self.name}\nType: {self.type}\nParameters: {self.params}\nResults: {self.results}"
\ No newline at end of file
+        return f"Name: {self.name}\nType: {self.type}\nParameters: {self.params}\nResults: {getattr(self, 'results', None)}"
\ No newline at end of file
@@ -0,0 +1,304 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+##########################################################################################
+
+# Datasets with more rows than this are profiled on a sample. 0 disables sampling.
+PROFILE_SAMPLE_SIZE = int(os.environ.get("NEUROGEMS_PROFILE_SAMPLE_SIZE", 100000))
+
+PROFILE_SAMPLINGS = ["stratified", "reservoir"]
+
+# Above this number of classes, a stratified sample falls back to a uniform one
+MAX_STRATA = 100
+
+# The stratum of rows with a missing class
+MISSING_CLASS = "<missing>"
+
+##########################################################################################
+
+class StreamingStatistics():
+    """
+    Exact statistics that can be computed one chunk of rows at a time: the number of rows,
+    the number of missing values per column, the minimum and maximum of numeric columns
+    and the memory size. Statistics of separate chunks can be merged.
+
+    Methods:
+    --------
+    update(self, chunk: pd.DataFrame) -> None:
+        Adds a chunk of rows to the statistics.
+    merge(self, other: StreamingStatistics) -> None:
+        Adds the statistics of another set of rows.
+    get_information(self) -> dict:
+        Returns the statistics.
+    """
+
+    def __init__(self):
+        self.n_rows = 0
+        self.memory_size = 0
+        self.n_missing = {}
+        self.min = {}
+        self.max = {}
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """
+        Adds a chunk of rows to the statistics.
+
+        Parameters:
+        -----------
+        chunk: pd.DataFrame
+            The rows to add.
+        """
+        numeric = chunk.select_dtypes(include=["number", "datetime"])
+        other = StreamingStatistics()
+        other.n_rows = chunk.shape[0]
+        other.memory_size = int(chunk.memory_usage().sum())
+        other.n_missing = {column: int(count) for column, count in chunk.isna().sum().items()}
+        other.min = numeric.min().to_dict()
+        other.max = numeric.max().to_dict()
+        self.merge(other)
+
+    def merge(self, other: "StreamingStatistics") -> None:
+        """
+        Adds the statistics of another set of rows.
+
+        Parameters:
+        -----------
+        other: StreamingStatistics
+            The statistics to add.
+        """
+        self.n_rows += other.n_rows
+        self.memory_size += other.memory_size
+        for column, count in other.n_missing.items():
+            self.n_missing[column] = self.n_missing.get(column, 0) + count
+        for column, value in other.min.items():
+            if not pd.isna(value):
+                self.min[column] = value if pd.isna(self.min.get(column, np.nan)) else min(self.min[column], value)
+        for column, value in other.max.items():
+            if not pd.isna(value):
+                self.max[column] = value if pd.isna(self.max.get(column, np.nan)) else max(self.max[column], value)
+
+    def get_information(self) -> dict:
+        """
+        Returns the statistics.
+
+        Returns:
+        --------
+        A dictionary containing the number of rows, the memory size, and the missing values,
+        minimum and maximum of each column.
+        """
+        return {
+            "n_rows": self.n_rows,
+            "memory_size": self.memory_size,
+            "n_missing": dict(self.n_missing),
+            "min": dict(self.min),
+            "max": dict(self.max),
+        }
+
+##########################################################################################
+
+class ReservoirSampler():
+    """
+    Draws a uniform sample of a fixed number of rows from a stream of chunks, without
+    knowing the total number of rows in advance. Each row is given a random key and the
+    rows with the smallest keys are kept.
+
+    When a stratification column is given, a reservoir is kept per class and the final
+    sample is split between classes in proportion to their exact counts, so that rare
+    classes are represented. With more than `MAX_STRATA` classes the sample is uniform.
+
+    The reservoir of a class keeps its share of the sample among the rows seen so far, plus
+    a headroom of `sample_size / MAX_STRATA` rows for its share to grow, so that all the
+    reservoirs together hold at most about twice `sample_size` rows. The sample of a class
+    is exact unless its share grows by more than the headroom after its reservoir was
+    trimmed, e.g. a class that only appears at the end of a sorted file.
+
+    Attributes:
+    -----------
+    sample_size: int
+        The number of rows to sample.
+    stratify_column: str
+        The column to stratify on, or None for a uniform sample.
+
+    Methods:
+    --------
+    update(self, chunk: pd.DataFrame) -> None:
+        Adds a chunk of rows to the sampler.
+    get_sample(self) -> pd.DataFrame:
+        Returns the sampled rows, in their original order.
+    """
+
+    def __init__(self, sample_size: int, stratify_column: str = None, random_state: int = None):
+        self.sample_size = sample_size
+        self.stratify_column = stratify_column
+        self.class_counts = {}
+        self._reservoirs = {}
+        self._random = np.random.default_rng(random_state)
+
+    @property
+    def stratified(self) -> bool:
+        """
+        Returns whether the sample is stratified.
+        """
+        return self.stratify_column is not None and len(self.class_counts) <= MAX_STRATA
+
+    def _keep_smallest(self, rows: pd.DataFrame, keys: np.ndarray, n: int):
+        if len(keys) <= n:
+            return rows, keys
+        indices = np.argpartition(keys, n)[:n]
+        return rows.iloc[indices], keys[indices]
+
+    def _get_capacity(self, stratum) -> int:
+        """
+        Returns the number of rows kept for a class: its share of the sample among the rows
+        seen so far, plus the headroom. The uniform reservoir keeps `sample_size` rows.
+        """
+        if stratum is None:
+            return self.sample_size
+        n_rows = sum(self.class_counts.values())
+        headroom = max(1, self.sample_size // MAX_STRATA)
+        return min(self.sample_size, int(np.ceil(self.sample_size * self.class_counts[stratum] / n_rows)) + headroom)
+
+    def _add(self, stratum, rows: pd.DataFrame, keys: np.ndarray) -> None:
+        if stratum in self._reservoirs:
+            reservoir_rows, reservoir_keys = self._reservoirs[stratum]
+            rows = pd.concat([reservoir_rows, rows])
+            keys = np.concatenate([reservoir_keys, keys])
+        self._reservoirs[stratum] = self._keep_smallest(rows, keys, self._get_capacity(stratum))
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """
+        Adds a chunk of rows to the sampler.
+
+        Parameters:
+        -----------
+        chunk: pd.DataFrame
+            The rows to add.
+        """
+        keys = self._random.random(chunk.shape[0])
+
+        if self.stratify_column is None:
+            self._add(None, chunk, keys)
+            return
+
+        strata = chunk[self.stratify_column]
+        strata = strata.astype(object).where(strata.notna(), MISSING_CLASS).to_numpy()
+        groups = pd.RangeIndex(chunk.shape[0]).groupby(strata)
+        for stratum, positions in groups.items():
+            self.class_counts[stratum] = self.class_counts.get(stratum, 0) + len(positions)
+
+        if not self.stratified:
+            # Too many classes: merge into a single uniform reservoir. The smallest keys
+            # overall are always among the smallest keys of each class, so this is exact.
+            reservoirs = [reservoir for stratum, reservoir in self._reservoirs.items() if stratum is not None]
+            if reservoirs:
+                self._reservoirs = {stratum: reservoir for stratum, reservoir in self._reservoirs.items() if stratum is None}
+                self._add(None, pd.concat([rows for rows, _ in reservoirs]), np.concatenate([keys for _, keys in reservoirs]))
+            self._add(None, chunk, keys)
+            return
+
+        for stratum, positions in groups.items():
+            positions = np.asarray(positions)
+            self._add(stratum, chunk.iloc[positions], keys[positions])
+
+        # The shares of the classes missing from the chunk shrank
+        for stratum, (rows, reservoir_keys) in self._reservoirs.items():
+            self._reservoirs[stratum] = self._keep_smallest(rows, reservoir_keys, self._get_capacity(stratum))
+
+    def _get_quotas(self) -> dict:
+        """
+        Splits the sample size between classes in proportion to their counts, using the
+        largest remainder method and keeping at least one row of each class. The rows given
+        to rare classes beyond their share are taken from the largest classes, so the
+        quotas never add up to more than the sample size.
+        """
+        n_rows = sum(self.class_counts.values())
+        sample_size = min(self.sample_size, n_rows)
+        shares = {stratum: sample_size * count / n_rows for stratum, count in self.class_counts.items()}
+        quotas = {stratum: max(1, int(share)) for stratum, share in shares.items()}
+        remainders = sorted(shares, key=lambda stratum: shares[stratum] - int(shares[stratum]), reverse=True)
+        for stratum in remainders[:max(0, sample_size - sum(quotas.values()))]:
+            quotas[stratum] += 1
+        for _ in range(sum(quotas.values()) - sample_size):
+            quotas[max(quotas, key=quotas.get)] -= 1
+        return quotas
+
+    def get_sample(self) -> pd.DataFrame:
+        """
+        Returns the sampled rows, in their original order.
+
+        Returns:
+        --------
+        A DataFrame containing at most `sample_size` rows.
+        """
+        if not self._reservoirs:
+            return pd.DataFrame()
+
+        if self.stratified:
+            quotas = self._get_quotas()
+            samples = []
+            for stratum, (rows, keys) in self._reservoirs.items():
+                samples.append(self._keep_smallest(rows, keys, quotas.get(stratum, 0))[0])
+            sample = pd.concat(samples)
+        else:
+            sample = pd.concat([rows for rows, _ in self._reservoirs.values()])
+            keys = np.concatenate([keys for _, keys in self._reservoirs.values()])
+            sample = self._keep_smallest(sample, keys, self.sample_size)[0]
+
+        return sample.sort_index()
+
+##########################################################################################
+
+def apply_exact_statistics(profile: dict, statistics: StreamingStatistics, sample: dict) -> dict:
+    """
+    Overwrites the statistics of a profile generated on a sample with the exact statistics
+    of the full dataset, and marks the profile as approximate.
+
+    Parameters:
+    -----------
+    profile: dict
+        The profile generated on the sample.
+    statistics: StreamingStatistics
+        The exact statistics of the full dataset.
+    sample: dict
+        Information about the sample, e.g. its size and sampling method.
+
+    Returns:
+    --------
+    The updated profile.
+    """
+    n_rows = statistics.n_rows
+    n_missing = statistics.n_missing
+
+    table = profile.get("table", {})
+    n_columns = table.get("n_var", len(n_missing))
+    table["n"] = n_rows
+    table["memory_size"] = statistics.memory_size
+    table["record_size"] = statistics.memory_size / n_rows if n_rows else 0
+    table["n_cells_missing"] = sum(n_missing.values())
+    table["p_cells_missing"] = table["n_cells_missing"] / (n_rows * n_columns) if n_rows and n_columns else 0
+    table["n_vars_with_missing"] = len([count for count in n_missing.values() if count > 0])
+
+    for column, variable in profile.get("variables", {}).items():
+        if column not in n_missing:
+            continue
+        variable["n"] = n_rows
+        variable["n_missing"] = n_missing[column]
+        variable["p_missing"] = n_missing[column] / n_rows if n_rows else 0
+        variable["count"] = n_rows - n_missing[column]
+        for key in ["min", "max"]:
+            value = getattr(statistics, key).get(column)
+            if key in variable and value is not None and not pd.isna(value):
+                if hasattr(value, "item"):
+                    value = value.item()
+                variable[key] = value if isinstance(value, (int, float)) else str(value)
+        if "min" in variable and "max" in variable and isinstance(variable["min"], (int, float)) and isinstance(variable["max"], (int, float)):
+            variable["range"] = variable["max"] - variable["min"]
+
+    profile["approximate"] = True
+    profile["sample"] = sample
+    profile["exact_statistics"] = ["n", "n_missing", "p_missing", "count", "min", "max", "range"]
+
+    return profile
+
@@ -0,0 +1,410 @@
+import csv
+import hashlib
+import os
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from .cache import CACHE_DIR
+from .lazy import lazy_import
+
+pa = lazy_import("pyarrow")
+pa_csv = lazy_import("pyarrow.csv")
+pa_dataset = lazy_import("pyarrow.dataset")
+pc = lazy_import("pyarrow.compute")
+pq = lazy_import("pyarrow.parquet")
+
+##########################################################################################
+
+SUPPORTED_FORMATS = {
+    "csv": {
+        "description": "Comma-separated values",
+        "extensions": [".csv"],
+    },
+    "parquet": {
+        "description": "Apache Parquet",
+        "extensions": [".parquet", ".pq"],
+    },
+    "feather": {
+        "description": "Feather / Arrow IPC file",
+        "extensions": [".feather", ".arrow", ".ipc"],
+    },
+}
+
+FILTER_OPERATORS = ["==", "=", "!=", "<", "<=", ">", ">=", "in", "not in"]
+
+# The inferred, downcast schemas of CSV files, so later loads skip type inference
+SCHEMA_CACHE_DIR = os.path.join(CACHE_DIR, "schemas")
+
+# The size of the blocks parsed in parallel by the CSV reader
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+
+##########################################################################################
+
+def get_format(path: str) -> str:
+    """
+    Returns the format of a dataset file from its extension. Files with other extensions,
+    e.g. .txt, or without an extension are read as CSV.
+
+    Parameters:
+    -----------
+    path: str
+        The path to the file.
+
+    Returns:
+    --------
+    The name of the format, one of `SUPPORTED_FORMATS`.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    for format_name, format_information in SUPPORTED_FORMATS.items():
+        if extension in format_information["extensions"]:
+            return format_name
+
+    return "csv"
+
+
+def get_types_mapper():
+    """
+    Returns the mapping from Arrow types to pandas dtypes. Strings are kept in Arrow memory
+    rather than converted to Python objects, numeric columns stay NumPy backed so they can
+    be passed to the models without conversion.
+    """
+    string_dtype = pd.StringDtype("pyarrow")
+    return {pa.string(): string_dtype, pa.large_string(): string_dtype}.get
+
+
+def _normalise_filters(filters: list) -> List[list]:
+    """
+    Returns the filters in disjunctive normal form: a list of lists of (column, operator,
+    value) conditions, where the inner conditions are combined with AND and the outer
+    lists with OR.
+    """
+    if not filters:
+        return []
+    if isinstance(filters[0][0], (list, tuple)):
+        return [[tuple(condition) for condition in conjunction] for conjunction in filters]
+    return [[tuple(condition) for condition in filters]]
+
+
+def _check_filters(filters: List[list]) -> None:
+    for conjunction in filters:
+        for condition in conjunction:
+            if len(condition) != 3 or condition[1] not in FILTER_OPERATORS:
+                raise ValueError("Invalid filter: " + str(condition))
+
+##########################################################################################
+
+def _get_schema_path(path: str) -> str:
+    """
+    Returns the path of the cached schema of a file. The schema is keyed on the path, size
+    and modification time of the file, so it is inferred again when the file changes.
+    """
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return os.path.join(SCHEMA_CACHE_DIR, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + ".schema")
+
+
+def load_schema(path: str):
+    """
+    Returns the cached schema of a CSV file, or None if it has not been cached.
+    """
+    try:
+        with open(_get_schema_path(path), "rb") as file:
+            return pa.ipc.read_schema(pa.py_buffer(file.read()))
+    except (OSError, ValueError, pa.ArrowInvalid):
+        return None
+
+
+def save_schema(path: str, schema) -> None:
+    """
+    Caches the schema of a CSV file. Columns already in the cache, e.g. from a load with a
+    different column selection, are kept. Failures to write are ignored.
+    """
+    cached_schema = load_schema(path)
+    if cached_schema is not None:
+        fields = {field.name: field for field in cached_schema}
+        fields.update({field.name: field for field in schema})
+        schema = pa.schema(list(fields.values()))
+
+    schema_path = _get_schema_path(path)
+    temporary_path = schema_path + "." + str(os.getpid()) + ".tmp"
+    try:
+        os.makedirs(SCHEMA_CACHE_DIR, exist_ok=True)
+        with open(temporary_path, "wb") as file:
+            file.write(schema.serialize().to_pybytes())
+        os.replace(temporary_path, schema_path)
+    except OSError:
+        pass
+
+
+def _get_downcast_type(data_type, minimum, maximum):
+    """
+    Returns the smallest type holding the values between `minimum` and `maximum` of a 64 bit
+    float or integer column, or `data_type` if it cannot be downcast.
+    """
+    if pa.types.is_float64(data_type):
+        if minimum is None or max(abs(minimum), abs(maximum)) <= float(np.finfo(np.float32).max):
+            return pa.float32()
+    elif pa.types.is_int64(data_type) and minimum is not None:
+        for integer_type in [pa.int8(), pa.int16(), pa.int32()]:
+            information = np.iinfo(integer_type.to_pandas_dtype())
+            if minimum >= information.min and maximum <= information.max:
+                return integer_type
+    return data_type
+
+
+def downcast_table(table):
+    """
+    Casts the numeric columns of a table to the smallest type holding their values: 64 bit
+    floats to 32 bit floats, and 64 bit integers to the smallest signed integer type.
+
+    Parameters:
+    -----------
+    table: pyarrow.Table
+        The table to downcast.
+
+    Returns:
+    --------
+    The downcast table.
+    """
+    for index, field in enumerate(table.schema):
+        if not (pa.types.is_float64(field.type) or pa.types.is_int64(field.type)):
+            continue
+        column = table.column(index)
+        limits = pc.min_max(column)
+        data_type = _get_downcast_type(field.type, limits["min"].as_py(), limits["max"].as_py())
+        if data_type != field.type:
+            table = table.set_column(index, field.with_type(data_type), pc.cast(column, data_type, safe=False))
+
+    return table
+
+
+def get_csv_column_names(path: str) -> List[str]:
+    """
+    Returns the column names of a CSV file, made unique as pandas does: unnamed columns are
+    named "Unnamed: <position>", and repeated names get a ".1", ".2", ... suffix. Arrow
+    keeps the names of the header as they are.
+
+    Parameters:
+    -----------
+    path: str
+        The path to the file.
+
+    Returns:
+    --------
+    The unique column names.
+    """
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as file:
+        header = next(csv.reader(file), [])
+
+    names = [name if name != "" else f"Unnamed: {index}" for index, name in enumerate(header)]
+    header_names = set(names)
+    counts = {}
+    for index, name in enumerate(names):
+        original_name, count = name, counts.get(name, 0)
+        while count > 0:
+            counts[original_name] = count + 1
+            name = f"{original_name}.{count}"
+            # Suffixed names already in the header are skipped
+            count = count + 1 if name in header_names else counts.get(name, 0)
+        names[index] = name
+        counts[name] = count + 1
+
+    return names
+
+
+def _get_csv_read_options(path: str, **options):
+    """
+    Returns the Arrow options reading a CSV file with the unique column names of
+    `get_csv_column_names`, in place of its header.
+    """
+    return pa_csv.ReadOptions(column_names=get_csv_column_names(path), skip_rows=1, block_size=CSV_BLOCK_SIZE, **options)
+
+
+def read_csv(path: str, columns: List[str] = None, filters: List[list] = None, downcast: bool = True) -> pd.DataFrame:
+    """
+    Reads a CSV file with the multithreaded Arrow reader. Only the selected columns are
+    converted. On the first load the column types are inferred, downcast and cached, later
+    loads parse straight into the cached types.
+    """
+    schema = load_schema(path)
+    column_types = {field.name: field.type for field in schema} if schema is not None else None
+
+    def read(column_types):
+        return pa_csv.read_csv(
+            path,
+            read_options=_get_csv_read_options(path, use_threads=True),
+            convert_options=pa_csv.ConvertOptions(include_columns=columns, column_types=column_types, strings_can_be_null=True)
+        )
+
+    try:
+        table = read(column_types)
+    except pa.ArrowInvalid:
+        if column_types is None:
+            raise
+        # The cached types no longer fit, e.g. the file was rewritten in place
+        column_types = None
+        table = read(None)
+
+    if column_types is None or any(name not in column_types for name in table.column_names):
+        if downcast:
+            table = downcast_table(table)
+        save_schema(path, table.schema)
+
+    if filters:
+        table = table.filter(pq.filters_to_expression(filters))
+
+    return table.to_pandas(types_mapper=get_types_mapper(), self_destruct=True, split_blocks=True)
+
+
+def read_arrow(path: str, format_name: str, columns: List[str] = None, filters: List[list] = None) -> pd.DataFrame:
+    """
+    Reads a Parquet or Feather file through Arrow. Only the selected columns are read, and
+    filters are pushed down to skip row groups and record batches that cannot match.
+    """
+    dataset = pa_dataset.dataset(path, format="parquet" if format_name == "parquet" else "ipc")
+    expression = pq.filters_to_expression(filters) if filters else None
+    table = dataset.to_table(columns=columns, filter=expression)
+    return table.to_pandas(types_mapper=get_types_mapper(), self_destruct=True, split_blocks=True)
+
+
+def read_dataset(path: str, columns: List[str] = None, filters: list = None) -> pd.DataFrame:
+    """
+    Reads a dataset file, dispatching on its extension.
+
+    Parameters:
+    -----------
+    path: str
+        The path to the file.
+    columns: List[str], default=None
+        The columns to read. All the columns are read if None.
+    filters: list, default=None
+        The rows to read, as a list of (column, operator, value) conditions combined with
+        AND, or a list of such lists combined with OR. The operator is one of
+        `FILTER_OPERATORS`.
+
+    Returns:
+    --------
+    The dataset as a pandas DataFrame.
+    """
+    format_name = get_format(path)
+    filters = _normalise_filters(filters)
+    _check_filters(filters)
+
+    if format_name == "csv":
+        return read_csv(path, columns, filters)
+
+    return read_arrow(path, format_name, columns, filters)
+
+##########################################################################################
+
+# The types tried in order when inferring the type of a CSV column, before strings
+CSV_INFERRED_TYPES = ["int64", "double", "bool", "timestamp[ns]"]
+
+
+def infer_csv_schema(path: str, columns: List[str] = None):
+    """
+    Infers the column types of a CSV file from all its rows, reading it one block at a time
+    as strings. Each column gets the first type of `CSV_INFERRED_TYPES` that parses all its
+    values, or string, and numeric columns are then downcast as by `downcast_table`. Unlike
+    the inference of the Arrow streaming reader, which only looks at the first block, a
+    decimal or a word in a later block is taken into account.
+
+    Parameters:
+    -----------
+    path: str
+        The path to the file.
+    columns: List[str], default=None
+        The columns to infer. All the columns are inferred if None.
+
+    Returns:
+    --------
+    The pyarrow.Schema of the columns.
+    """
+    names = columns if columns is not None else get_csv_column_names(path)
+    reader = pa_csv.open_csv(path, read_options=_get_csv_read_options(path),
+                             convert_options=pa_csv.ConvertOptions(include_columns=names, column_types={name: pa.string() for name in names},
+                                                                   strings_can_be_null=True))
+    candidates = {name: [pa.type_for_alias(alias) for alias in CSV_INFERRED_TYPES] for name in names}
+    limits = {name: {} for name in names}
+
+    for batch in reader:
+        for name, column in zip(batch.schema.names, batch.columns):
+            for data_type in list(candidates[name]):
+                try:
+                    values = pc.cast(column, data_type)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    candidates[name].remove(data_type)
+                    continue
+                if pa.types.is_int64(data_type) or pa.types.is_float64(data_type):
+                    batch_limits = pc.min_max(values)
+                    minimum, maximum = limits[name].get(data_type, (None, None))
+                    if batch_limits["min"].as_py() is not None:
+                        minimum = batch_limits["min"].as_py() if minimum is None else min(minimum, batch_limits["min"].as_py())
+                        maximum = batch_limits["max"].as_py() if maximum is None else max(maximum, batch_limits["max"].as_py())
+                    limits[name][data_type] = (minimum, maximum)
+    reader.close()
+
+    fields = []
+    for name in names:
+        data_type = candidates[name][0] if candidates[name] else pa.string()
+        fields.append(pa.field(name, _get_downcast_type(data_type, *limits[name].get(data_type, (None, None)))))
+    return pa.schema(fields)
+
+
+def _iter_csv_batches(path: str, columns: List[str] = None):
+    """
+    Yields the record batches of a CSV file, one block at a time. The column types are
+    taken from the cached schema, or inferred from all the rows by `infer_csv_schema` and
+    cached, so that the batches have the types the file gets when read whole.
+    """
+    names = columns if columns is not None else get_csv_column_names(path)
+    schema = load_schema(path)
+    if schema is None or any(name not in schema.names for name in names):
+        schema = infer_csv_schema(path, names)
+        save_schema(path, schema)
+    column_types = {field.name: field.type for field in schema if field.name in names}
+
+    reader = pa_csv.open_csv(path, read_options=_get_csv_read_options(path),
+                             convert_options=pa_csv.ConvertOptions(include_columns=names, column_types=column_types, strings_can_be_null=True))
+    yield from reader
+
+
+def iter_batches(path: str, columns: List[str] = None, filters: list = None, batch_size: int = 131072):
+    """
+    Yields a dataset file as Arrow record batches, so that files larger than memory can be
+    processed in bounded chunks.
+
+    Parameters:
+    -----------
+    path: str
+        The path to the file.
+    columns: List[str], default=None
+        The columns to read. All the columns are read if None.
+    filters: list, default=None
+        The rows to read. See `read_dataset`.
+    batch_size: int, default=131072
+        The maximum number of rows per batch of Parquet and Feather files. CSV files are
+        read in blocks of `CSV_BLOCK_SIZE` bytes.
+
+    Yields:
+    -------
+    pyarrow.RecordBatch
+        The next batch of rows. All the batches share the same schema.
+    """
+    format_name = get_format(path)
+    filters = _normalise_filters(filters)
+    _check_filters(filters)
+    expression = pq.filters_to_expression(filters) if filters else None
+
+    if format_name == "csv":
+        for batch in _iter_csv_batches(path, columns):
+            if expression is not None:
+                yield from pa.Table.from_batches([batch]).filter(expression).to_batches()
+            else:
+                yield batch
+        return
+
+    dataset = pa_dataset.dataset(path, format="parquet" if format_name == "parquet" else "ipc")
+    yield from dataset.to_batches(columns=columns, filter=expression, batch_size=batch_size)
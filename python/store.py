@@ -0,0 +1,296 @@
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from .cache import CACHE_DIR, evict_least_recently_used
+from .lazy import lazy_import
+from .readers import get_types_mapper
+
+pa = lazy_import("pyarrow")
+
+##########################################################################################
+
+# Whether loaded datasets are materialised into the store by default
+USE_STORE = os.environ.get("NEUROGEMS_USE_STORE", "false").lower() in ["1", "true", "yes"]
+STORE_SIZE = int(os.environ.get("NEUROGEMS_STORE_SIZE", 10240)) * 1024 * 1024
+
+##########################################################################################
+
+class ColumnarStore():
+    """
+    A directory of uncompressed Arrow IPC files, one per loaded dataset. Files are opened
+    through memory maps, so the DataFrames read from the store are views on the page cache:
+    they are not copied into process memory, and all the processes opening the same entry
+    share one physical copy of the data.
+
+    Attributes:
+    -----------
+    directory: str
+        The directory in which the entries are stored.
+    max_size: int
+        The maximum total size of the entries, in bytes.
+
+    Methods:
+    --------
+    contains(self, key: str) -> bool:
+        Returns whether an entry is in the store.
+    put(self, key: str, data: pd.DataFrame) -> pd.DataFrame:
+        Writes a DataFrame to the store and returns its memory-mapped view.
+    get(self, key: str) -> pd.DataFrame:
+        Returns the memory-mapped view of an entry.
+    get_resident_size(self, data: pd.DataFrame) -> int:
+        Returns the number of bytes of a view that were copied into process memory.
+    """
+
+    def __init__(self, directory: str = os.path.join(CACHE_DIR, "store"), max_size: int = STORE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # The resident sizes of the views handed out, by id, until they are collected
+        self._resident_sizes = {}
+
+    def get_path(self, key: str) -> str:
+        """
+        Returns the path of the file of an entry.
+
+        Parameters:
+        -----------
+        key: str
+            The key of the entry.
+        """
+        return os.path.join(self.directory, key + ".arrow")
+
+    def contains(self, key: str) -> bool:
+        """
+        Returns whether an entry is in the store.
+
+        Parameters:
+        -----------
+        key: str
+            The key of the entry.
+        """
+        return os.path.exists(self.get_path(key))
+
+    def put(self, key: str, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Writes a DataFrame to the store, then evicts the least recently used entries if the
+        store is over its maximum size.
+
+        Parameters:
+        -----------
+        key: str
+            The key of the entry.
+        data: pd.DataFrame
+            The DataFrame to write.
+
+        Returns:
+        --------
+        The memory-mapped view of the entry.
+        """
+        path = self.get_path(key)
+        temporary_path = path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with pa.OSFile(temporary_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+        with self._lock:
+            evict_least_recently_used(self.directory, ".arrow", max(self.max_size, os.path.getsize(path)))
+
+        return self.get(key)
+
+    def _compact(self, batches_path: str, path: str) -> None:
+        """
+        Rewrites a file of several record batches as a single record batch, so that its
+        columns are contiguous and can be mapped without copying. The columns are combined
+        one at a time into single-column files, which are then mapped and written together,
+        so that at most one column is held in memory.
+        """
+        table = pa.ipc.open_file(pa.memory_map(batches_path, "r")).read_all()
+        column_paths = []
+        try:
+            for index, field in enumerate(table.schema):
+                column_path = batches_path + "." + str(index)
+                column_paths.append(column_path)
+                column = pa.Table.from_arrays([table.column(index).combine_chunks()], schema=pa.schema([field]))
+                with pa.OSFile(column_path, "wb") as sink:
+                    with pa.ipc.new_file(sink, column.schema) as writer:
+                        writer.write_table(column)
+                del column
+
+            columns = [pa.ipc.open_file(pa.memory_map(column_path, "r")).read_all().column(0) for column_path in column_paths]
+            with pa.OSFile(path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(pa.Table.from_arrays(columns, schema=table.schema))
+        finally:
+            for column_path in column_paths:
+                if os.path.exists(column_path):
+                    os.remove(column_path)
+
+    def put_batches(self, key: str, batches) -> pd.DataFrame:
+        """
+        Writes a stream of record batches to the store one batch at a time, so that the
+        data never has to fit in memory, then evicts the least recently used entries if the
+        store is over its maximum size. The batches are compacted into one record batch
+        once written, so that the entry is mapped without copying like entries written by
+        `put`.
+
+        Parameters:
+        -----------
+        key: str
+            The key of the entry.
+        batches: Iterable[pyarrow.RecordBatch]
+            The batches to write. All the batches must share the same schema.
+
+        Returns:
+        --------
+        The memory-mapped view of the entry.
+
+        Raises:
+        -------
+        ValueError:
+            If there are no batches to write.
+        """
+        path = self.get_path(key)
+        temporary_path = path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+        batches_path = temporary_path + ".batches"
+
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            n_batches = 0
+            with pa.OSFile(batches_path, "wb") as sink:
+                writer = None
+                for batch in batches:
+                    if writer is None:
+                        writer = pa.ipc.new_file(sink, batch.schema)
+                    writer.write_batch(batch)
+                    n_batches += 1
+                if writer is None:
+                    raise ValueError("No rows to write to the store")
+                writer.close()
+
+            if n_batches > 1:
+                self._compact(batches_path, temporary_path)
+            else:
+                os.replace(batches_path, temporary_path)
+            os.replace(temporary_path, path)
+        finally:
+            for leftover_path in [batches_path, temporary_path]:
+                if os.path.exists(leftover_path):
+                    os.remove(leftover_path)
+
+        with self._lock:
+            evict_least_recently_used(self.directory, ".arrow", max(self.max_size, os.path.getsize(path)))
+
+        return self.get(key)
+
+    def get(self, key: str) -> pd.DataFrame:
+        """
+        Returns the memory-mapped view of an entry. Numeric columns without missing values
+        are zero-copy views of the file, strings stay in Arrow memory.
+
+        Parameters:
+        -----------
+        key: str
+            The key of the entry.
+
+        Returns:
+        --------
+        The DataFrame of the entry.
+
+        Raises:
+        -------
+        KeyError:
+            If the entry is not in the store.
+        """
+        path = self.get_path(key)
+        try:
+            mapped = pa.memory_map(path, "r").read_buffer()
+        except FileNotFoundError:
+            raise KeyError("Entry not found in store: " + key)
+        table = pa.ipc.open_file(mapped).read_all()
+
+        os.utime(path)  # Marks the entry as recently used
+
+        data = table.to_pandas(types_mapper=get_types_mapper(), split_blocks=True)
+        self._resident_sizes[id(data)] = _get_resident_size(data, mapped.address, mapped.address + mapped.size)
+        weakref.finalize(data, self._resident_sizes.pop, id(data), None)
+        return data
+
+    def get_resident_size(self, data: pd.DataFrame) -> int:
+        """
+        Returns the number of bytes of a view returned by `get` that were copied into
+        process memory, e.g. booleans and columns with missing values, which pandas cannot
+        represent as views on the file.
+
+        Parameters:
+        -----------
+        data: pd.DataFrame
+            The view.
+
+        Returns:
+        --------
+        The resident size of the view, or None if it was not returned by the store.
+        """
+        return self._resident_sizes.get(id(data))
+
+    def remove(self, key: str) -> None:
+        """
+        Removes an entry from the store. Entries still mapped by a process may not be
+        removable on Windows, in which case they are left for a later eviction.
+
+        Parameters:
+        -----------
+        key: str
+            The key of the entry.
+        """
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
+
+##########################################################################################
+
+def _get_buffers(column: pd.Series) -> list:
+    """
+    Returns the (address, size) of the buffers backing a column, or None if they cannot be
+    inspected.
+    """
+    if isinstance(column.dtype, np.dtype):
+        values = column.to_numpy()
+        return [(values.__array_interface__["data"][0], values.nbytes)]
+    if isinstance(column.array, pd.arrays.ArrowExtensionArray):
+        values = pa.array(column.array)
+        chunks = values.chunks if isinstance(values, pa.ChunkedArray) else [values]
+        return [(buffer.address, buffer.size) for chunk in chunks for buffer in chunk.buffers() if buffer is not None]
+    return None
+
+
+def _get_resident_size(data: pd.DataFrame, start: int, stop: int) -> int:
+    """
+    Returns the number of bytes of the columns of a DataFrame outside of the memory map
+    between the addresses `start` and `stop`.
+    """
+    resident_size = 0
+    for index in range(data.shape[1]):
+        column = data.iloc[:, index]
+        buffers = _get_buffers(column)
+        if buffers is None:
+            resident_size += column.array.nbytes
+            continue
+        resident_size += sum(size for address, size in buffers if not start <= address < stop)
+    return resident_size
+
+##########################################################################################
+
+COLUMNAR_STORE = ColumnarStore()
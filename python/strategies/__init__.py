@@ -1,4 +1,5 @@
 from .base import Strategy
 from .unimodal import UnimodalStrategy
 from .early_fusion import EarlyFusionStrategy
-from .late_fusion import LateFusionStrategy
\ No newline at end of file
+from .late_fusion import LateFusionStrategy
+from .stacking import StackingStrategy
\ No newline at end of file
@@ -1,13 +1,29 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Iterator, List
+import copy
+import json
 import os
+import shutil
 import numpy as np
+import pandas as pd
 import sklearn
-import mlflow
-import matplotlib.pyplot as plt
 
+from ..cache import get_current_directory, make_temporary_directory, replace_directory
 from ..data import DataHandler
-from ..model import ModelHandler
+from ..fusion import join_frames
+from ..job import report_progress
+from ..lazy import lazy_import
+from ..model import MODEL_COMPRESSION, MLModel, ModelHandler
+
+# Training runs in worker threads, where only a non-interactive backend can draw
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+mlflow = lazy_import("mlflow")
+plt = lazy_import("matplotlib.pyplot")
+joblib = lazy_import("joblib")
+
+# The number of rows predicted at a time, which bounds the memory used by a prediction
+PREDICTION_CHUNK_SIZE = int(os.environ.get("NEUROGEMS_PREDICTION_CHUNK_SIZE", 4096))
 
 
 class Strategy(ABC):
@@ -25,12 +41,18 @@ class Strategy(ABC):
     --------
     train(self, data: dict) -> typing.Any:
         Trains the pipeline using the provided data.
-    predict(self, data: dict) -> typing.Any:
+    predict(self, data: dict, with_probability: bool = False) -> dict:
         Makes predictions using the trained pipeline.
+    iter_predictions(self, data: dict, chunk_size: int, with_probability: bool) -> Iterator[dict]:
+        Joins the inputs of a batch and predicts them one chunk of rows at a time.
     get_requirements(self) -> dict:
         Returns the required models and datasets for this strategy.
     get_graph(self) -> dict:
         Returns the adjacency list of models and datasets used in the strategy.
+    save(self, path: str) -> None:
+        Saves the trained strategy to a directory.
+    load(path: str, data_handler: DataHandler = None) -> Strategy:
+        Loads a saved strategy.
     """
 
     def __init__(self, strategy_name:str, strategy_type:str, data_handler: DataHandler):
@@ -39,6 +61,9 @@ class Strategy(ABC):
         self.version = 1
         self.data_handler = data_handler
         self.model_handler = ModelHandler()
+        self.results = None
+        self.labels = None
+        self.inputs = {}
 
     def _log_metrics(self, y_actual, y_pred) -> dict:
         """
@@ -73,6 +98,217 @@ class Strategy(ABC):
         mlflow.log_param('f1_score_classwise', self.results['f1_score'])
         mlflow.log_metric('f1_score', np.mean(self.results['f1_score']))
         
+    def _get_data_key(self, dataset_names) -> str:
+        """
+        Returns a key identifying the data and the target of the given datasets, used to
+        skip the training of models whose data did not change.
+
+        Parameters:
+        -----------
+        dataset_names: List[str]
+            The names of the datasets, in the order in which they are used.
+        """
+        datasets = [self.data_handler.datasets[dataset_name] for dataset_name in dataset_names]
+        return json.dumps([[dataset.get_data_key(), dataset.target_column, dataset.id_column] for dataset in datasets])
+
+    def _set_inputs(self, dataset_names: List[str], labels) -> None:
+        """
+        Records the features and id column of each dataset the strategy was trained on, and
+        the classes, so that predictions do not depend on the datasets still being loaded.
+
+        Parameters:
+        -----------
+        dataset_names: List[str]
+            The names of the datasets, in the order in which they are used.
+        labels: array-like
+            The sorted classes.
+        """
+        self.inputs = {
+            dataset_name: {
+                "features": list(self.data_handler.datasets[dataset_name].get_data(drop_target=True).columns),
+                "id_column": self.data_handler.datasets[dataset_name].id_column,
+            }
+            for dataset_name in dataset_names
+        }
+        self.labels = np.asarray(labels)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.labels is not None
+
+    def _get_features(self, dataset_name: str, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the features of a dataset from rows to predict, in the order in which the
+        models were trained on them. Other columns, e.g. the target, are ignored.
+
+        Raises:
+        -------
+        ValueError:
+            If features are missing from the rows.
+        """
+        features = self.inputs[dataset_name]["features"]
+        missing = [column for column in features if column not in data.columns]
+        if missing:
+            raise ValueError(f"Missing features of dataset {dataset_name}: " + ", ".join(map(str, missing)))
+        return data[features]
+
+    def iter_predictions(self, data: dict, chunk_size: int = PREDICTION_CHUNK_SIZE, with_probability: bool = False) -> Iterator[dict]:
+        """
+        Joins the rows of each input dataset on their ids, or by position if the datasets
+        have no id column, then predicts them one chunk at a time. Only the rows of one
+        chunk are gathered and predicted at once, so the memory used does not grow with
+        the size of the batch. The inputs are checked and joined before this returns.
+
+        Parameters:
+        -----------
+        data: dict
+            A dictionary mapping the name of each dataset the strategy was trained on to a
+            DataFrame of the rows to predict.
+        chunk_size: int
+            The maximum number of rows per chunk. Defaults to `PREDICTION_CHUNK_SIZE`.
+        with_probability: bool
+            Whether to return the probability of each class. Defaults to False.
+
+        Returns:
+        --------
+        Iterator[dict]
+            The predictions of each chunk: the ids of the rows, or their positions if the
+            datasets have no id column, the predicted labels and, optionally, the
+            probabilities.
+
+        Raises:
+        -------
+        Exception:
+            If the strategy has not been trained.
+        ValueError:
+            If a dataset or a feature is missing, or if the rows cannot be joined.
+        """
+        if not self.is_trained:
+            raise Exception(f"Strategy {self.name} must be trained before predicting")
+        missing = [dataset_name for dataset_name in self.inputs if dataset_name not in data]
+        if missing:
+            raise ValueError("Missing rows of dataset(s): " + ", ".join(missing))
+        if chunk_size < 1:
+            raise ValueError("The chunk size must be positive")
+
+        dataset_names = list(self.inputs)
+        frames = [data[dataset_name] for dataset_name in dataset_names]
+        for dataset_name, frame in zip(dataset_names, frames):
+            self._get_features(dataset_name, frame.iloc[:0])
+        id_columns = [self.inputs[dataset_name]["id_column"] for dataset_name in dataset_names]
+        if len(frames) == 1 and id_columns[0] not in frames[0].columns:
+            # The rows of a single dataset need no join, rows without ids are kept by position
+            id_columns = [None]
+        ids, positions = join_frames(frames, id_columns)
+
+        def predict_chunks():
+            for start in range(0, len(positions[0]), chunk_size):
+                stop = start + chunk_size
+                chunk = {
+                    dataset_name: self._get_features(dataset_name, frame.iloc[dataset_positions[start:stop]])
+                    for dataset_name, frame, dataset_positions in zip(dataset_names, frames, positions)
+                }
+                results = self.predict(chunk, with_probability)
+                chunk_ids = ids[start:stop] if ids is not None else positions[0][start:stop]
+                yield {"ids": chunk_ids.tolist(), **results}
+
+        return predict_chunks()
+
+    def _decode_predictions(self, codes: np.ndarray, probabilities: np.ndarray = None) -> dict:
+        """
+        Returns the labels of encoded predictions, and the probabilities if given, as JSON
+        serialisable lists.
+        """
+        results = {"predictions": self.labels[codes].tolist()}
+        if probabilities is not None:
+            results["probabilities"] = probabilities.tolist()
+        return results
+
+    def _get_skeleton(self) -> "Strategy":
+        """
+        Returns a shallow copy of the strategy to save, without its data handler and its
+        models, which are saved separately. Strategies holding data derived from their
+        datasets drop it here.
+        """
+        skeleton = copy.copy(self)
+        skeleton.data_handler = None
+        skeleton.model_handler = copy.copy(self.model_handler)
+        skeleton.model_handler.models = {}
+        skeleton.model_handler._trainings = {}
+        skeleton.model_handler.model_names = list(self.model_handler.model_names)
+        return skeleton
+
+    def save(self, path: str) -> None:
+        """
+        Saves the trained strategy to a directory, replacing it if it exists. Each model is
+        saved with `MLModel.save` in models/, so its fitted arrays are memory-mapped when
+        the strategy is loaded, and the rest of the strategy is compressed with joblib.
+        The datasets are not saved.
+
+        The directory is versioned, see `cache.replace_directory`: the previous version is
+        kept for the strategies loaded from it until `cache.remove_old_versions` is called.
+
+        Parameters:
+        -----------
+        path: str
+            The directory to save the strategy to.
+
+        Raises:
+        -------
+        Exception:
+            If the strategy has not been trained.
+        """
+        if not self.is_trained:
+            raise Exception(f"Strategy {self.name} must be trained before saving it")
+
+        temporary_path = make_temporary_directory(path)
+        try:
+            os.makedirs(os.path.join(temporary_path, "models"))
+            for index, model_name in enumerate(self.model_handler.model_names):
+                self.model_handler.models[model_name].save(os.path.join(temporary_path, "models", str(index)))
+            joblib.dump(self._get_skeleton(), os.path.join(temporary_path, "strategy.joblib"), compress=MODEL_COMPRESSION)
+            replace_directory(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                shutil.rmtree(temporary_path, ignore_errors=True)
+
+    @staticmethod
+    def load(path: str, data_handler: DataHandler = None) -> "Strategy":
+        """
+        Loads a saved strategy, ready to predict.
+
+        Parameters:
+        -----------
+        path: str
+            The directory the strategy was saved to.
+        data_handler: DataHandler
+            The datasets to train the strategy again or to predict loaded datasets with.
+            Defaults to None.
+
+        Returns:
+        --------
+        Strategy
+            The loaded strategy.
+        """
+        path = get_current_directory(path)
+        strategy = joblib.load(os.path.join(path, "strategy.joblib"))
+        strategy.data_handler = data_handler
+        for index, model_name in enumerate(strategy.model_handler.model_names):
+            strategy.model_handler.models[model_name] = MLModel.load(os.path.join(path, "models", str(index)))
+        return strategy
+
+    def _report_progress(self, **progress) -> None:
+        """
+        Reports the training progress of the strategy to the running job and publishes it
+        as a "progress" event.
+
+        Parameters:
+        -----------
+        progress: dict
+            The progress fields to report.
+        """
+        report_progress(strategy=self.name, **progress)
+
     def _log_image_artifact(self, plot, name):
         """Log an image artifact to MLflow.
 
@@ -125,18 +361,21 @@ class Strategy(ABC):
         pass
 
     @abstractmethod
-    def predict(self, data: dict) -> Any:
+    def predict(self, data: dict, with_probability: bool = False) -> dict:
         """
         Make predictions using the trained pipeline.
 
         Parameters:
         -----------
         data: dict
-            A dictionary mapping dataset names to their corresponding numpy arrays.
+            A dictionary mapping dataset names to DataFrames of their features, with the
+            same rows in the same order, e.g. a chunk from `iter_predictions`.
+        with_probability: bool
+            Whether to return the probability of each class. Defaults to False.
 
         Returns:
         --------
-        The predicted values.
+        A dictionary with the predicted labels and, optionally, the probabilities.
         """
         pass
 
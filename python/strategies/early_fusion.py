@@ -1,17 +1,21 @@
 import numpy as np
-import pandas as pd
-import mlflow
-import shap
 
 from ..data import DataHandler
+from ..experiment import setup_tracking
+from ..fusion import FusedMatrix
+from ..lazy import lazy_import
 from .base import Strategy
 
+mlflow = lazy_import("mlflow")
+shap = lazy_import("shap")
+
 
 class EarlyFusionStrategy(Strategy):
     """
     A class for implementing early fusion multimodal learning strategy.
-    This strategy requires one model and one or more datasets. The data from the
-    datasets is concatenated and passed to the model for training. This trained model can then
+    This strategy requires one model and one or more datasets. The datasets are joined on
+    their id columns, or aligned by position if they have none, and their features are
+    concatenated and passed to the model for training. This trained model can then
     also be used for prediction.
 
     Parameters:
@@ -31,6 +35,8 @@ class EarlyFusionStrategy(Strategy):
         Object for managing the list of models used in the strategy
     data_handler : DataHandler
         Object for managing the list of datasets used in the strategy
+    fused_matrix : FusedMatrix
+        The fused features of the datasets, in which each dataset is a block of columns
 
     Methods:
     --------
@@ -40,7 +46,7 @@ class EarlyFusionStrategy(Strategy):
         Returns a list of datasets required by the strategy
     train() -> None:
         Trains the model using the concatenated data from the datasets
-    predict(X: np.ndarray) -> np.ndarray:
+    predict(data: dict, with_probability: bool = False) -> dict:
         Predicts the output using the trained model
 
     Example:
@@ -56,12 +62,14 @@ class EarlyFusionStrategy(Strategy):
     # train the model
     early_fusion.train()
 
-    # predict using the trained model
-    y_pred = early_fusion.predict(X_test)
+    # predict batches of rows, one DataFrame per dataset
+    for chunk in early_fusion.iter_predictions({"dataset_1": X_1, "dataset_2": X_2}):
+        y_pred = chunk["predictions"]
     """
 
     def __init__(self, strategy_name: str, strategy_type:str, data_handler: DataHandler):
         super().__init__(strategy_name, strategy_type, data_handler)
+        self.fused_matrix = FusedMatrix()
 
 
     def add_model(self, model_name: str, model_type: str, model_params: dict = {}) -> None:
@@ -85,7 +93,8 @@ class EarlyFusionStrategy(Strategy):
 
     def train(self, run_name=None, validation_type: str = "holdout", validation_params: dict = {}) -> None:
         """
-        Trains the model using the concatenated data from the datasets.
+        Trains the model using the joined data from the datasets. Rows whose id is missing
+        from any of the datasets are dropped.
 
         Parameters:
         -----------
@@ -105,17 +114,26 @@ class EarlyFusionStrategy(Strategy):
         # if len(self.data_handler.datasets) < 2:
         #     raise ValueError("Early fusion strategy requires at least 2 datasets.")
 
-        X = pd.concat([self.data_handler.datasets[dataset].get_data(drop_target=True) for dataset in self.data_handler.datasets], axis=1) # assumes all datasets are in pandas dataframe format
-        y = list(self.data_handler.datasets.values())[0].get_target() # assumes all datasets have the same target column
+        # Joins the datasets on their id columns, only the blocks from the first dataset added
+        # or changed since the last training are rebuilt. The blocks, and so the data key,
+        # follow the order of the datasets
+        datasets = self.data_handler.datasets
+        self.fused_matrix.sync(list(datasets.values()))
+        X, y, labels = self.fused_matrix.to_frame(), self.fused_matrix.target, self.fused_matrix.classes
 
         model_name = self.model_handler.model_names[0]
 
         # train the model
-        mlflow.set_tracking_uri("file:public/mlruns")
+        setup_tracking()
         with mlflow.start_run(run_name=run_name) as run:
-            self.results = self.model_handler.train_model(model_name, X, y, validation_type, validation_params)
+            self._report_progress(stage="started", model_index=1, n_models=1)
+            self.results = self.model_handler.train_model(model_name, X, y, validation_type, validation_params, labels=labels,
+                                                          data_key=self._get_data_key(list(datasets)))
+            self._set_inputs(self.fused_matrix.block_names, self.results['labels'])
             self._log_metrics(self.results['target'], self.results['predictions'])
+            self._report_progress(stage="completed", accuracy=self.results['accuracy'])
             self.results['artifact_uri'] = run.info.artifact_uri
+            self.results['feature_blocks'] = {name: self.fused_matrix.get_block_range(name) for name in self.fused_matrix.block_names}
             shap_values = self.results.pop('shap_values')
 
             def plot_summary():
@@ -129,21 +147,43 @@ class EarlyFusionStrategy(Strategy):
         return self.results
 
 
-    def predict(self, X: np.ndarray) -> np.ndarray:
+    def _get_skeleton(self) -> Strategy:
+        """
+        Returns the strategy to save, without its fused matrix, which holds the data of the
+        datasets and is rebuilt by the next training.
+        """
+        skeleton = super()._get_skeleton()
+        skeleton.fused_matrix = FusedMatrix()
+        return skeleton
+
+    def predict(self, data: dict, with_probability: bool = False) -> dict:
         """
-        Predicts the output using the trained model.
+        Predicts the output using the trained model, fitted on all the joined rows. The
+        features of the datasets are fused as in training.
 
         Parameters:
         -----------
-        X : np.ndarray
-            The input data
+        data : dict
+            A dictionary mapping each dataset name to a DataFrame of its features, with the
+            same rows in the same order.
+        with_probability : bool
+            Whether to return the probability of each class. Defaults to False.
 
         Returns:
         --------
-        np.ndarray
-            The predicted output
+        dict
+            The predicted labels and, optionally, the probabilities.
         """
-        return self.model_handler.models[0].predict(X)
+        n_rows = len(data[next(iter(self.inputs))])
+        fused_matrix = FusedMatrix(n_rows)
+        for dataset_name in self.inputs:
+            fused_matrix.add_block(dataset_name, data[dataset_name], np.arange(n_rows))
+        X = fused_matrix.to_frame()
+
+        model_name = self.model_handler.model_names[0]
+        codes = np.asarray(self.model_handler.predict(model_name, X)['predictions'])
+        probabilities = self.model_handler.predict_probabilities(model_name, X, len(self.labels)) if with_probability else None
+        return self._decode_predictions(codes, probabilities)
 
     def get_requirements(self) -> dict:
         """
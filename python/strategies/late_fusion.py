@@ -1,12 +1,293 @@
-from typing import List
+from typing import List, Tuple
+import os
+import time
+import concurrent.futures
 import numpy as np
-import mlflow
-import shap
+import sklearn.metrics
 from itertools import permutations
 
 from ..data import DataHandler
+from ..experiment import setup_tracking
+from ..job import JobCancelled, WorkerJob, get_current_job, set_current_job
+from ..lazy import lazy_import
 from .base import Strategy
 
+mlflow = lazy_import("mlflow")
+shap = lazy_import("shap")
+loky = lazy_import("joblib.externals.loky")
+
+# Weight permutations are only listed for up to this many models, as their number grows
+# factorially. Beyond that, clients rely on the `weight_space` description.
+MAX_ENUMERATED_WEIGHTS = 4
+
+# The number of processes training the per-dataset models concurrently, each holding the
+# data of one dataset. By default the models are trained one after the other in the
+# backend process: training in several processes is opt-in, as each one holds a copy of
+# its model and maps its dataset
+TRAINING_WORKERS = int(os.environ.get("NEUROGEMS_TRAINING_WORKERS", 1))
+
+# How often, in seconds, the progress reported by the worker processes is forwarded
+PROGRESS_INTERVAL = 0.1
+
+
+def _train_modality(model, dataset, validation_type: str, validation_params: dict, parent_run_id: str, job: WorkerJob = None):
+    """
+    Trains the model of one dataset in an MLflow child run of the strategy run. In a worker
+    process, the model and the dataset are copies: the trained model is returned. The
+    progress is reported through `job`, which also tells the worker when to stop.
+    """
+    if job is not None:
+        set_current_job(job)
+
+    try:
+        setup_tracking()
+        with mlflow.start_run(run_name=dataset.name, nested=True, tags={"mlflow.parentRunId": parent_run_id, "dataset": dataset.name}):
+            X = dataset.get_data(drop_target=True)
+            if dataset.id_column is not None:
+                # Indexes the rows by id, so the out-of-sample probabilities are keyed on ids
+                X = X.copy(deep=False)
+                X.index = dataset.get_ids().to_numpy()
+            y, labels = dataset.get_encoded_target()
+            results = model.train(X, y, validation_type, validation_params, return_predictions=True, labels=labels)
+    finally:
+        if job is not None:
+            set_current_job(None)
+
+    return model, results
+
+
+def align_probabilities(model_results: List[dict]):
+    """
+    Aligns the out-of-sample probabilities of the models on their row ids, in the row order
+    of the first model.
+
+    Parameters:
+    -----------
+    model_results : List[dict]
+        The training results of each model, with their `row_ids`, `probabilities` and
+        `target`.
+
+    Returns:
+    --------
+    np.ndarray
+        The row ids.
+    np.ndarray
+        The encoded target of the rows.
+    np.ndarray
+        The float32 probabilities, of shape (n_models, n_rows, n_classes).
+
+    Raises:
+    -------
+    ValueError:
+        If the models were not evaluated on the same rows, or disagree on their target.
+    """
+    row_ids = np.asarray(model_results[0]["row_ids"])
+    target = np.asarray(model_results[0]["target"])
+    n_classes = model_results[0]["probabilities"].shape[1]
+    probabilities = np.empty((len(model_results), len(row_ids), n_classes), dtype=np.float32)
+
+    order = np.argsort(row_ids, kind="stable")
+    sorted_row_ids = row_ids[order]
+    for model_index, results in enumerate(model_results):
+        model_row_ids = np.asarray(results["row_ids"])
+        if np.array_equal(model_row_ids, row_ids):
+            positions = slice(None)
+        else:
+            # Finds the position of each row of the first model in the rows of this model
+            model_order = np.argsort(model_row_ids, kind="stable")
+            if len(model_row_ids) != len(row_ids) or not np.array_equal(model_row_ids[model_order], sorted_row_ids):
+                raise ValueError(f"Model {model_index + 1} was not evaluated on the same rows as model 1. The datasets must "
+                                 "have the same rows, or the same ids, and the same validation parameters")
+            positions = np.empty(len(row_ids), dtype=np.intp)
+            positions[order] = model_order
+
+        if results["probabilities"].shape[1] != n_classes:
+            raise ValueError(f"Model {model_index + 1} does not have the same classes as model 1")
+        if not np.array_equal(np.asarray(results["target"])[positions], target):
+            raise ValueError(f"Model {model_index + 1} does not have the same target as model 1 for the same rows")
+        probabilities[model_index] = results["probabilities"][positions]
+
+    return row_ids, target, probabilities
+
+
+def vote_scores(probabilities: np.ndarray, weights: np.ndarray, voting_type: str = "hard") -> np.ndarray:
+    """
+    Returns the weighted votes of the models for each class. See `vote`.
+
+    Returns:
+    --------
+    np.ndarray
+        The score of each class for each row, of shape (n_rows, n_classes).
+    """
+    n_models, n_rows, n_classes = probabilities.shape
+    weights = np.asarray(weights, dtype=np.float64)
+
+    if voting_type == "hard":
+        votes = np.argmax(probabilities, axis=2)
+        return np.bincount((votes + np.arange(n_rows) * n_classes).ravel(), weights=np.repeat(weights, n_rows),
+                           minlength=n_rows * n_classes).reshape(n_rows, n_classes)
+
+    return np.einsum("m,mnc->nc", weights.astype(probabilities.dtype), probabilities)
+
+
+def vote(probabilities: np.ndarray, weights: np.ndarray, voting_type: str = "hard") -> np.ndarray:
+    """
+    Combines the probabilities of the models by weighted voting.
+
+    Parameters:
+    -----------
+    probabilities : np.ndarray
+        The probabilities of each model, of shape (n_models, n_rows, n_classes).
+    weights : np.ndarray
+        The weight of each model.
+    voting_type : str
+        "hard" to sum the weights of the models predicting each class, "soft" to sum the
+        weighted probabilities. Defaults to "hard".
+
+    Returns:
+    --------
+    np.ndarray
+        The predicted class of each row.
+    """
+    return np.argmax(vote_scores(probabilities, weights, voting_type), axis=1)
+
+
+# The metrics the weights can be optimised for, computed from confusion matrices so that
+# many candidate weights are scored at once. Per-class metrics are macro averaged
+OPTIMISABLE_METRICS = [
+    "accuracy_score",
+    "balanced_accuracy_score",
+    "cohen_kappa_score",
+    "f1_score",
+    "jaccard_score",
+    "matthews_corrcoef",
+    "precision_score",
+    "recall_score",
+]
+
+
+def _score_confusions(metric: str, confusions: np.ndarray) -> np.ndarray:
+    """
+    Returns the metric computed from confusion matrices of shape (n_candidates, n_classes,
+    n_classes), with the true classes on the rows.
+    """
+    n = confusions.sum(axis=(1, 2)).astype(np.float64)
+    true = confusions.sum(axis=2).astype(np.float64)
+    predicted = confusions.sum(axis=1).astype(np.float64)
+    correct = np.diagonal(confusions, axis1=1, axis2=2).astype(np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recall = np.nan_to_num(correct / true)
+        precision = np.nan_to_num(correct / predicted)
+
+        if metric == "accuracy_score":
+            return correct.sum(axis=1) / n
+        if metric == "balanced_accuracy_score":
+            return recall.sum(axis=1) / np.maximum((true > 0).sum(axis=1), 1)
+        if metric == "precision_score":
+            return precision.mean(axis=1)
+        if metric == "recall_score":
+            return recall.mean(axis=1)
+        if metric == "f1_score":
+            return np.nan_to_num(2 * precision * recall / (precision + recall)).mean(axis=1)
+        if metric == "jaccard_score":
+            return np.nan_to_num(correct / (true + predicted - correct)).mean(axis=1)
+
+        agreement = (true * predicted).sum(axis=1)
+        if metric == "cohen_kappa_score":
+            expected = agreement / n ** 2
+            return np.nan_to_num((correct.sum(axis=1) / n - expected) / (1 - expected))
+        if metric == "matthews_corrcoef":
+            covariance = correct.sum(axis=1) * n - agreement
+            return np.nan_to_num(covariance / np.sqrt((n ** 2 - (true ** 2).sum(axis=1)) * (n ** 2 - (predicted ** 2).sum(axis=1))))
+
+    raise ValueError("Metric cannot be optimised: " + metric)
+
+
+def optimise_weights(probabilities: np.ndarray, target: np.ndarray, metric: str = "accuracy_score", voting_type: str = "soft",
+                     n_steps: int = 20, max_iterations: int = 20) -> tuple:
+    """
+    Searches the voting weights maximising a metric of the fused predictions, by coordinate
+    ascent on the simplex: each weight in turn is moved along the segment between the
+    current weights and giving all the weight to its model, on a grid of `n_steps` steps,
+    until a sweep over all the weights improves nothing. All the steps of a segment are
+    scored at once from the cached probabilities, so the search takes milliseconds.
+
+    Parameters:
+    -----------
+    probabilities : np.ndarray
+        The out-of-sample probabilities of each model, of shape (n_models, n_rows,
+        n_classes).
+    target : np.ndarray
+        The encoded target of the rows.
+    metric : str
+        The metric to maximise, one of `OPTIMISABLE_METRICS`. Defaults to "accuracy_score".
+    voting_type : str
+        The voting used to fuse the predictions, "hard" or "soft". Defaults to "soft".
+    n_steps : int
+        The number of steps of the grid along each segment. Defaults to 20.
+    max_iterations : int
+        The maximum number of sweeps over the weights. Defaults to 20.
+
+    Returns:
+    --------
+    np.ndarray
+        The best weights, summing to 1.
+    float
+        The metric of the fused predictions with these weights.
+
+    Raises:
+    -------
+    ValueError:
+        If the metric cannot be optimised.
+    """
+    if metric not in OPTIMISABLE_METRICS:
+        raise ValueError("Metric cannot be optimised: " + metric)
+
+    n_models, n_rows, n_classes = probabilities.shape
+    target = np.asarray(target)
+    if voting_type == "hard":
+        # Hard voting is soft voting of one-hot predictions
+        votes = np.argmax(probabilities, axis=2)
+        probabilities = np.zeros(probabilities.shape, dtype=np.float32)
+        np.put_along_axis(probabilities, votes[:, :, None], 1, axis=2)
+
+    offsets = (target * n_classes)[None, :] + (np.arange(n_steps + 1) * n_classes ** 2)[:, None]
+
+    def score(steps, others, model_index):
+        # Scores the weights (1 - step) * others + step * model for each step at once
+        scores = (1 - steps)[:, None, None] * others[None] + steps[:, None, None] * probabilities[model_index][None]
+        predictions = np.argmax(scores, axis=2)
+        confusions = np.bincount((offsets[:len(steps)] + predictions).ravel(), minlength=len(steps) * n_classes ** 2)
+        return _score_confusions(metric, confusions.reshape(len(steps), n_classes, n_classes))
+
+    weights = np.full(n_models, 1 / n_models)
+    best_score = score(np.zeros(1), np.einsum("m,mnc->nc", weights.astype(np.float32), probabilities), 0)[0]
+    steps = np.linspace(0, 1, n_steps + 1)
+
+    for _ in range(max_iterations):
+        improved = False
+        for model_index in range(n_models):
+            other_weights = weights.copy()
+            other_weights[model_index] = 0
+            if other_weights.sum() == 0:
+                continue
+            other_weights /= other_weights.sum()
+            others = np.einsum("m,mnc->nc", other_weights.astype(np.float32), probabilities)
+
+            step_scores = score(steps, others, model_index)
+            best_step = np.argmax(step_scores)
+            if step_scores[best_step] > best_score + 1e-12:
+                best_score = step_scores[best_step]
+                weights = (1 - steps[best_step]) * other_weights
+                weights[model_index] += steps[best_step]
+                improved = True
+
+        if not improved:
+            break
+
+    return weights, float(best_score)
+
 
 class LateFusionStrategy(Strategy):
     """
@@ -32,6 +313,16 @@ class LateFusionStrategy(Strategy):
         Object for managing the list of models used in the strategy
     data_handler : DataHandler
         Object for managing the list of datasets used in the strategy
+    n_workers : int
+        Number of processes training the models concurrently
+    oof_row_ids : np.ndarray
+        Ids of the rows on which the models were evaluated during the last training
+    oof_probabilities : np.ndarray
+        Float32 out-of-sample probabilities of each model on these rows, of shape
+        (n_models, n_rows, n_classes)
+    random_state : int
+        Random state of the shuffled validation splits, drawn at the first training and
+        reused by the following ones, so that unchanged models are not trained again
 
     Methods:
     --------
@@ -41,8 +332,8 @@ class LateFusionStrategy(Strategy):
         Returns a list of datasets required by the strategy
     train() -> None:
         Trains the model using the data from the dataset
-    predict(X: np.ndarray) -> np.ndarray:
-        Predicts the output using the trained model
+    predict(data: dict, with_probability: bool = False) -> dict:
+        Predicts the output by the weighted vote of the trained models
 
     Example:
     --------
@@ -56,8 +347,9 @@ class LateFusionStrategy(Strategy):
     # train the model
     late_fusion.train()
 
-    # predict using the trained model
-    y_pred = late_fusion.predict(X_test)
+    # predict batches of rows, one DataFrame per dataset
+    for chunk in late_fusion.iter_predictions({"dataset_1": X_test}):
+        y_pred = chunk["predictions"]
     """
 
     def __init__(self, strategy_name: str, strategy_type:str, data_handler: DataHandler):
@@ -80,6 +372,11 @@ class LateFusionStrategy(Strategy):
         self._data_model_map = {}
         self.voting_type = "hard"
         self.voting_weights = None
+        self.n_workers = TRAINING_WORKERS
+        self.oof_row_ids = None
+        self.oof_probabilities = None
+        self._oof_target = None
+        self.random_state = None
 
     def add_model(self, model_name: str, model_type: str, model_params: dict = {}, model_input: str = None) -> None:
         """
@@ -113,9 +410,131 @@ class LateFusionStrategy(Strategy):
                 self.model_handler.models[model_name].model_input = model_input
             self._data_model_map[model_input] = model_name
 
+    def _seed_validation_params(self, validation_type: str, validation_params: dict) -> dict:
+        """
+        Returns the validation parameters with the random state of the strategy when the
+        split is shuffled without one, so that every model of the strategy is validated on
+        the same split, whose out-of-sample predictions can then be aligned. The random
+        state is drawn at the first training and kept, so that the trainings of the models
+        that did not change are found in the training memo of the model handler.
+
+        Parameters:
+        -----------
+        validation_type : str
+            The type of validation to use.
+        validation_params : dict
+            A dictionary of parameters for the validation.
+
+        Returns:
+        --------
+        dict
+            The validation parameters to pass to every model.
+        """
+        shuffle = validation_params.get("shuffle", validation_type == "holdout")
+        if not shuffle or validation_params.get("random_state") is not None:
+            return validation_params
+
+        if self.random_state is None:
+            self.random_state = int(np.random.SeedSequence().generate_state(1)[0])
+        return {**validation_params, "random_state": self.random_state}
+
+    def _train_models(self, parent_run_id: str, validation_type: str, validation_params: dict) -> dict:
+        """
+        Trains the model of each dataset, concurrently in up to `n_workers` processes. The
+        models are independent until the vote, so the training time is that of the slowest
+        model rather than the sum of all of them, while at most `n_workers` datasets are
+        held in memory at once. The progress of the workers is forwarded to the job, and
+        cancelling the job stops them at their next fold.
+
+        The trained models and their out-of-sample predictions are memoised by the model
+        handler: a model is only trained again if its type or parameters, its dataset or
+        the split plan changed, so changing one model only retrains that model, and
+        changing how the predictions are combined retrains none.
+
+        Parameters:
+        -----------
+        parent_run_id : str
+            The id of the MLflow run of the strategy, under which each model is logged as a
+            child run.
+        validation_type : str
+            The type of validation to use.
+        validation_params : dict
+            A dictionary of parameters for the validation.
+
+        Returns:
+        --------
+        dict
+            The training results of each model, keyed by the name of its dataset.
+        """
+        n_models = len(self._data_model_map)
+        keys, results = {}, {}
+        for dataset_name, model_name in self._data_model_map.items():
+            keys[dataset_name] = self.model_handler.get_training_key(model_name, self._get_data_key([dataset_name]), validation_type, validation_params, True)
+            results[dataset_name] = self.model_handler.get_trained_model(model_name, keys[dataset_name])
+            if results[dataset_name] is not None:
+                self._report_progress(stage="cached", model=model_name, n_models=n_models)
+        to_train = [dataset_name for dataset_name in self._data_model_map if results[dataset_name] is None]
+
+        if self.n_workers <= 1 or len(to_train) <= 1:
+            for model_index, dataset_name in enumerate(to_train):
+                model_name = self._data_model_map[dataset_name]
+                self._report_progress(stage="started", model_index=model_index + 1, n_models=len(to_train))
+                model, results[dataset_name] = _train_modality(self.model_handler.models[model_name], self.data_handler.datasets[dataset_name],
+                                                               validation_type, validation_params, parent_run_id)
+                self.model_handler.set_trained_model(model_name, keys[dataset_name], model, results[dataset_name])
+
+        else:
+            # The datasets are spilled to the columnar store, so they are pickled as their
+            # key and mapped by the workers rather than copied whole
+            for dataset_name in to_train:
+                self.data_handler.datasets[dataset_name].spill()
+
+            # The loky pool and manager do not re-import the main module in their processes,
+            # unlike the multiprocessing ones with the spawn and forkserver start methods
+            executor = loky.get_reusable_executor(max_workers=min(self.n_workers, len(to_train)))
+            with loky.backend.get_context("loky").Manager() as manager:
+                job = get_current_job()
+                worker_job = WorkerJob(job.id if job is not None else None, manager.Queue(), manager.Event())
+                futures = {
+                    executor.submit(_train_modality, self.model_handler.models[self._data_model_map[dataset_name]], self.data_handler.datasets[dataset_name],
+                                    validation_type, validation_params, parent_run_id, worker_job): dataset_name
+                    for dataset_name in to_train
+                }
+                self._report_progress(stage="started", model_index=1, n_models=len(to_train))
+
+                try:
+                    pending, n_trained = set(futures), 0
+                    while pending:
+                        done, pending = concurrent.futures.wait(pending, timeout=PROGRESS_INTERVAL, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                        # Forwards the fold progress of the workers to the job and the event
+                        # broker, which raises if the job was cancelled
+                        for progress in worker_job.get_progress():
+                            self._report_progress(**progress)
+                        if job is not None and job.cancel_requested:
+                            raise JobCancelled(f"Job {job.id} was cancelled")
+
+                        for future in done:
+                            dataset_name = futures[future]
+                            model, results[dataset_name] = future.result()
+                            self.model_handler.set_trained_model(self._data_model_map[dataset_name], keys[dataset_name], model, results[dataset_name])
+                            n_trained += 1
+                            self._report_progress(stage="trained", model=model.name, model_index=n_trained, n_models=len(to_train))
+                finally:
+                    # The running workers stop at their next progress report, and are waited
+                    # for before the manager shuts down
+                    worker_job.cancel()
+                    for future in futures:
+                        future.cancel()
+                    concurrent.futures.wait(futures)
+
+        return results
+
     def train(self, run_name=None, validation_type: str = "holdout", validation_params: dict = {}) -> None:
         """
-        Trains the models using the data from the dataset
+        Trains the models using the data from the dataset. Each model is trained in its own
+        MLflow child run, concurrently, and the predictions are combined once all the
+        models are trained.
 
         Parameters:
         -----------
@@ -129,38 +548,25 @@ class LateFusionStrategy(Strategy):
         None
         """
 
-        model_predictions = []
-        
-        mlflow.set_tracking_uri("file:public/mlruns")
+        validation_params = self._seed_validation_params(validation_type, validation_params)
+
+        setup_tracking()
         with mlflow.start_run(run_name=run_name) as run:
             
-            for dataset_name in self._data_model_map:
-                model_name = self._data_model_map[dataset_name]
-                X = self.data_handler.datasets[dataset_name].get_data(drop_target=True)
-                y = self.data_handler.datasets[dataset_name].get_target()
-                labels = y.unique()
-                self.results = self.model_handler.train_model(model_name, X, y, validation_type, validation_params, return_predictions=True)
-                model_predictions.append(self.results["probabilities"])
-                y_actual = self.results["target"]
+            model_results = self._train_models(run.info.run_id, validation_type, validation_params)
+
+            # The out-of-sample probabilities of the models, aligned on the row ids, in the
+            # order of the datasets
+            self.oof_row_ids, self._oof_target, self.oof_probabilities = align_probabilities([model_results[dataset_name] for dataset_name in self._data_model_map])
+            self.results = {key: value for key, value in model_results[list(self._data_model_map)[-1]].items() if key not in ["probabilities", "row_ids"]}
+            self._set_inputs(list(self._data_model_map), self.results['labels'])
 
             # combine the predictions from each model as a voting ensemble
-            voting_weights = np.array(self.voting_weights) if (self.voting_weights is not None and self.voting_weights != "None") else np.ones(len(model_predictions))
-            
-            if self.voting_type == "hard":
-                # make model predictions as a one-hot vector
-                model_predictions = np.eye(len(labels))[np.argmax(model_predictions, axis=2)]
-                # multiply the predictions with the weights
-                model_predictions *= voting_weights[:, None, None]
-                # sum the predictions and take the argmax
-                y_pred = np.argmax(np.sum(model_predictions, axis=0), axis=1)
-            else:
-                # multiply the predictions with the weights
-                model_predictions *= voting_weights[:, None, None]
-                # sum the predictions and take the argmax
-                y_pred = np.argmax(np.sum(model_predictions, axis=0), axis=1)
+            y_pred = vote(self.oof_probabilities, self._get_voting_weights(), self.voting_type)
 
             # calculate the metrics
-            self._log_metrics(y_actual, y_pred)
+            self._log_metrics(self._oof_target, y_pred)
+            self._report_progress(stage="completed", accuracy=self.results['accuracy'])
             shap_values = self.results.pop('shap_values')
 
             def plot_summary():
@@ -174,22 +580,126 @@ class LateFusionStrategy(Strategy):
 
         return self.results
 
-    # TODO: implement predict method
-    def predict(self, X: np.ndarray) -> np.ndarray:
+    def get_oof_predictions(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the out-of-sample target and probabilities of the models kept in memory
+        since the last training. A new training replaces them rather than changing them, so
+        they can be used while the strategy is trained again.
+
+        Raises:
+        -------
+        Exception:
+            If the strategy has not been trained.
+        """
+        if self.oof_probabilities is None:
+            raise Exception(f"Strategy {self.name} must be trained before optimising its weights")
+        return np.asarray(self._oof_target), self.oof_probabilities
+
+    def optimise_weights(self, metric: str = "accuracy_score", voting_type: str = None, apply: bool = False,
+                         predictions: Tuple[np.ndarray, np.ndarray] = None) -> dict:
         """
-        Predicts the output using the trained model
+        Searches the voting weights maximising a metric, from the out-of-sample
+        probabilities kept in memory since the last training, without retraining.
 
         Parameters:
         -----------
-        X : np.ndarray
-            The input data
+        metric : str
+            The metric to maximise, one of `OPTIMISABLE_METRICS`. Defaults to
+            "accuracy_score".
+        voting_type : str
+            "hard" or "soft". Defaults to the voting type of the strategy.
+        apply : bool
+            Whether to use the best weights, and the voting type, from now on. Defaults to
+            False.
+        predictions : Tuple[np.ndarray, np.ndarray]
+            The out-of-sample target and probabilities to search the weights on, as returned
+            by `get_oof_predictions`, e.g. taken under the lock of the strategy handler.
+            Defaults to those of the last training.
 
         Returns:
         --------
-        np.ndarray
-            The predicted output
+        dict
+            The best weights, in the order of the datasets, the optimised metric with these
+            weights and with equal weights, and the metrics of the fused predictions.
+
+        Raises:
+        -------
+        Exception:
+            If the strategy has not been trained.
+        """
+        y_actual, probabilities = predictions if predictions is not None else self.get_oof_predictions()
+
+        voting_type = voting_type or self.voting_type
+        start_time = time.perf_counter()
+        weights, score = optimise_weights(probabilities, y_actual, metric, voting_type)
+        elapsed_time = time.perf_counter() - start_time
+
+        y_pred = vote(probabilities, weights, voting_type)
+        equal_weights = np.ones(len(weights))
+        confusion = np.bincount(y_actual * probabilities.shape[2] + vote(probabilities, equal_weights, voting_type),
+                                minlength=probabilities.shape[2] ** 2).reshape(1, probabilities.shape[2], -1)
+
+        if apply:
+            self.voting_weights = weights.tolist()
+            self.voting_type = voting_type
+
+        precision, recall, f1_score, _ = sklearn.metrics.precision_recall_fscore_support(y_actual, y_pred, average=None, zero_division=0)
+        return {
+            "datasets": list(self._data_model_map),
+            "weights": weights.tolist(),
+            "voting": voting_type,
+            "metric": metric,
+            "score": score,
+            "equal_weights_score": float(_score_confusions(metric, confusion)[0]),
+            "accuracy": sklearn.metrics.accuracy_score(y_actual, y_pred) * 100,
+            "confusion_matrix": sklearn.metrics.confusion_matrix(y_actual, y_pred).tolist(),
+            "precision": precision.tolist(),
+            "recall": recall.tolist(),
+            "f1_score": f1_score.tolist(),
+            "time": elapsed_time
+        }
+
+    def _get_voting_weights(self) -> np.ndarray:
+        """
+        Returns the weight of each model, in the order of the datasets. Models have equal
+        weights if none were set.
+        """
+        if self.voting_weights is None or self.voting_weights == "None":
+            return np.ones(len(self._data_model_map))
+        return np.array(self.voting_weights, dtype=np.float64)
+
+    def _predict_probabilities(self, data: dict) -> np.ndarray:
+        """
+        Returns the probabilities predicted by the model of each dataset for aligned rows,
+        of shape (n_models, n_rows, n_classes).
         """
-        return self.model_handler.predict(self.model_handler.model_names[0], X)
+        return np.stack([
+            self.model_handler.predict_probabilities(self._data_model_map[dataset_name], data[dataset_name], len(self.labels))
+            for dataset_name in self.inputs
+        ])
+
+    def predict(self, data: dict, with_probability: bool = False) -> dict:
+        """
+        Predicts the output by the weighted vote of the models, each fitted on all the rows
+        of its dataset.
+
+        Parameters:
+        -----------
+        data : dict
+            A dictionary mapping each dataset name to a DataFrame of its features, with the
+            same rows in the same order.
+        with_probability : bool
+            Whether to return the weighted vote for each class, normalised to sum to 1.
+            Defaults to False.
+
+        Returns:
+        --------
+        dict
+            The predicted labels and, optionally, the probabilities.
+        """
+        weights = self._get_voting_weights()
+        scores = vote_scores(self._predict_probabilities(data), weights, self.voting_type)
+        return self._decode_predictions(np.argmax(scores, axis=1), scores / weights.sum() if with_probability else None)
     
 
     def get_requirements(self) -> List[dict]:
@@ -211,6 +721,10 @@ class LateFusionStrategy(Strategy):
 
         n_estimators = len(self.data_handler.datasets)
 
+        weights = [None]
+        if n_estimators <= MAX_ENUMERATED_WEIGHTS:
+            weights += list(permutations(range(1, n_estimators+1)))
+
         requirements.append({
             "name": "Output",
             "options": [{
@@ -220,8 +734,17 @@ class LateFusionStrategy(Strategy):
                 "library": "sklearn",
                 "params": {
                     "voting": ["hard", "soft"],
-                    "weights": [None] + list(permutations(range(1, n_estimators+1)))
-                }
+                    "weights": weights
+                },
+                "weight_space": {
+                    "type": "vector",
+                    "length": n_estimators,
+                    "min": 0,
+                    "max": None,
+                    "description": "One non-negative weight per model, in the order of the datasets"
+                },
+                # The weights can be searched for these metrics after training
+                "optimisable_metrics": OPTIMISABLE_METRICS
             }]
         })
 
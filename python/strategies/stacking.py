@@ -0,0 +1,216 @@
+from typing import List
+import numpy as np
+import pandas as pd
+
+from ..data import DataHandler
+from ..experiment import setup_tracking
+from ..lazy import lazy_import
+from ..model import MLModel
+from .late_fusion import LateFusionStrategy, align_probabilities
+
+mlflow = lazy_import("mlflow")
+shap = lazy_import("shap")
+
+
+class StackingStrategy(LateFusionStrategy):
+    """
+    A class for implementing stacked generalisation.
+    This strategy requires one model for every dataset and a meta-learner. The model of
+    each dataset is trained as in late fusion, and the meta-learner is trained on their
+    out-of-sample probabilities to combine them, instead of a fixed vote.
+
+    The dataset models and their out-of-sample probabilities are memoised when the split is
+    reproducible, so changing only the meta-learner does not retrain the dataset models.
+
+    Parameters:
+    -----------
+    name : str
+        Name of the strategy
+    model_handler : ModelHandler
+        Object for managing the list of models used in the strategy
+    data_handler : DataHandler
+        Object for managing the list of datasets used in the strategy
+
+    Attributes:
+    -----------
+    name : str
+        Name of the strategy
+    model_handler : ModelHandler
+        Object for managing the list of models used in the strategy
+    data_handler : DataHandler
+        Object for managing the list of datasets used in the strategy
+    meta_model_type : str
+        Type of the meta-learner
+    meta_model_params : dict
+        Parameters of the meta-learner
+    meta_model : MLModel
+        The meta-learner, fitted on all the out-of-sample probabilities after training
+
+    Methods:
+    --------
+    train() -> None:
+        Trains the dataset models, then the meta-learner on their predictions
+    predict(data: dict, with_probability: bool = False) -> dict:
+        Predicts the output of the meta-learner from the probabilities of the models
+
+    Example:
+    --------
+    # create a strategy object and add one model per dataset and a meta-learner
+    stacking = StackingStrategy("stacking", "stacking", data_handler)
+    stacking.add_model("model_1", "svm", {}, "dataset_1")
+    stacking.add_model("model_2", "knn", {}, "dataset_2")
+    stacking.add_model("meta_learner", "logistic_regression", {}, "Output")
+
+    # train the models
+    stacking.train()
+    """
+
+    def __init__(self, strategy_name: str, strategy_type: str, data_handler: DataHandler):
+        super().__init__(strategy_name, strategy_type, data_handler)
+        self.meta_model_name = "meta_learner"
+        self.meta_model_type = "logistic_regression"
+        self.meta_model_params = {}
+        self.meta_model = None
+
+    def add_model(self, model_name: str, model_type: str, model_params: dict = {}, model_input: str = None) -> None:
+        """
+        Adds a model to the strategy. The model of the "Output" input is the meta-learner.
+
+        Parameters:
+        -----------
+        model_name : str
+            The name of the model.
+        model_type : str
+            The type of model to use.
+        model_params : dict
+            A dictionary of parameters for the model. Defaults to {}.
+        model_input : str
+            The name of the dataset to use as input for the model, or "Output" for the
+            meta-learner. Defaults to None.
+        """
+        if model_input == "Output":
+            # Checks the model type and parameters
+            MLModel(model_name, model_type, model_params)
+            self.meta_model_name = model_name or "meta_learner"
+            self.meta_model_type = model_type
+            self.meta_model_params = model_params
+            self.meta_model = None
+        else:
+            super().add_model(model_name, model_type, model_params, model_input)
+
+    def get_meta_features(self, probabilities: np.ndarray, labels: List) -> pd.DataFrame:
+        """
+        Returns the features of the meta-learner: the probabilities of each class predicted
+        by each dataset model, side by side.
+
+        Parameters:
+        -----------
+        probabilities : np.ndarray
+            The probabilities of each model, of shape (n_models, n_rows, n_classes).
+        labels : List
+            The classes.
+
+        Returns:
+        --------
+        pd.DataFrame
+            The features, of shape (n_rows, n_models * n_classes).
+        """
+        n_models, n_rows, n_classes = probabilities.shape
+        columns = [f"{dataset_name}_{label}" for dataset_name in self._data_model_map for label in labels]
+        return pd.DataFrame(probabilities.transpose(1, 0, 2).reshape(n_rows, n_models * n_classes), columns=columns)
+
+    def train(self, run_name=None, validation_type: str = "holdout", validation_params: dict = {}) -> None:
+        """
+        Trains the dataset models, reusing their cached predictions when they did not
+        change, then trains the meta-learner on their out-of-sample probabilities with the
+        same validation, and finally fits it on all of them.
+
+        Parameters:
+        -----------
+        validation_type : str
+            The type of validation to use. Defaults to "holdout".
+        validation_params : dict
+            A dictionary of parameters for the validation. Defaults to {}.
+
+        Returns:
+        --------
+        dict
+            The results of the meta-learner.
+        """
+        validation_params = self._seed_validation_params(validation_type, validation_params)
+
+        setup_tracking()
+        with mlflow.start_run(run_name=run_name) as run:
+
+            model_results = self._train_models(run.info.run_id, validation_type, validation_params)
+            self.oof_row_ids, self._oof_target, self.oof_probabilities = align_probabilities([model_results[dataset_name] for dataset_name in self._data_model_map])
+            labels = model_results[list(self._data_model_map)[0]]["labels"]
+            X = self.get_meta_features(self.oof_probabilities, labels)
+
+            self._report_progress(stage="started", model=self.meta_model_name)
+            # The meta-learner used for prediction is fitted on all the predictions
+            self.meta_model = MLModel(self.meta_model_name, self.meta_model_type, self.meta_model_params)
+            with mlflow.start_run(run_name=self.meta_model_name, nested=True):
+                self.results = dict(self.meta_model.train(X, self._oof_target, validation_type, validation_params, labels=np.asarray(labels)))
+            self._set_inputs(list(self._data_model_map), labels)
+
+            self._log_metrics(self.results['target'], self.results['predictions'])
+            self._report_progress(stage="completed", accuracy=self.results['accuracy'])
+            shap_values = self.results.pop('shap_values')
+
+            def plot_summary():
+                shap.summary_plot(shap_values, show=False, color_bar=True)
+            self._log_image_artifact(plot_summary, "shap_summary_plot")
+
+            def plot_feature_importance():
+                shap.plots.bar(shap_values, show=False)
+            self._log_image_artifact(plot_feature_importance, "shap_feature_importance_plot")
+            self.results['artifact_uri'] = run.info.artifact_uri
+
+        return self.results
+
+    def predict(self, data: dict, with_probability: bool = False) -> dict:
+        """
+        Predicts the output with the meta-learner, from the probabilities of the dataset
+        models, all fitted on all their rows.
+
+        Parameters:
+        -----------
+        data : dict
+            A dictionary mapping each dataset name to a DataFrame of its features, with the
+            same rows in the same order.
+        with_probability : bool
+            Whether to return the probability of each class. Defaults to False.
+
+        Returns:
+        --------
+        dict
+            The predicted labels and, optionally, the probabilities.
+        """
+        X = self.get_meta_features(self._predict_probabilities(data), self.labels)
+        codes = np.asarray(self.meta_model.predict(X)['predictions'])
+        probabilities = self.meta_model._predict_probabilities(X, len(self.labels)) if with_probability else None
+        return self._decode_predictions(codes, probabilities)
+
+    def get_requirements(self) -> List[dict]:
+        """
+        Returns the required models and datasets for this strategy: one model per dataset,
+        and the meta-learner as the "Output".
+
+        Returns:
+        --------
+        A list of the inputs of the strategy and their supported models.
+        """
+        requirements = [
+            {
+                "name": dataset,
+                "options": self.model_handler.get_supported_models_information(),
+            }
+            for dataset in self.data_handler.datasets
+        ]
+        requirements.append({
+            "name": "Output",
+            "options": self.model_handler.get_supported_models_information(),
+        })
+
+        return requirements
@@ -1,10 +1,13 @@
 import numpy as np
-import mlflow
-import shap
 
 from ..data import DataHandler
+from ..experiment import setup_tracking
+from ..lazy import lazy_import
 from .base import Strategy
 
+mlflow = lazy_import("mlflow")
+shap = lazy_import("shap")
+
 
 class UnimodalStrategy(Strategy):
     """
@@ -39,7 +42,7 @@ class UnimodalStrategy(Strategy):
         Returns a list of datasets required by the strategy
     train() -> None:
         Trains the model using the data from the dataset
-    predict(X: np.ndarray) -> np.ndarray:
+    predict(data: dict, with_probability: bool = False) -> dict:
         Predicts the output using the trained model
 
     Example:
@@ -54,8 +57,9 @@ class UnimodalStrategy(Strategy):
     # train the model
     unimodal.train()
 
-    # predict using the trained model
-    y_pred = unimodal.predict(X_test)
+    # predict batches of rows of the dataset
+    for chunk in unimodal.iter_predictions({"dataset_1": X_test}):
+        y_pred = chunk["predictions"]
     """
 
     def __init__(self, strategy_name: str, strategy_type:str, data_handler: DataHandler):
@@ -102,13 +106,16 @@ class UnimodalStrategy(Strategy):
 
         # get the data from the dataset
         X = self.data_handler.datasets[model_input].get_data(drop_target=True)
-        y = self.data_handler.datasets[model_input].get_target()
+        y, labels = self.data_handler.datasets[model_input].get_encoded_target()
 
         # train the model
-        mlflow.set_tracking_uri("file:public/mlruns")
+        setup_tracking()
         with mlflow.start_run(run_name=run_name) as run:
-            self.results = self.model_handler.train_model(model_name, X, y, validation_type, validation_params)
+            self._report_progress(stage="started", model_index=1, n_models=1)
+            self.results = self.model_handler.train_model(model_name, X, y, validation_type, validation_params, labels=labels, data_key=self._get_data_key([model_input]))
+            self._set_inputs([model_input], self.results['labels'])
             self._log_metrics(self.results['target'], self.results['predictions'])
+            self._report_progress(stage="completed", accuracy=self.results['accuracy'])
             self.results['artifact_uri'] = run.info.artifact_uri
             shap_values = self.results.pop('shap_values')
 
@@ -122,21 +129,27 @@ class UnimodalStrategy(Strategy):
 
         return self.results
 
-    def predict(self, X: np.ndarray) -> np.ndarray:
+    def predict(self, data: dict, with_probability: bool = False) -> dict:
         """
-        Predicts the output using the trained model.
+        Predicts the output using the trained model, fitted on all the rows of the dataset.
 
         Parameters:
         -----------
-        X : np.ndarray
-            The input data
+        data : dict
+            A dictionary mapping the dataset name to a DataFrame of its features.
+        with_probability : bool
+            Whether to return the probability of each class. Defaults to False.
 
         Returns:
         --------
-        np.ndarray
-            The predicted output
+        dict
+            The predicted labels and, optionally, the probabilities.
         """
-        return self.model_handler.models[0].predict(X)
+        model_name = self.model_handler.model_names[0]
+        X = data[next(iter(self.inputs))]
+        codes = np.asarray(self.model_handler.predict(model_name, X)['predictions'])
+        probabilities = self.model_handler.predict_probabilities(model_name, X, len(self.labels)) if with_probability else None
+        return self._decode_predictions(codes, probabilities)
 
     def get_requirements(self) -> dict:
         """
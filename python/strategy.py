@@ -1,9 +1,23 @@
-from typing import Any, List
+from collections import Counter
+from typing import Any, Iterator, List
+import os
+import threading
+import pandas as pd
 from sklearn.model_selection import train_test_split, KFold, StratifiedKFold, LeaveOneOut
 
+from .cache import MODEL_CACHE, ModelCache, remove_old_versions
 from .data import DataHandler
 from .model import ModelHandler
-from .strategies import Strategy, EarlyFusionStrategy, LateFusionStrategy, UnimodalStrategy
+from .strategies import Strategy, EarlyFusionStrategy, LateFusionStrategy, StackingStrategy, UnimodalStrategy
+from .strategies.base import PREDICTION_CHUNK_SIZE
+
+##########################################################################################
+
+# The directory to which the trained strategies are saved to be served
+STRATEGIES_DIR = os.environ.get("NEUROGEMS_STRATEGIES_DIR", os.path.join(os.path.expanduser("~"), ".neurogems", "strategies"))
+
+# The saved strategies loaded into the model cache at startup, separated by commas
+WARM_STRATEGIES = [name.strip() for name in os.environ.get("NEUROGEMS_WARM_STRATEGIES", "").split(",") if name.strip()]
 
 ##########################################################################################
 
@@ -22,6 +36,11 @@ SUPPORTED_STRATEGIES = {
         "description": "Late Fusion",
         "class": LateFusionStrategy,
         "group": "Fusion"
+    },
+    "stacking": {
+        "description": "Stacking",
+        "class": StackingStrategy,
+        "group": "Fusion"
     }
 }
 
@@ -76,7 +95,8 @@ class StrategyHandler():
     Attributes:
     -----------
     strategies: dict
-        A dictionary mapping strategy names to their corresponding Strategy objects.
+        A dictionary mapping strategy names to their corresponding Strategy objects. The
+        dictionary is copy-on-write, so it can be read and iterated without locking.
 
     Methods:
     --------
@@ -88,8 +108,49 @@ class StrategyHandler():
         Returns a list of dictionaries containing information about the supported strategies.
     """
 
-    def __init__(self):
+    def __init__(self, directory: str = STRATEGIES_DIR, model_cache: ModelCache = MODEL_CACHE):
+        self.directory = directory
+        self.model_cache = model_cache
         self.strategies = {}
+        self._training = set()
+        self._readers = Counter()
+        self._lock = threading.Lock()
+
+    def _check_not_training(self, strategy_name: str) -> None:
+        """
+        Checks that the strategy is not being trained.
+
+        Parameters:
+        -----------
+        strategy_name: str
+            The name of the strategy to check.
+
+        Raises:
+        -------
+        Exception:
+            If the strategy is being trained.
+        """
+        if strategy_name in self._training:
+            raise Exception(f"Strategy {strategy_name} is being trained, please wait for the training to finish.")
+
+    def _check_not_in_use(self, strategy_name: str) -> None:
+        """
+        Checks that the strategy is neither being trained, nor predicting or being saved,
+        before it is changed.
+
+        Parameters:
+        -----------
+        strategy_name: str
+            The name of the strategy to check.
+
+        Raises:
+        -------
+        Exception:
+            If the strategy is being trained, predicting or being saved.
+        """
+        self._check_not_training(strategy_name)
+        if self._readers[strategy_name] > 0:
+            raise Exception(f"Strategy {strategy_name} is predicting or being saved, please wait for it to finish.")
 
     def add_strategy(self, strategy_name: str, strategy_type: str, data_handler: DataHandler) -> None:
         """
@@ -104,7 +165,11 @@ class StrategyHandler():
         """
         strategy_info = SUPPORTED_STRATEGIES[strategy_type]
         strategy_class = strategy_info["class"]
-        self.strategies[strategy_name] = strategy_class(strategy_name, strategy_type, data_handler)
+        strategy = strategy_class(strategy_name, strategy_type, data_handler)
+
+        with self._lock:
+            self._check_not_in_use(strategy_name)
+            self.strategies = {**self.strategies, strategy_name: strategy}
 
     def remove_strategy(self, strategy_name: str) -> None:
         """
@@ -115,7 +180,11 @@ class StrategyHandler():
         strategy_name: str
             The name of the strategy to remove.
         """
-        del self.strategies[strategy_name]
+        with self._lock:
+            self._check_not_in_use(strategy_name)
+            if strategy_name not in self.strategies:
+                raise KeyError("Strategy not found: " + strategy_name)
+            self.strategies = {name: strategy for name, strategy in self.strategies.items() if name != strategy_name}
 
     def add_model(self, strategy_name: str, model_name: str, model_type: str, model_parameters: dict = {}, model_input: str = None) -> None:
         """
@@ -134,10 +203,12 @@ class StrategyHandler():
         model_input: str, default=None
             The name of the dataset to use as input for the model.
         """
-        if model_input is None:
-            self.strategies[strategy_name].add_model(model_name, model_type, model_parameters)
-        else:
-            self.strategies[strategy_name].add_model(model_name, model_type, model_parameters, model_input)
+        with self._lock:
+            self._check_not_in_use(strategy_name)
+            if model_input is None:
+                self.strategies[strategy_name].add_model(model_name, model_type, model_parameters)
+            else:
+                self.strategies[strategy_name].add_model(model_name, model_type, model_parameters, model_input)
 
 
     def get_strategy(self, strategy_name: str) -> Strategy:
@@ -168,7 +239,280 @@ class StrategyHandler():
         validation_parameters: dict, default={}
             The parameters of the validation to use.
         """
-        return self.strategies[strategy_name].train(run_name, validation_type, validation_parameters)
+        with self._lock:
+            self._check_not_in_use(strategy_name)
+            strategy = self.strategies[strategy_name]
+            self._training.add(strategy_name)
+
+        try:
+            return strategy.train(run_name, validation_type, validation_parameters)
+        finally:
+            with self._lock:
+                self._training.discard(strategy_name)
+
+    def optimise_strategy_weights(self, strategy_name: str, metric: str = "accuracy_score", voting_type: str = None, apply: bool = False) -> dict:
+        """
+        Searches the voting weights of a late fusion strategy maximising a metric, without
+        retraining it. The search runs outside the lock of the handler, on the out-of-sample
+        predictions of the strategy taken under it, so that it does not block the other
+        strategies.
+
+        Parameters:
+        -----------
+        strategy_name: str
+            The name of the strategy.
+        metric: str, default="accuracy_score"
+            The metric to maximise.
+        voting_type: str, default=None
+            "hard" or "soft", the voting type of the strategy if None.
+        apply: bool, default=False
+            Whether the strategy uses the best weights from now on.
+
+        Returns:
+        --------
+        The best weights and the metrics of the fused predictions.
+
+        Raises:
+        -------
+        Exception:
+            If the strategy does not vote, is being trained, or was changed during the search
+            of weights to apply.
+        """
+        with self._lock:
+            self._check_not_in_use(strategy_name)
+            strategy = self.strategies[strategy_name]
+            if not isinstance(strategy, LateFusionStrategy) or isinstance(strategy, StackingStrategy):
+                raise Exception(f"Strategy {strategy_name} does not combine its models by voting")
+            predictions = strategy.get_oof_predictions()
+            voting_type = voting_type or strategy.voting_type
+
+        results = strategy.optimise_weights(metric, voting_type, predictions=predictions)
+
+        if apply:
+            with self._lock:
+                self._check_not_in_use(strategy_name)
+                if self.strategies.get(strategy_name) is not strategy or strategy.oof_probabilities is not predictions[1]:
+                    raise Exception(f"Strategy {strategy_name} was changed while its weights were optimised")
+                strategy.voting_weights = results["weights"]
+                strategy.voting_type = results["voting"]
+
+        return results
+
+    def _get_prediction_data(self, strategy: Strategy, rows=None, datasets=None, data_handler: DataHandler = None) -> dict:
+        """
+        Returns the rows to predict with a strategy, as a DataFrame per input dataset of the
+        strategy, from records or from loaded datasets. A list of records or a dataset name
+        is the input of a strategy with a single dataset. The datasets are looked up in
+        `data_handler`, or in the data handler of the strategy.
+        """
+        data_handler = data_handler or strategy.data_handler
+        input_names = list(strategy.inputs)
+        if isinstance(rows, list) or isinstance(datasets, str):
+            if len(input_names) != 1:
+                raise ValueError(f"Strategy {strategy.name} predicts from several datasets: " + ", ".join(input_names))
+            rows = {input_names[0]: rows} if isinstance(rows, list) else rows
+            datasets = {input_names[0]: datasets} if isinstance(datasets, str) else datasets
+
+        data = {}
+        for input_name, records in (rows or {}).items():
+            data[input_name] = pd.DataFrame.from_records(records)
+        for input_name, dataset_name in (datasets or {}).items():
+            if data_handler is None or dataset_name not in data_handler.datasets:
+                raise KeyError("Dataset not found: " + dataset_name)
+            data[input_name] = data_handler.datasets[dataset_name].data
+
+        return data
+
+    def predict_strategy(self, strategy_name: str, rows=None, datasets=None, chunk_size: int = PREDICTION_CHUNK_SIZE,
+                         with_probability: bool = False, data_handler: DataHandler = None) -> Iterator[dict]:
+        """
+        Predicts a batch of rows with a trained strategy, one chunk of rows at a time. The
+        strategy cannot be changed or trained while its predictions are streamed. Strategies
+        that are not in the handler are served from their saved copy, through the model
+        cache.
+
+        Parameters:
+        -----------
+        strategy_name: str
+            The name of the strategy.
+        rows: dict or list, default=None
+            The records to predict for each dataset of the strategy, or the records of its
+            only dataset.
+        datasets: dict or str, default=None
+            The name of the loaded dataset to predict for each dataset of the strategy, or
+            for its only dataset.
+        chunk_size: int, default=PREDICTION_CHUNK_SIZE
+            The maximum number of rows per chunk.
+        with_probability: bool, default=False
+            Whether to return the probability of each class.
+        data_handler: DataHandler, default=None
+            The handler of the datasets to predict, the data handler of the strategy if None.
+
+        Returns:
+        --------
+        An iterator over the predictions of each chunk. The inputs are checked before this
+        returns.
+
+        Raises:
+        -------
+        Exception:
+            If the strategy is being trained or has not been trained.
+        KeyError:
+            If the strategy or a dataset is not found.
+        ValueError:
+            If the rows are missing features or cannot be joined.
+        """
+        with self._lock:
+            strategy = self.strategies.get(strategy_name)
+            if strategy is not None:
+                self._check_not_training(strategy_name)
+
+        if strategy is None:
+            # The cached strategies are only shared with other predictions
+            strategy = self.get_saved_strategy(strategy_name)
+            data = self._get_prediction_data(strategy, rows, datasets, data_handler)
+            return strategy.iter_predictions(data, chunk_size, with_probability)
+
+        if not strategy.is_trained:
+            raise Exception(f"Strategy {strategy_name} must be trained before predicting")
+        chunks = strategy.iter_predictions(self._get_prediction_data(strategy, rows, datasets, data_handler), chunk_size, with_probability)
+
+        def stream():
+            # A training may have started since the inputs were checked
+            with self._lock:
+                self._check_not_training(strategy_name)
+                self._readers[strategy_name] += 1
+            try:
+                yield from chunks
+            finally:
+                with self._lock:
+                    self._readers[strategy_name] -= 1
+
+        return stream()
+
+    def _get_strategy_path(self, strategy_name: str) -> str:
+        """
+        Returns the directory of a saved strategy.
+
+        Raises:
+        -------
+        ValueError:
+            If the name of the strategy is not a valid directory name.
+        """
+        if not strategy_name or os.path.basename(strategy_name) != strategy_name or strategy_name in [".", ".."]:
+            raise ValueError("Invalid strategy name: " + str(strategy_name))
+        return os.path.join(self.directory, strategy_name)
+
+    def save_strategy(self, strategy_name: str) -> None:
+        """
+        Saves a trained strategy, replacing its previous copy, so that it can be loaded
+        again or served from the model cache. The new version is swapped in atomically, so
+        predictions from the saved strategy never find it missing, and the old version is
+        removed once dropped from the model cache.
+
+        Parameters:
+        -----------
+        strategy_name: str
+            The name of the strategy.
+
+        Raises:
+        -------
+        Exception:
+            If the strategy is being trained or has not been trained.
+        """
+        path = self._get_strategy_path(strategy_name)
+        with self._lock:
+            self._check_not_training(strategy_name)
+            strategy = self.strategies[strategy_name]
+            self._readers[strategy_name] += 1
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            strategy.save(path)
+        finally:
+            with self._lock:
+                self._readers[strategy_name] -= 1
+
+        # The cached strategy maps the files of the old version, it is dropped first
+        self.model_cache.invalidate(path)
+        remove_old_versions(path)
+
+    def load_strategy(self, strategy_name: str, data_handler: DataHandler) -> None:
+        """
+        Loads a saved strategy into the handler, replacing the strategy with the same name,
+        so that it can be changed or trained again.
+
+        Parameters:
+        -----------
+        strategy_name: str
+            The name of the strategy.
+        data_handler: DataHandler
+            The datasets of the strategy.
+
+        Raises:
+        -------
+        KeyError:
+            If the strategy is not saved.
+        """
+        path = self._get_strategy_path(strategy_name)
+        if not os.path.isdir(path):
+            raise KeyError("Saved strategy not found: " + strategy_name)
+
+        # A copy of its own, as the strategies of the handler can be changed
+        strategy = Strategy.load(path, data_handler)
+        with self._lock:
+            self._check_not_in_use(strategy_name)
+            self.strategies = {**self.strategies, strategy_name: strategy}
+
+    def get_saved_strategy(self, strategy_name: str) -> Strategy:
+        """
+        Returns a saved strategy from the model cache, loading it on a miss. The strategy
+        is shared by all the callers and must not be changed.
+
+        Parameters:
+        -----------
+        strategy_name: str
+            The name of the strategy.
+
+        Raises:
+        -------
+        KeyError:
+            If the strategy is not saved.
+        """
+        try:
+            return self.model_cache.get(self._get_strategy_path(strategy_name), Strategy.load)
+        except KeyError:
+            raise KeyError("Saved strategy not found: " + strategy_name)
+
+    def warm_up(self, strategy_names: List[str] = WARM_STRATEGIES) -> List[str]:
+        """
+        Loads saved strategies into the model cache, so that their first predictions do
+        not wait for them to load. Strategies that cannot be loaded are skipped.
+
+        Parameters:
+        -----------
+        strategy_names: List[str], default=WARM_STRATEGIES
+            The names of the strategies.
+
+        Returns:
+        --------
+        The names of the strategies loaded.
+        """
+        loaded = []
+        for strategy_name in strategy_names:
+            try:
+                self.get_saved_strategy(strategy_name)
+                loaded.append(strategy_name)
+            except Exception:
+                # e.g. the strategy was never saved, it is loaded by its first prediction
+                pass
+        return loaded
+
+    def get_model_cache_stats(self) -> dict:
+        """
+        Returns the hit and miss counters of the model cache, its size and its entries.
+        """
+        return self.model_cache.get_stats()
 
     def get_strategy_graph(self, strategy_name: str) -> dict:
         """
@@ -241,19 +585,22 @@ class StrategyHandler():
 
         return supported_validations_info
 
-    def get_supported_models_information(self, strategy_name: str) -> List[dict]:
+    def get_supported_models_information(self, strategy_name: str = None) -> List[dict]:
         """
         Returns a list of dictionaries containing information about the supported models.
 
         Parameters:
         -----------
-        strategy_name: str
-            The name of the strategy to get the supported models for.
+        strategy_name: str, default=None
+            The name of the strategy to get the supported models for. All the strategies
+            currently support the same models.
 
         Returns:
         --------
         A list of dictionaries containing information about the supported models.
         """
+        if strategy_name is None:
+            return ModelHandler().get_supported_models_information()
         return self.strategies[strategy_name].model_handler.get_supported_models_information()
 
     def get_strategy_requirements(self, strategy_name: str) -> List[dict]:
@@ -65,9 +65,15 @@ const NUMERIC_STATS_KEYS = ['mean', 'std', 'min', 'max', 'kurtosis', 'skewness']
 const NUMERIC_STATS_LABELS = ['Mean', 'Standard Deviation', 'Minimum', 'Maximum', 'Kurtosis', 'Skewness'];
 const CATEGORICAL_STATS_KEYS = ['n_distinct', 'n_missing', 'p_missing', 'imbalance'];
 const CATEGORICAL_STATS_LABELS = ['Number of Distinct Values', 'Missing Values', 'Missing Values (%)', 'Imbalance'];
+// Interval in milliseconds at which pending profiles are polled
+const PROFILE_POLL_INTERVAL = 2000;
 
 
 function formatProfile(profile) {
+  // Pending profiles are returned as null
+  if (!profile) {
+    return profile;
+  }
   profile.table.p_cells_missing = `${(profile.table.p_cells_missing * 100).toFixed(2)}%`;
   profile.table.memory_size = `${(profile.table.memory_size / 1024 / 1024).toFixed(1)} MB`;
   profile.table.record_size = `${(profile.table.record_size / 1024).toFixed(1)} KB`;
@@ -188,22 +194,44 @@ export default function DataPage() {
     // showAlert('info', 'New data is being processed. Please wait.');
     setLoading(true);
     get(
-      `add-dataset${requestHeader({ 'name': inputDatasetName, 'path': inputFile.path, 'return_information': true, 'return_profile': true, 'target_column': inputTargetColumn })}`, // Route
+      `add-dataset${requestHeader({ 'name': inputDatasetName, 'path': inputFile.path, 'return_information': true, 'return_profile': true, 'wait_profile': false, 'target_column': inputTargetColumn })}`, // Route
       (response) => handleDialogResponse(response), // Success
       (error) => showAlert('error', error.message) // Error
     );
   };
 
   // Effects
+  const profilesPending = datasets.some((dataset) => dataset.profile_state === 'pending');
+
   useEffect(() => {
     let isMounted = true;
     get(
-      `get-datasets-information${requestHeader({ 'return_profile': true })}`, // Route
+      `get-datasets-information${requestHeader({ 'return_profile': true, 'wait_profile': false })}`, // Route
       (response) => { if (isMounted) { handleDatasetsResponse(response); } }, // Success
       (error) => showAlert('error', error.message) // Error
     );
     return () => { isMounted = false; };
-  });
+  }, []);
+
+  // The profiles are generated in the background, poll until they are all ready
+  useEffect(() => {
+    if (!profilesPending) {
+      return undefined;
+    }
+    let isMounted = true;
+    const interval = setInterval(() => get(
+      `get-datasets-information${requestHeader({ 'return_profile': true, 'wait_profile': false })}`, // Route
+      (response) => { if (isMounted) { handleDatasetsResponse(response); } }, // Success
+      (error) => showAlert('error', error.message) // Error
+    ), PROFILE_POLL_INTERVAL);
+    return () => {
+      isMounted = false;
+      clearInterval(interval);
+    };
+  }, [profilesPending]);
+
+  const profileMissing = (datasets.length === 0) || !datasets[tab] || !datasets[tab].profile;
+  const profilePending = profileMissing && Boolean(datasets[tab]) && datasets[tab].profile_state === 'pending';
 
   const tabColors = [
     blue, // a cool, calming color that's easy on the eyes
@@ -314,7 +342,7 @@ export default function DataPage() {
                     <input
                       required
                       type="file"
-                      accept=".csv"
+                      accept=".csv,.parquet,.pq,.feather,.arrow,.ipc"
                       onChange={ (event) => setInputFile(event.target.files[0]) }
                       hidden
                     />
@@ -401,8 +429,8 @@ export default function DataPage() {
             <Card>
               <CardHeader title="Statistics" />
               <CardContent>
-                { (datasets.length === 0) ? (
-                  showSkeleton ? (
+                { profileMissing ? (
+                  (showSkeleton || profilePending) ? (
                     <TableContainer>
                       <Table>
                         <TableBody>
@@ -451,8 +479,8 @@ export default function DataPage() {
             <Card>
               <CardHeader title="Variables" />
               <CardContent>
-                { (datasets.length === 0) ? (
-                  showSkeleton ? (
+                { profileMissing ? (
+                  (showSkeleton || profilePending) ? (
                     <TableContainer>
                       <Table>
                         <TableBody>
@@ -499,11 +527,11 @@ export default function DataPage() {
 
           <Grid item xs={ 12 } md={ 6 } lg={ 4 }>
             {/* TODO: check if target_column is categorical or continuous */}
-            { (datasets.length === 0) ? (
+            { profileMissing ? (
               <Card>
                 <CardHeader title="Class Labels" />
                 <CardContent>
-                  { showSkeleton ? (
+                  { (showSkeleton || profilePending) ? (
                     <Skeleton variant="circular" animation="wave" width={ 250 } height={ 250 } sx={ { mx: 'auto', my: 2 } } />
                   ) : (
                     <Typography variant="subtitle1" sx={ { my: 2, color: theme.palette.text.disabled } }>
@@ -532,7 +560,7 @@ export default function DataPage() {
             <Card>
               <CardHeader title="Feature Visualizer" />
               <CardContent>
-                { (datasets.length === 0) ? (
+                { profileMissing ? (
                   <Typography variant="subtitle1" sx={ { my: 2, color: theme.palette.text.disabled } }>
                     No data to display
                   </Typography>
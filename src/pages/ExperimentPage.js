@@ -320,6 +320,27 @@ export default function ExperimentPage() {
     showAlert('success', 'Training complete!');
   };
 
+  const pollTrainingJob = (jobId) => {
+    get(
+      `get-job-status${requestHeader({ job_id: jobId })}`, // Route
+      (response) => {
+        if (response.status === 'completed') {
+          get(
+            `get-job-results${requestHeader({ job_id: jobId })}`, // Route
+            (results) => handleTrainingResponse(results), // Response callback
+            (error) => console.error(error) // Error callback
+          );
+        } else if (response.status === 'failed' || response.status === 'cancelled') {
+          setTraining(false);
+          showAlert('error', `Training ${response.status}${response.error ? `: ${response.error}` : ''}`);
+        } else {
+          setTimeout(() => pollTrainingJob(jobId), 1000);
+        }
+      },
+      (error) => console.error(error) // Error callback
+    );
+  };
+
   const handleTrainModel = () => {
     setTraining(true);
     const body = JSON.stringify({
@@ -331,7 +352,7 @@ export default function ExperimentPage() {
     setTimeout(() => post(
       body, // Body
       'train-strategy', // Route
-      (response) => handleTrainingResponse(response), // Response callback
+      (response) => pollTrainingJob(response.job_id), // Response callback
       (error) => console.error(error) // Error callback
     ), 1000);
   };
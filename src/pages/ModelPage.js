@@ -181,6 +181,7 @@ export default function ModelPage() {
           />
         );
       case 'late_fusion':
+      case 'stacking':
         return (
           <LateFusionInput
             strategyName={ strategyName }
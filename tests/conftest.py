@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# The caches, store and strategies are written to a temporary directory rather than the
+# user's, before the modules reading these variables are imported
+_TEST_DIR = tempfile.mkdtemp(prefix="neurogems-tests-")
+os.environ.setdefault("NEUROGEMS_CACHE_DIR", os.path.join(_TEST_DIR, "cache"))
+os.environ.setdefault("NEUROGEMS_STRATEGIES_DIR", os.path.join(_TEST_DIR, "strategies"))
+os.environ.setdefault("NEUROGEMS_PERSIST_DATASETS", "false")
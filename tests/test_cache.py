@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+
+from python.cache import ModelCache, get_current_directory, get_object_size, make_temporary_directory, replace_directory
+
+
+def _save(path, array):
+    temporary_path = make_temporary_directory(path)
+    np.save(os.path.join(temporary_path, "array.npy"), array)
+    replace_directory(temporary_path, path)
+
+
+def _load(path):
+    return np.load(os.path.join(get_current_directory(path), "array.npy"), mmap_mode="r")
+
+
+def test_object_size_counts_arrays(tmp_path):
+    array = np.zeros(100000)
+    assert array.nbytes <= get_object_size({"array": array}) < array.nbytes + 1024
+
+    # Memory-mapped arrays are counted by their size too
+    path = str(tmp_path / "entry")
+    _save(path, array)
+    assert array.nbytes <= get_object_size(_load(path)) < array.nbytes + 1024
+
+
+def test_cache_hits_and_reloads(tmp_path):
+    cache = ModelCache()
+    path = str(tmp_path / "entry")
+    _save(path, np.arange(10))
+
+    first = cache.get(path, _load)
+    assert cache.get(path, _load) is first
+
+    _save(path, np.arange(20))
+    assert len(cache.get(path, _load)) == 20
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_cache_evicts_by_loaded_size(tmp_path):
+    array = np.random.default_rng(0).random(10000)
+    cache = ModelCache(max_size=int(array.nbytes * 1.5))
+    paths = [str(tmp_path / name) for name in ["first", "second"]]
+    for path in paths:
+        _save(path, array)
+        cache.get(path, _load)
+
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert array.nbytes <= stats["size"] <= cache.max_size
+
+
+def test_cache_missing_path(tmp_path):
+    with pytest.raises(KeyError):
+        ModelCache().get(str(tmp_path / "missing"), _load)
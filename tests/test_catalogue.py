@@ -0,0 +1,71 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from python.catalogue import DatasetCatalogue
+from python.data import DataHandler, Dataset
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"x": np.arange(20.), "target": np.arange(20) % 2}).to_csv(path, index=False)
+    return str(path)
+
+
+def _handler(tmp_path, store_data=False):
+    return DataHandler(catalogue=DatasetCatalogue(str(tmp_path / "catalogue.json"), store_data))
+
+
+def _wait(handler):
+    handler._catalogue_executor.submit(lambda: None).result()
+
+
+def test_rehydrate_from_store(tmp_path, csv_path, monkeypatch):
+    handler = _handler(tmp_path, store_data=True)
+    handler.add_dataset("data", csv_path, "target", columns=["x"])
+    _wait(handler)
+    expected = handler.get_dataset("data").data
+
+    def load_data(*args):
+        raise AssertionError("The source file is read again")
+
+    monkeypatch.setattr(Dataset, "_load_data", load_data)
+    dataset = _handler(tmp_path).get_dataset("data")
+
+    assert dataset.memory_state == "spilled"
+    assert (dataset.columns, dataset.target_column) == (["x", "target"], "target")
+    pd.testing.assert_frame_equal(dataset.data, expected)
+
+
+def test_rehydrate_changed_file(tmp_path, csv_path):
+    handler = _handler(tmp_path, store_data=True)
+    handler.add_dataset("data", csv_path, "target")
+    _wait(handler)
+
+    pd.DataFrame({"x": np.arange(5.), "target": np.arange(5) % 2}).to_csv(csv_path, index=False)
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert len(_handler(tmp_path).get_dataset("data").data) == 5
+
+
+def test_removed_datasets_are_not_rehydrated(tmp_path, csv_path):
+    handler = _handler(tmp_path)
+    handler.add_dataset("first", csv_path, "target")
+    handler.add_dataset("second", csv_path, "target")
+    _wait(handler)
+    handler.rm_dataset("first")
+
+    assert list(_handler(tmp_path).datasets) == ["second"]
+
+
+@pytest.mark.parametrize("contents", ["not json", json.dumps({"version": -1, "datasets": {}})])
+def test_unreadable_catalogue(tmp_path, contents):
+    path = tmp_path / "catalogue.json"
+    path.write_text(contents)
+
+    assert DatasetCatalogue(str(path)).load() == {}
@@ -0,0 +1,148 @@
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from python.data import DataHandler, Dataset
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "data.csv"
+    n_rows = 1000
+    pd.DataFrame({
+        "x": np.arange(n_rows, dtype=np.float64) / 3,
+        "missing": np.where(np.arange(n_rows) % 2 == 0, np.nan, 1.0),
+        "flag": np.arange(n_rows) % 3 == 0,
+        "target": np.arange(n_rows) % 2
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_mapped_dataset_counts_copied_columns(csv_path):
+    handler = DataHandler()
+    handler.add_dataset("mapped", csv_path, "target", use_store=True)
+    dataset = handler.get_dataset("mapped")
+
+    assert dataset.memory_state == "mapped"
+    # The columns with missing values and the booleans are copied out of the map
+    data = dataset.data
+    assert 0 < dataset.resident_size < int(data.memory_usage(index=False).sum())
+    assert dataset.resident_size >= data["missing"].nbytes + data["flag"].nbytes
+
+
+def test_memory_budget_spills_resident_datasets(csv_path):
+    handler = DataHandler(memory_budget=0)
+    handler.add_dataset("in_memory", csv_path, "target")
+    handler.add_dataset("mapped", csv_path, "target", use_store=True)
+    # The background profiles map the datasets back, so the budget is enforced after them
+    handler._profile_executor.submit(handler._enforce_memory_budget).result()
+
+    for name in ["in_memory", "mapped"]:
+        dataset = handler.get_dataset(name)
+        assert dataset.memory_state == "spilled"
+        assert dataset.resident_size == 0
+        assert dataset.spilled_size > 0
+
+    # Spilled datasets are mapped back on access
+    assert handler.get_dataset("in_memory").data.shape == (1000, 4)
+    assert handler.get_datasets_memory_information()["memory_budget"] == 0
+
+
+def test_dataset_information_does_not_wait_for_profile(csv_path, monkeypatch):
+    release = threading.Event()
+
+    def generate_profile(self, data, name):
+        release.wait(10)
+        return {"table": {"n": len(data)}}
+
+    monkeypatch.setattr(Dataset, "_generate_profile", generate_profile)
+    monkeypatch.setattr(Dataset, "_get_profile_options", lambda self: {"test": id(release)})
+    handler = DataHandler()
+    handler.add_dataset("pending", csv_path, "target")
+
+    information = handler.get_dataset_information("pending", return_profile=True, wait_profile=False)
+    assert information["profile_state"] == "pending"
+    assert information["profile"] is None
+
+    release.set()
+    handler.get_dataset("pending").start_profiling(handler._profile_executor).result()
+    information = handler.get_datasets_information(return_profile=True, wait_profile=False)[0]
+    assert information["profile_state"] == "ready"
+    assert information["profile"] == {"table": {"n": 1000}}
+
+
+def test_dataset_information_starts_pending_profiles(csv_path, monkeypatch):
+    monkeypatch.setattr(Dataset, "_generate_profile", lambda self, data, name: {"table": {"n": len(data)}})
+    monkeypatch.setattr(Dataset, "_get_profile_options", lambda self: {"test": "rehydrated"})
+    handler = DataHandler()
+    handler.datasets = {"rehydrated": Dataset("rehydrated", csv_path, "target")}
+    dataset = handler.get_dataset("rehydrated")
+    assert dataset.profile_state == "pending"
+
+    handler.get_datasets_information(return_profile=True, wait_profile=False)
+    dataset.start_profiling(handler._profile_executor).result()
+    assert dataset.profile_state == "ready"
+
+
+def test_parquet_dataset_with_columns_and_filters(tmp_path):
+    path = str(tmp_path / "data.parquet")
+    pd.DataFrame({"x": np.arange(10.), "y": np.arange(10.), "target": np.arange(10) % 2}).to_parquet(path)
+
+    handler = DataHandler()
+    handler.add_dataset("parquet", path, "target", columns=["x"], filters=[["x", ">=", 5]])
+    data = handler.get_dataset("parquet").data
+
+    # The target column is always loaded
+    assert sorted(data.columns) == ["target", "x"]
+    assert data["x"].tolist() == [5., 6., 7., 8., 9.]
+
+
+def test_stored_dataset_is_pickled_without_data(csv_path):
+    handler = DataHandler()
+    handler.add_dataset("mapped", csv_path, "target", use_store=True)
+    dataset = handler.get_dataset("mapped")
+
+    state = dataset.__getstate__()
+    assert "_data" not in state
+    unpickled = pickle.loads(pickle.dumps(dataset))
+    pd.testing.assert_frame_equal(unpickled.data, dataset.data)
+
+
+def _dataset(tmp_path, data, id_column=None):
+    path = str(tmp_path / "views.csv")
+    data.to_csv(path, index=False)
+    return Dataset("views", path, "target", id_column=id_column)
+
+
+def test_features_are_cached_views(tmp_path):
+    dataset = _dataset(tmp_path, pd.DataFrame({"id": np.arange(6), "x": np.arange(6.), "target": ["b", "a"] * 3}), "id")
+
+    features = dataset.get_data(drop_target=True)
+
+    assert list(features.columns) == ["x"]
+    assert dataset.get_data(drop_target=True) is features
+    assert np.shares_memory(features["x"].to_numpy(), dataset.data["x"].to_numpy())
+
+    dataset.data = dataset.data.iloc[:3]
+    assert len(dataset.get_data(drop_target=True)) == 3
+
+
+def test_encoded_target(tmp_path):
+    dataset = _dataset(tmp_path, pd.DataFrame({"x": np.arange(4.), "target": ["b", "a", "c", "a"]}))
+
+    codes, classes = dataset.get_encoded_target()
+
+    assert codes.tolist() == [1, 0, 2, 0]
+    assert classes.tolist() == ["a", "b", "c"]
+    assert not codes.flags.writeable
+    assert dataset.get_encoded_target()[0] is codes
+
+
+def test_encoded_target_with_missing_values(tmp_path):
+    dataset = _dataset(tmp_path, pd.DataFrame({"x": np.arange(3.), "target": [1, None, 0]}))
+
+    with pytest.raises(Exception, match="missing values"):
+        dataset.get_encoded_target()
@@ -0,0 +1,59 @@
+import threading
+
+from python.events import EVENT_BROKER, EventBroker
+from python.job import JobHandler, report_progress
+
+
+def test_filters():
+    broker = EventBroker()
+    subscription = broker.subscribe({"job_id": "a"})
+
+    broker.publish({"type": "progress", "job_id": "b"})
+    broker.publish({"type": "progress", "job_id": "a", "fold": 1})
+
+    event = subscription.get(timeout=1)
+    assert (event["job_id"], event["fold"]) == ("a", 1)
+    assert "timestamp" in event
+    assert subscription.get(timeout=0) is None
+
+
+def test_bounded_buffer_drops_oldest_events():
+    broker = EventBroker()
+    subscription = broker.subscribe(max_size=2)
+
+    for index in range(5):
+        broker.publish({"type": "progress", "index": index})
+
+    assert [subscription.get(timeout=0)["index"] for _ in range(2)] == [3, 4]
+    assert subscription.n_dropped == 3
+    assert broker.get_subscribers_information() == [{"filters": {}, "max_size": 2, "n_dropped": 3}]
+
+
+def test_unsubscribe_wakes_reader():
+    broker = EventBroker()
+    subscription = broker.subscribe()
+    events = []
+    reader = threading.Thread(target=lambda: events.append(subscription.get(timeout=10)))
+    reader.start()
+
+    broker.unsubscribe(subscription)
+    reader.join(5)
+
+    assert not reader.is_alive()
+    assert events == [None]
+    assert broker.n_subscribers == 0
+
+
+def test_job_progress_events():
+    handler = JobHandler()
+    subscription = EVENT_BROKER.subscribe({"type": "progress"})
+    try:
+        job_id = handler.submit_job("test", "progress", lambda: report_progress(fold=1, n_folds=2))
+        handler.get_job(job_id).future.result(timeout=10)
+
+        event = subscription.get(timeout=1)
+        assert (event["job_id"], event["fold"], event["n_folds"]) == (job_id, 1, 2)
+        assert handler.get_job_information(job_id)["progress"] == {"fold": 1, "n_folds": 2}
+    finally:
+        EVENT_BROKER.unsubscribe(subscription)
+        handler.shutdown(wait=True)
@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from python.fusion import FusedMatrix, join_datasets, join_frames
+
+
+def test_join_frames_on_ids():
+    first = pd.DataFrame({"id": [5, 3, 1, 4]})
+    second = pd.DataFrame({"id": [1, 2, 3, 5]})
+
+    ids, (first_positions, second_positions) = join_frames([first, second], ["id", "id"])
+
+    # The shared ids, in the order of the first frame
+    assert np.array_equal(ids, [5, 3, 1])
+    assert np.array_equal(first["id"].to_numpy()[first_positions], ids)
+    assert np.array_equal(second["id"].to_numpy()[second_positions], ids)
+
+
+def test_join_frames_compares_mixed_ids_as_strings():
+    ids, _ = join_frames([pd.DataFrame({"id": [1, 2]}), pd.DataFrame({"id": ["2", "1"]})], ["id", "id"])
+
+    assert list(ids) == ["1", "2"]
+
+
+def test_join_frames_by_position():
+    ids, positions = join_frames([pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"b": [3, 4]})], [None, None])
+
+    assert ids is None
+    assert all(np.array_equal(dataset_positions, [0, 1]) for dataset_positions in positions)
+
+
+@pytest.mark.parametrize("frames, id_columns", [
+    ([pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"b": [3]})], [None, None]),
+    ([pd.DataFrame({"id": [1]}), pd.DataFrame({"id": [1]})], ["id", None]),
+    ([pd.DataFrame({"id": [1]}), pd.DataFrame({"id": [2]})], ["id", "id"]),
+])
+def test_join_frames_errors(frames, id_columns):
+    with pytest.raises(ValueError):
+        join_frames(frames, id_columns)
+
+
+class _Dataset():
+    def __init__(self, data, id_column):
+        self.data = data
+        self.id_column = id_column
+
+
+def test_join_datasets():
+    ids, positions = join_datasets([_Dataset(pd.DataFrame({"id": ["b", "a"]}), "id"), _Dataset(pd.DataFrame({"id": ["a", "b", "c"]}), "id")])
+
+    assert list(ids) == ["b", "a"]
+    assert [list(dataset_positions) for dataset_positions in positions] == [[0, 1], [1, 0]]
+
+
+class FakeDataset():
+    # The part of the Dataset interface the fused matrix uses
+    def __init__(self, name, features, target, id_column=None, key="1"):
+        self.name = name
+        self.id_column = id_column
+        self.data = pd.DataFrame({**features, "target": target})
+        self.key = key
+        self.n_gathered = 0
+
+    def get_data_key(self):
+        return self.key
+
+    def get_data(self, drop_target=False):
+        self.n_gathered += 1
+        return self.data.drop(columns="target") if drop_target else self.data
+
+    def get_encoded_target(self):
+        classes, codes = np.unique(self.data["target"].to_numpy(), return_inverse=True)
+        return codes, classes
+
+
+def _datasets():
+    target = [0, 1, 0, 1]
+    return [FakeDataset(name, {name + "0": np.arange(4.) + offset, name + "1": np.arange(4.) * 2 + offset}, target)
+            for name, offset in [("x", 0), ("y", 10), ("z", 20)]]
+
+
+def _features(dataset):
+    return dataset.data.drop(columns="target").to_numpy()
+
+
+def test_fused_matrix_sync():
+    datasets = _datasets()
+    matrix = FusedMatrix()
+    matrix.sync(datasets)
+
+    assert matrix.block_names == ["x", "y", "z"]
+    assert matrix.columns == ["x0", "x1", "y0", "y1", "z0", "z1"]
+    assert np.array_equal(matrix.get_block("y"), _features(datasets[1]))
+    assert np.array_equal(matrix.target, [0, 1, 0, 1])
+
+
+def test_fused_matrix_keeps_dataset_order():
+    datasets = _datasets()
+    matrix = FusedMatrix()
+    matrix.sync(datasets)
+
+    datasets[0].key = "2"
+    datasets[0].data["x0"] = -1.0
+    matrix.sync(datasets)
+
+    assert matrix.block_names == ["x", "y", "z"]
+    assert np.array_equal(matrix.to_frame()["x0"], [-1.0] * 4)
+    assert np.array_equal(matrix.get_block("z"), _features(datasets[2]))
+
+    matrix.sync(datasets[1:])
+    assert matrix.block_names == ["y", "z"]
+
+
+def test_fused_matrix_does_not_overwrite_frames():
+    datasets = _datasets()
+    matrix = FusedMatrix()
+    matrix.sync(datasets)
+    frame = matrix.to_frame()
+    expected = frame.copy()
+
+    datasets[1].key = "2"
+    datasets[1].data["y0"] = -1.0
+    matrix.sync(datasets)
+    matrix.remove_block("x")
+
+    assert frame.equals(expected)
+    assert matrix.columns == ["y0", "y1", "z0", "z1"]
+    assert np.array_equal(matrix.to_frame()["y0"], [-1.0] * 4)
+
+
+def test_fused_matrix_remove_block():
+    datasets = _datasets()
+    matrix = FusedMatrix()
+    matrix.sync(datasets)
+
+    matrix.remove_block("y")
+
+    assert matrix.block_names == ["x", "z"]
+    assert matrix.get_block_range("z") == (2, 4)
+    assert np.array_equal(matrix.get_block("z"), _features(datasets[2]))
+    with pytest.raises(KeyError):
+        matrix.remove_block("y")
+
+
+def test_fused_matrix_prefixes_duplicate_columns():
+    target = [0, 1]
+    matrix = FusedMatrix()
+    matrix.sync([FakeDataset("x", {"a": [1., 2.]}, target), FakeDataset("y", {"a": [3., 4.], "b": [5., 6.]}, target)])
+
+    assert matrix.columns == ["x.a", "y.a", "b"]
+
+
+def test_fused_matrix_only_gathers_changed_blocks():
+    datasets = _datasets()
+    matrix = FusedMatrix()
+    matrix.sync(datasets)
+    frame = matrix.to_frame()
+    expected = frame.copy()
+
+    datasets[1].key = "2"
+    datasets[1].data["y0"] = -1.0
+    matrix.sync(datasets)
+
+    assert [dataset.n_gathered for dataset in datasets] == [1, 2, 1]
+    assert np.array_equal(matrix.to_frame()["y0"], [-1.0] * 4)
+    assert np.array_equal(matrix.get_block("z"), _features(datasets[2]))
+    assert frame.equals(expected)
+
+
+def test_fused_matrix_replaces_block_with_new_width():
+    datasets = _datasets()
+    matrix = FusedMatrix()
+    matrix.sync(datasets)
+
+    datasets[0].key = "2"
+    datasets[0].data["x2"] = 7.0
+    matrix.sync(datasets)
+
+    assert matrix.columns == ["x0", "x1", "x2", "y0", "y1", "z0", "z1"]
+    assert matrix.get_block_range("y") == (3, 5)
+    assert np.array_equal(matrix.get_block("z"), _features(datasets[2]))
+    assert [dataset.n_gathered for dataset in datasets] == [2, 1, 1]
+
+
+def test_fused_matrix_inserts_and_reorders_blocks():
+    x, y, z = _datasets()
+    matrix = FusedMatrix()
+    matrix.sync([x, z])
+
+    matrix.sync([x, y, z])
+    assert matrix.block_names == ["x", "y", "z"]
+    assert np.array_equal(matrix.get_block("y"), _features(y))
+    assert np.array_equal(matrix.get_block("z"), _features(z))
+
+    matrix.sync([x, z, y])
+    assert matrix.block_names == ["x", "z", "y"]
+    assert matrix.columns == ["x0", "x1", "z0", "z1", "y0", "y1"]
+    assert np.array_equal(matrix.get_block("y"), _features(y))
+    assert [dataset.n_gathered for dataset in (x, y, z)] == [1, 1, 1]
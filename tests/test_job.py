@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from python.job import JobHandler, report_progress
+
+
+@pytest.fixture
+def handler():
+    handler = JobHandler()
+    yield handler
+    handler.shutdown()
+
+
+def _wait(handler, job_id):
+    handler.get_job(job_id).future.result(timeout=10)
+    return handler.get_job_information(job_id)
+
+
+def test_job_results(handler):
+    job_id = handler.submit_job("test", "sum", sum, [1, 2, 3])
+
+    assert _wait(handler, job_id)["status"] == "completed"
+    assert handler.get_job_results(job_id) == 6
+
+
+def test_failed_job(handler):
+    def fail():
+        raise ValueError("broken")
+
+    job_id = handler.submit_job("test", "fail", fail)
+
+    information = _wait(handler, job_id)
+    assert (information["status"], information["error"]) == ("failed", "broken")
+    with pytest.raises(Exception, match="broken"):
+        handler.get_job_results(job_id)
+
+
+def test_cancel_jobs(handler):
+    started, release = threading.Event(), threading.Event()
+
+    def run():
+        started.set()
+        release.wait(10)
+        report_progress(step=1)
+
+    running_id = handler.submit_job("test", "running", run)
+    queued_id = handler.submit_job("test", "queued", run)
+    started.wait(10)
+
+    assert handler.cancel_job(queued_id)["status"] == "cancelled"
+    handler.cancel_job(running_id)
+    release.set()
+    # The running job stops at its next progress report
+    assert _wait(handler, running_id)["status"] == "cancelled"
+
+
+def test_max_pending_jobs():
+    handler = JobHandler(max_pending=1)
+    release = threading.Event()
+    try:
+        handler.submit_job("test", "blocking", release.wait, 10)
+        with pytest.raises(Exception, match="Too many pending jobs"):
+            handler.submit_job("test", "rejected", sum, [])
+    finally:
+        release.set()
+        handler.shutdown(wait=True)
+
+
+def test_finished_jobs_are_evicted_by_count():
+    handler = JobHandler(max_finished=2)
+    job_ids = [handler.submit_job("test", str(index), sum, [index]) for index in range(4)]
+    handler.shutdown(wait=True)
+
+    assert set(handler.jobs) == set(job_ids[2:])
+
+
+def test_finished_jobs_are_evicted_after_retention(handler):
+    # Every finished job is past its retention
+    handler.retention = -1
+    first_id = handler.submit_job("test", "first", sum, [])
+    handler.get_job(first_id).future.result(timeout=10)
+
+    handler.submit_job("test", "second", sum, [])
+    with pytest.raises(KeyError):
+        handler.get_job(first_id)
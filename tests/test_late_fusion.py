@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from python.data import DataHandler
+from python.model import SUPPORTED_VALIDATIONS
+from python.strategies.late_fusion import LateFusionStrategy, align_probabilities, optimise_weights, vote
+
+
+def _holdout_results(ids, target, validation_params, seed):
+    # The out-of-sample results of a model validated on a holdout split, as MLModel.train
+    # returns them
+    X = pd.DataFrame({"feature": np.arange(len(ids), dtype=float)}, index=ids)
+    _, _, _, y_test, _, test_index = SUPPORTED_VALIDATIONS["holdout"]["function"](X, target, np.arange(len(target)), **validation_params)
+    probabilities = np.random.default_rng(seed).random((len(test_index), 2)).astype(np.float32)
+    return {"row_ids": X.index.to_numpy()[test_index], "target": y_test, "probabilities": probabilities}
+
+
+def test_seed_validation_params():
+    strategy = LateFusionStrategy("late_fusion", "late_fusion", DataHandler())
+
+    params = strategy._seed_validation_params("holdout", {"test_size": 0.3})
+    assert isinstance(params["random_state"], int)
+    assert strategy._seed_validation_params("holdout", {"random_state": 3}) == {"random_state": 3}
+    assert strategy._seed_validation_params("kfold", {"n_splits": 5}) == {"n_splits": 5}
+    assert "random_state" not in strategy._seed_validation_params("holdout", {"shuffle": False})
+
+
+def test_seed_is_kept_across_trainings():
+    strategy = LateFusionStrategy("late_fusion", "late_fusion", DataHandler())
+    strategy.model_handler.add_model("model", "random_forest", {})
+
+    keys = []
+    for _ in range(2):
+        params = strategy._seed_validation_params("holdout", {"test_size": 0.3})
+        keys.append(strategy.model_handler.get_training_key("model", "data", "holdout", params))
+
+    assert params["random_state"] == strategy.random_state
+    assert keys[0] is not None and keys[0] == keys[1]
+
+
+def test_shuffled_split_aligns():
+    strategy = LateFusionStrategy("late_fusion", "late_fusion", DataHandler())
+    ids = np.arange(100) * 10
+    target = np.arange(100) % 2
+
+    params = strategy._seed_validation_params("holdout", {"test_size": 0.3})
+    row_ids, aligned_target, probabilities = align_probabilities([_holdout_results(ids, target, params, seed) for seed in range(2)])
+
+    assert len(row_ids) == 30
+    assert np.array_equal(aligned_target, target[row_ids // 10])
+    assert probabilities.shape == (2, 30, 2)
+
+
+def test_different_splits_do_not_align():
+    ids = np.arange(100)
+    target = ids % 2
+
+    with pytest.raises(ValueError):
+        align_probabilities([_holdout_results(ids, target, {"test_size": 0.3, "random_state": seed}, seed) for seed in range(2)])
+
+
+def test_align_probabilities_reorders_rows():
+    probabilities = np.array([[0.9, 0.1], [0.2, 0.8], [0.6, 0.4]], dtype=np.float32)
+    first = {"row_ids": np.array([3, 1, 2]), "target": np.array([0, 1, 0]), "probabilities": probabilities}
+    second = {"row_ids": np.array([1, 2, 3]), "target": np.array([1, 0, 0]), "probabilities": probabilities[[1, 2, 0]]}
+
+    row_ids, target, aligned = align_probabilities([first, second])
+
+    assert np.array_equal(row_ids, [3, 1, 2])
+    assert np.array_equal(target, [0, 1, 0])
+    assert aligned.dtype == np.float32
+    assert np.array_equal(aligned[0], aligned[1])
+
+
+def test_align_probabilities_rejects_different_targets():
+    probabilities = np.full((2, 2), 0.5, dtype=np.float32)
+    first = {"row_ids": np.array([1, 2]), "target": np.array([0, 1]), "probabilities": probabilities}
+    second = {"row_ids": np.array([2, 1]), "target": np.array([0, 1]), "probabilities": probabilities}
+
+    with pytest.raises(ValueError):
+        align_probabilities([first, second])
+
+
+def test_vote():
+    # Two models, three rows, two classes
+    probabilities = np.array([
+        [[0.9, 0.1], [0.4, 0.6], [0.6, 0.4]],
+        [[0.2, 0.8], [0.3, 0.7], [0.1, 0.9]],
+    ], dtype=np.float32)
+
+    assert np.array_equal(vote(probabilities, [2, 1], "hard"), [0, 1, 0])
+    assert np.array_equal(vote(probabilities, [1, 2], "hard"), [1, 1, 1])
+    assert np.array_equal(vote(probabilities, [1, 1], "soft"), [0, 1, 1])
+
+
+def test_optimise_weights():
+    rng = np.random.default_rng(0)
+    target = rng.integers(0, 2, 200)
+    accurate = np.eye(2, dtype=np.float32)[target] * 0.8 + 0.1
+    random = rng.random((200, 2)).astype(np.float32)
+    probabilities = np.stack([random, accurate])
+
+    weights, score = optimise_weights(probabilities, target, "accuracy_score", "soft")
+
+    assert weights.sum() == pytest.approx(1)
+    assert weights[1] > weights[0]
+    assert score == pytest.approx(1)
+
+
+def test_optimise_weights_rejects_unknown_metric():
+    with pytest.raises(ValueError):
+        optimise_weights(np.full((2, 4, 2), 0.5, dtype=np.float32), np.zeros(4, dtype=int), "log_loss")
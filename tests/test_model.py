@@ -0,0 +1,57 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from python.cache import get_current_directory, make_temporary_directory
+from python.model import MLModel
+
+
+@pytest.fixture
+def model():
+    rng = np.random.default_rng(0)
+    X = rng.random((60, 3))
+    model = MLModel("model", "random_forest", {"n_estimators": 5, "random_state": 0})
+    model.model.fit(X, (X[:, 0] > 0.5).astype(int))
+    return model, X
+
+
+def test_save_and_load(model, tmp_path):
+    model, X = model
+    path = str(tmp_path / "model")
+
+    model.save(path)
+    loaded = MLModel.load(path)
+
+    assert np.array_equal(loaded.model.predict(X), model.model.predict(X))
+    assert loaded.type == "random_forest"
+
+
+def test_concurrent_saves(model, tmp_path):
+    model, X = model
+    path = str(tmp_path / "model")
+    errors = []
+
+    def save():
+        try:
+            model.save(path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert np.array_equal(MLModel.load(path).model.predict(X), model.model.predict(X))
+    # No temporary directory is left next to the model
+    assert os.listdir(tmp_path) == ["model"]
+    assert os.path.dirname(get_current_directory(path)) == path
+
+
+def test_temporary_directories_are_unique(tmp_path):
+    path = str(tmp_path / "model")
+    assert make_temporary_directory(path) != make_temporary_directory(path)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from python.profiling import ReservoirSampler
+
+
+def _chunks(n_rows, chunk_size, labels):
+    for start in range(0, n_rows, chunk_size):
+        index = np.arange(start, min(start + chunk_size, n_rows))
+        yield pd.DataFrame({"row": index, "label": labels[index]}, index=index)
+
+
+def test_uniform_sample():
+    sampler = ReservoirSampler(100, random_state=0)
+    for chunk in _chunks(10000, 1000, np.zeros(10000, dtype=int)):
+        sampler.update(chunk)
+
+    sample = sampler.get_sample()
+    assert len(sample) == 100
+    assert sample["row"].is_unique
+    assert sample["row"].is_monotonic_increasing
+
+
+def test_small_stream_is_kept_whole():
+    sampler = ReservoirSampler(100, random_state=0)
+    sampler.update(pd.DataFrame({"row": np.arange(10), "label": np.zeros(10, dtype=int)}))
+
+    assert len(sampler.get_sample()) == 10
+
+
+def test_stratified_sample_keeps_rare_classes():
+    labels = np.zeros(10000, dtype=int)
+    labels[::500] = 1
+    sampler = ReservoirSampler(100, "label", random_state=0)
+    for chunk in _chunks(10000, 1000, labels):
+        sampler.update(chunk)
+
+    sample = sampler.get_sample()
+    assert len(sample) == 100
+    assert (sample["label"] == 1).sum() >= 1
+
+
+def test_stratified_reservoirs_are_bounded():
+    # The classes appear in turn, as in a file sorted on the label
+    labels = np.repeat(np.arange(10), 1000)
+    sampler = ReservoirSampler(100, "label", random_state=0)
+    for chunk in _chunks(10000, 500, labels):
+        sampler.update(chunk)
+        assert sum(len(rows) for rows, _ in sampler._reservoirs.values()) <= 2 * 100 + 10
+
+    sample = sampler.get_sample()
+    assert len(sample) == 100
+    assert sample["label"].value_counts().max() <= 11
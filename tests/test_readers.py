@@ -0,0 +1,149 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather
+import pyarrow.parquet
+import pytest
+
+from python import readers
+
+
+@pytest.fixture(autouse=True)
+def schema_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(readers, "SCHEMA_CACHE_DIR", str(tmp_path / "schemas"))
+    # Small blocks, so that files are streamed in many batches
+    monkeypatch.setattr(readers, "CSV_BLOCK_SIZE", 256)
+
+
+def _write_csv(path, rows):
+    path.write_text("\n".join(",".join(str(value) for value in row) for row in rows) + "\n")
+    return str(path)
+
+
+def _read_batches(path, columns=None):
+    table = pa.Table.from_batches(list(readers.iter_batches(path, columns)))
+    return table.to_pandas(types_mapper=readers.get_types_mapper())
+
+
+def test_streamed_csv_types_match_read_csv(tmp_path):
+    rows = [["target", "x", "late_decimal", "flag"]] + [[i % 2, i / 4, i, "true" if i % 3 else "false"] for i in range(300)]
+    rows[250][2] = 1.5
+    path = _write_csv(tmp_path / "data.csv", rows)
+
+    streamed = _read_batches(path)
+    readers.SCHEMA_CACHE_DIR += "-read"  # Infers the types again for the whole read
+    read = readers.read_csv(path)
+
+    assert streamed["target"].dtype == "int8"
+    assert streamed["target"].tolist()[:4] == [0, 1, 0, 1]
+    assert streamed["late_decimal"].dtype == "float32"
+    assert streamed.dtypes.to_dict() == read.dtypes.to_dict()
+    assert streamed.equals(read)
+
+
+def test_streamed_csv_with_late_word(tmp_path):
+    rows = [["x", "y"]] + [[i, i * 2] for i in range(300)]
+    rows[280][1] = "missing"
+    path = _write_csv(tmp_path / "data.csv", rows)
+
+    streamed = _read_batches(path)
+
+    assert streamed["x"].dtype == "int16"
+    assert streamed["y"].iloc[0] == "0"
+    assert streamed["y"].iloc[279] == "missing"
+
+
+def test_streamed_csv_uses_cached_schema(tmp_path, monkeypatch):
+    path = _write_csv(tmp_path / "data.csv", [["x", "y"]] + [[i, i / 2] for i in range(300)])
+    _read_batches(path, ["x"])
+
+    calls = []
+    infer_csv_schema = readers.infer_csv_schema
+    monkeypatch.setattr(readers, "infer_csv_schema", lambda *args: calls.append(args) or infer_csv_schema(*args))
+
+    assert _read_batches(path, ["x"])["x"].dtype == "int16"
+    assert calls == []
+    # Columns missing from the cached schema are inferred
+    assert _read_batches(path)["y"].dtype == "float32"
+    assert len(calls) == 1
+
+
+def _write_table(path, format_name):
+    table = pa.table({"id": list(range(10)), "x": [index / 2 for index in range(10)], "label": ["a", "b"] * 5})
+    if format_name == "parquet":
+        pyarrow.parquet.write_table(table, str(path), row_group_size=3)
+    else:
+        pyarrow.feather.write_feather(table, str(path))
+    return str(path)
+
+
+@pytest.mark.parametrize("name, format_name", [("data.parquet", "parquet"), ("data.pq", "parquet"), ("data.feather", "feather"),
+                                               ("data.arrow", "feather"), ("data.csv", "csv"), ("data.txt", "csv")])
+def test_get_format(name, format_name):
+    assert readers.get_format(name) == format_name
+
+
+@pytest.mark.parametrize("format_name", ["parquet", "feather"])
+def test_read_arrow_formats(tmp_path, format_name):
+    path = _write_table(tmp_path / ("data." + format_name), format_name)
+
+    data = readers.read_dataset(path, columns=["id", "label"], filters=[("id", ">=", 4), ("label", "==", "a")])
+
+    assert list(data.columns) == ["id", "label"]
+    assert data["id"].tolist() == [4, 6, 8]
+    # Strings stay in Arrow memory
+    assert isinstance(data["label"].dtype, pd.StringDtype)
+
+
+def test_read_dataset_with_disjunctive_filters(tmp_path):
+    path = _write_table(tmp_path / "data.parquet", "parquet")
+
+    data = readers.read_dataset(path, filters=[[("id", "<", 2)], [("id", "in", [8, 9])]])
+
+    assert data["id"].tolist() == [0, 1, 8, 9]
+
+
+def test_read_dataset_invalid_filter(tmp_path):
+    path = _write_table(tmp_path / "data.parquet", "parquet")
+
+    with pytest.raises(ValueError):
+        readers.read_dataset(path, filters=[("id", "~", 2)])
+
+
+def test_read_csv_downcasts_and_caches_schema(tmp_path, monkeypatch):
+    path = _write_csv(tmp_path / "data.csv", [["small", "large", "x", "word"]] + [[i, i * 100000, i / 3, "w"] for i in range(100)])
+
+    data = readers.read_csv(path)
+    assert data.dtypes.to_dict() == {"small": "int8", "large": "int32", "x": "float32", "word": pd.StringDtype("pyarrow")}
+    assert readers.load_schema(path) is not None
+
+    downcast_table = readers.downcast_table
+    calls = []
+    monkeypatch.setattr(readers, "downcast_table", lambda table: calls.append(table) or downcast_table(table))
+    pd.testing.assert_frame_equal(readers.read_csv(path), data)
+    # The second load parses straight into the cached types
+    assert calls == []
+
+
+def test_read_csv_with_stale_schema(tmp_path):
+    path = tmp_path / "data.csv"
+    _write_csv(path, [["x"]] + [[100 + i] for i in range(10)])
+    readers.read_csv(str(path))
+    schema_path = readers._get_schema_path(str(path))
+
+    # Rewritten in place, with the same size and modification time
+    stat = path.stat()
+    _write_csv(path, [["x"]] + [[f"{i}.5"] for i in range(10)])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert readers._get_schema_path(str(path)) == schema_path
+
+    assert readers.read_csv(str(path))["x"].dtype == "float32"
+
+
+def test_csv_column_names_are_made_unique(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("a,a,,a.1,b\n1,2,3,4,5\n")
+
+    assert readers.get_csv_column_names(str(path)) == list(pd.read_csv(path).columns)
+    assert list(readers.read_csv(str(path)).columns) == list(pd.read_csv(path).columns)
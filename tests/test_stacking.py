@@ -0,0 +1,17 @@
+from python.data import DataHandler
+from python.strategies.stacking import StackingStrategy
+
+
+def test_meta_learner_change_keeps_base_model_trainings():
+    strategy = StackingStrategy("stacking", "stacking", DataHandler())
+    strategy.model_handler.add_model("model", "random_forest", {})
+
+    params = strategy._seed_validation_params("holdout", {"test_size": 0.3})
+    key = strategy.model_handler.get_training_key("model", "data", "holdout", params)
+
+    strategy.add_model("meta_learner", "svm", {}, "Output")
+    params = strategy._seed_validation_params("holdout", {"test_size": 0.3})
+
+    assert strategy.meta_model_type == "svm"
+    assert key is not None
+    assert strategy.model_handler.get_training_key("model", "data", "holdout", params) == key
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from python.store import ColumnarStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ColumnarStore(str(tmp_path))
+
+
+def _frame(n_rows):
+    return pd.DataFrame({"x": np.arange(n_rows, dtype=np.float64), "y": np.arange(n_rows) % 3})
+
+
+def test_put_batches_compacts_to_one_batch(store):
+    data = _frame(100000)
+    batches = pa.Table.from_pandas(data, preserve_index=False).to_batches(max_chunksize=10000)
+
+    store.put_batches("key", iter(batches))
+
+    assert pa.ipc.open_file(store.get_path("key")).num_record_batches == 1
+    before = pa.total_allocated_bytes()
+    result = store.get("key")
+    # The numeric columns are views on the mapped file
+    assert pa.total_allocated_bytes() - before < data.memory_usage(index=False).sum() // 10
+    pd.testing.assert_frame_equal(result, data)
+
+
+def test_put_batches_without_rows(store):
+    with pytest.raises(ValueError):
+        store.put_batches("key", iter([]))
+    assert not store.contains("key")
+
+
+def test_put_and_get(store):
+    data = pd.DataFrame({"x": np.arange(10.), "label": ["a", "b"] * 5})
+
+    result = store.put("key", data)
+
+    assert store.contains("key")
+    pd.testing.assert_frame_equal(store.get("key"), result)
+    assert result["x"].tolist() == data["x"].tolist()
+    # Numeric columns are read-only views on the mapped file
+    assert store.get_resident_size(result) == 0
+    assert not result["x"].to_numpy().flags.writeable
+
+
+def test_missing_and_removed_entries(store):
+    with pytest.raises(KeyError):
+        store.get("missing")
+
+    store.put("key", _frame(10))
+    store.remove("key")
+    assert not store.contains("key")
+    store.remove("key")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    data = _frame(10000)
+    store = ColumnarStore(str(tmp_path), max_size=int(data.memory_usage(index=False).sum() * 2.5))
+
+    store.put("first", data)
+    store.put("second", data)
+    # Getting an entry marks it as recently used
+    os.utime(store.get_path("first"), (0, 0))
+    os.utime(store.get_path("second"), (0, 0))
+    store.get("first")
+    store.put("third", data)
+
+    assert [store.contains(key) for key in ["first", "second", "third"]] == [True, False, True]
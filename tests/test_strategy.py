@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from python.data import DataHandler
+from python.strategies import late_fusion
+from python.strategy import StrategyHandler
+
+
+@pytest.fixture
+def handler(tmp_path):
+    handler = StrategyHandler(str(tmp_path))
+    handler.add_strategy("late_fusion", "late_fusion", DataHandler())
+    strategy = handler.strategies["late_fusion"]
+    strategy._data_model_map = {"x": "model_x", "y": "model_y"}
+
+    rng = np.random.default_rng(0)
+    target = np.arange(60) % 2
+    # The first model predicts the target, the second one is noise
+    first = np.stack([1 - target, target], axis=1) * 0.8 + 0.1
+    strategy._oof_target = target
+    strategy.oof_probabilities = np.stack([first, rng.random((60, 2))]).astype(np.float32)
+    return handler
+
+
+def test_optimise_strategy_weights_outside_lock(handler, monkeypatch):
+    locked = []
+    optimise_weights = late_fusion.optimise_weights
+
+    def search(*args, **kwargs):
+        locked.append(handler._lock.locked())
+        return optimise_weights(*args, **kwargs)
+
+    monkeypatch.setattr(late_fusion, "optimise_weights", search)
+    results = handler.optimise_strategy_weights("late_fusion", voting_type="soft", apply=True)
+
+    assert locked == [False]
+    assert results["weights"][0] > results["weights"][1]
+    strategy = handler.strategies["late_fusion"]
+    assert strategy.voting_weights == results["weights"]
+    assert strategy.voting_type == "soft"
+
+
+def test_optimise_strategy_weights_retrained_during_search(handler, monkeypatch):
+    strategy = handler.strategies["late_fusion"]
+    optimise_weights = late_fusion.optimise_weights
+
+    def search(probabilities, *args, **kwargs):
+        # A training finishing during the search replaces the predictions
+        strategy.oof_probabilities = probabilities.copy()
+        return optimise_weights(probabilities, *args, **kwargs)
+
+    monkeypatch.setattr(late_fusion, "optimise_weights", search)
+    with pytest.raises(Exception, match="changed"):
+        handler.optimise_strategy_weights("late_fusion", apply=True)
+    assert strategy.voting_weights is None
+
+
+@pytest.fixture
+def unimodal(tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({
+        "id": np.arange(10) * 10,
+        "x": np.arange(10.),
+        "target": np.where(np.arange(10) < 5, "low", "high"),
+    }).to_csv(path, index=False)
+    data_handler = DataHandler()
+    data_handler.add_dataset("data", str(path), "target", id_column="id")
+
+    handler = StrategyHandler(str(tmp_path / "strategies"))
+    handler.add_strategy("unimodal", "unimodal", data_handler)
+    handler.add_model("unimodal", "model", "random_forest", {"random_state": 0}, "data")
+    strategy = handler.strategies["unimodal"]
+    # MLModel.train needs a tracking server, the final model is fitted directly
+    dataset = data_handler.datasets["data"]
+    y, labels = dataset.get_encoded_target()
+    strategy.model_handler.models["model"].model.fit(dataset.get_data(drop_target=True), y)
+    strategy._set_inputs(["data"], labels)
+    return handler
+
+
+def test_predict_strategy_in_chunks(unimodal):
+    chunks = list(unimodal.predict_strategy("unimodal", datasets="data", chunk_size=4, with_probability=True))
+
+    assert [len(chunk["ids"]) for chunk in chunks] == [4, 4, 2]
+    assert sum((chunk["ids"] for chunk in chunks), []) == list(range(0, 100, 10))
+    assert sum((chunk["predictions"] for chunk in chunks), []) == ["low"] * 5 + ["high"] * 5
+    assert all(np.array(chunk["probabilities"]).shape == (len(chunk["ids"]), 2) for chunk in chunks)
+    assert unimodal._readers["unimodal"] == 0
+
+
+def test_predict_strategy_records(unimodal):
+    rows = [{"id": 7, "x": 8.5, "target": "ignored"}, {"id": 3, "x": 0.5}]
+    chunks = list(unimodal.predict_strategy("unimodal", rows=rows))
+
+    assert chunks == [{"ids": [7, 3], "predictions": ["high", "low"]}]
+
+
+def test_predict_strategy_invalid_inputs(unimodal):
+    with pytest.raises(ValueError, match="Missing features"):
+        unimodal.predict_strategy("unimodal", rows=[{"id": 1}])
+    with pytest.raises(KeyError):
+        unimodal.predict_strategy("unimodal", datasets="missing")
+
+    unimodal.add_strategy("untrained", "unimodal", DataHandler())
+    with pytest.raises(Exception, match="must be trained"):
+        unimodal.predict_strategy("untrained", rows=[])
+
+
+def test_streamed_strategy_cannot_be_changed(unimodal):
+    chunks = unimodal.predict_strategy("unimodal", datasets="data", chunk_size=4)
+    next(chunks)
+
+    with pytest.raises(Exception):
+        unimodal.remove_strategy("unimodal")
+    chunks.close()
+    unimodal.remove_strategy("unimodal")
+    assert "unimodal" not in unimodal.strategies